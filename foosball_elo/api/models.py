@@ -13,3 +13,10 @@ class GameResource(ModelResource):
     class Meta:
         queryset = Game.objects.all()
         resource_name = 'games'
+        excludes = ['signature']
+        
+    def wrap_view(self, view):
+        # Lets ReplicaRoutingMiddleware serve the (read-only) api from the replica.
+        wrapper = super().wrap_view(view)
+        wrapper.replica_reads = True
+        return wrapper
@@ -1,3 +1,217 @@
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from elo.models import League, PairStats, PlayerRating, RatingInterval, default_league_id
+from elo.analytics import week_start
+from elo.history import leaderboard_as_of
+from elo.seasons import close_season
+from elo.tests import create_player, create_game, login_user
+from elo.views import apply_rating_updates
+
+import datetime
+
+
+class AsyncGameListTest(TestCase):
+    
+    def setUp(self):
+        players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        for days_ago in range(5):
+            create_game(1 + days_ago%2, *players, date=timezone.now().date() - datetime.timedelta(days=days_ago))
+    
+    def test_matches_game_resource(self):
+        response = self.client.get(reverse('api:game_list'))
+        resource_response = self.client.get('/api/games/', {'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['objects'], resource_response.json()['objects'])
+        self.assertEqual(response.json()['meta']['total_count'], 5)
+        
+    def test_paging(self):
+        response = self.client.get(reverse('api:game_list'), {'limit': 2, 'offset': 2})
+        resource_response = self.client.get('/api/games/', {'format': 'json', 'limit': 2, 'offset': 2})
+        self.assertEqual(response.json()['objects'], resource_response.json()['objects'])
+        self.assertEqual(len(response.json()['objects']), 2)
+        self.assertIsNotNone(response.json()['meta']['next'])
+        self.assertIsNotNone(response.json()['meta']['previous'])
+        
+    def test_invalid_paging(self):
+        response = self.client.get(reverse('api:game_list'), {'limit': 'many'})
+        self.assertEqual(response.status_code, 400)
+        
+        
+class LeaderboardApiTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        for player in self.players[:2]:
+            PlayerRating.objects.create(player=player, timestamp=timezone.now().date() - datetime.timedelta(days=1), rating=600)
+        
+    def test_leaderboard(self):
+        response = self.client.get(reverse('api:leaderboard'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.json()['objects']], ['player0', 'player1', 'player3', 'player2'])
+        
+    def test_leaderboard_as_of_date(self):
+        date = timezone.now().date() - datetime.timedelta(days=1)
+        response = self.client.get(reverse('api:leaderboard'), {'date': date.isoformat()})
+        self.assertEqual([row['name'] for row in response.json()['objects']], ['player3', 'player2', 'player1', 'player0'])
+        
+    def test_leaderboard_of_league(self):
+        league = League.objects.create(name='Other office', slug='other')
+        create_player(name='other0', league=league)
+        response = self.client.get(reverse('api:leaderboard'), {'league': 'other'})
+        self.assertEqual([row['name'] for row in response.json()['objects']], ['other0'])
+        self.assertEqual(self.client.get(reverse('api:leaderboard'), {'league': 'missing'}).status_code, 404)
+        
+    def test_movers(self):
+        date = timezone.now().date() - datetime.timedelta(days=1)
+        response = self.client.get(reverse('api:leaderboard_movers'), {'from': date.isoformat()})
+        movers = response.json()['objects']
+        self.assertEqual([mover['name'] for mover in movers[:2]], ['player0', 'player1'])
+        self.assertEqual(movers[0]['rating_change'], 300)
+        
+    def test_movers_bad_request(self):
+        response = self.client.get(reverse('api:leaderboard_movers'))
+        self.assertEqual(response.status_code, 400)
+        
+        
+class PlayerSearchApiTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=name) for name in ['bob', 'Bea', 'bill', 'Anna', 'ben', 'carl']]
+        
+    def search(self, **params) -> list[str]:
+        return [row['name'] for row in self.client.get(reverse('api:player_search'), params).json()['objects']]
+        
+    def test_prefix_search(self):
+        self.assertEqual(self.search(q='b'), ['Bea', 'ben', 'bill', 'bob'])
+        self.assertEqual(self.search(q='BI'), ['bill'])
+        self.assertEqual(self.search(q='b', limit=2), ['Bea', 'ben'])
+        self.assertEqual(self.search(q='%'), [])
+        self.assertEqual(len(self.search()), 6)
+        self.assertEqual(self.client.get(reverse('api:player_search'), {'limit': 0}).status_code, 400)
+        
+    def test_recent_partners_first(self):
+        bob, bea, bill, anna, ben, carl = self.players
+        create_game(1, carl, anna, bob, ben, date=timezone.now().date() - datetime.timedelta(days=1))
+        create_game(1, carl, bill, anna, anna)
+        login_user(self.client, carl.user)
+        self.assertEqual(self.search(), ['carl', 'bill', 'Anna', 'bob', 'ben', 'Bea'])
+        self.assertEqual(self.search(q='b'), ['bill', 'bob', 'ben', 'Bea'])
+        # The recent partners are cached until the league changes, so only the session, the user, their league,
+        # their player and the searches are read.
+        with self.assertNumQueries(6):
+            self.search(q='b')
+        create_game(1, carl, bea, bob, ben)
+        self.assertEqual(self.search(q='b'), ['Bea', 'bob', 'ben', 'bill'])
+        
+
+class PlayerPairsApiTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        create_game(1, *self.players)
+        create_game(2, self.players[0], self.players[2], self.players[1], self.players[3])
+        
+    def test_pairs(self):
+        response = self.client.get(reverse('api:player_pairs', args=(self.players[0].id,)), {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['name'] for row in response.json()['partners']], ['player1', 'player2'])
+        self.assertEqual(response.json()['partners'][0]['wins'], 1)
+        self.assertEqual({row['name'] for row in response.json()['nemeses']}, {'player1', 'player3'})
+        self.assertEqual(response.json()['nemeses'][0]['games'], 2)
+        
+    def test_unknown_player(self):
+        response = self.client.get(reverse('api:player_pairs', args=(1000,)))
+        self.assertEqual(response.status_code, 404)
+        
+    def test_pairs_of_season(self):
+        apply_rating_updates(timezone.now().date())
+        season = close_season(default_league_id(), '2025', timezone.now().date())
+        create_game(1, self.players[0], self.players[3], self.players[1], self.players[2], 
+                    date=timezone.now().date() + datetime.timedelta(days=1))
+        response = self.client.get(reverse('api:player_pairs', args=(self.players[0].id,)), {'season': season.id})
+        self.assertEqual([row['name'] for row in response.json()['partners']], ['player1', 'player2'])
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('api:player_pairs', args=(self.players[0].id,)), 
+                                         {'season': season.id+1}).status_code, 404)
+        
+        response = self.client.get(reverse('api:season', args=(season.id,)))
+        self.assertEqual([row['name'] for row in response.json()['standings']], 
+                         [row['name'] for row in leaderboard_as_of(timezone.now().date() + datetime.timedelta(days=1))])
+        self.assertEqual(response.json()['standings'][0]['games'], 2)
+
+        
+
+
+class PlayerComparisonApiTest(TestCase):
+    
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        PlayerRating.objects.create(player=self.players[0], timestamp=self.today - datetime.timedelta(weeks=3), rating=250)
+        create_game(1, *self.players)
+        apply_rating_updates(self.today)
+        
+    def compare(self, players : list, **params):
+        return self.client.get(reverse('api:player_comparison'), {'players': ','.join(str(player.id) for player in players), **params})
+        
+    def test_comparison(self):
+        p = self.players
+        # The players, their ratings and their pair stats.
+        with self.assertNumQueries(3):
+            response = self.compare([p[1], p[0]])
+        week = week_start(self.today)
+        self.assertEqual(response.json()['weeks'], [(week - datetime.timedelta(weeks=weeks)).isoformat() for weeks in [3, 2, 1, 0]])
+        self.assertEqual([(row['name'], row['ratings']) for row in response.json()['players']],
+                         [('player1', [None, None, 350, p[1].get_rating()]), ('player0', [250, 250, 300, p[0].get_rating()])])
+        self.assertEqual(response.json()['head_to_head'], [{
+            'player': p[0].id, 'other_player': p[1].id, 'relation': 'teammate', 'games': 1, 'wins': 1, 'losses': 0,
+            'eggs_dealt': 1, 'eggs_collected': 0, 'rating_exchanged': PairStats.objects.get(player=p[0], other_player=p[1]).rating_exchanged,
+        }])
+        
+        # Downsampled, keeping the latest week.
+        response = self.compare([p[0], p[2], p[3]], points=2)
+        self.assertEqual(response.json()['weeks'], [(week - datetime.timedelta(weeks=weeks)).isoformat() for weeks in [2, 0]])
+        self.assertEqual(len(response.json()['head_to_head']), 3)
+        response = self.compare([p[0], p[1]], since=self.today.isoformat())
+        self.assertEqual(response.json()['players'][1]['ratings'], [p[1].get_rating()])
+        
+    def test_invalid_comparisons(self):
+        p = self.players
+        for players, params in [([p[0]], {}), ([p[0], p[0]], {}), (p * 2, {}), (p[:2], {'points': 0}), (p[:2], {'since': 'x'})]:
+            self.assertEqual(self.compare(players, **params).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api:player_comparison'), {'players': '1,x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api:player_comparison'), {'players': '{},1000'.format(p[0].id)}).status_code, 404)
+
+        
+class RatingIntervalsApiTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(2)]
+        for player, (lower, upper) in zip(self.players, [(280, 330), (320, 390)]):
+            RatingInterval.objects.create(player=player, rating=player.playerrating_set.get().rating, lower=lower, upper=upper,
+                                          games=3, confidence=.95, replicates=200, computed_at=timezone.now())
+        
+    def test_intervals(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api:rating_intervals'))
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()['objects']
+        self.assertEqual([row['name'] for row in rows], ['player1', 'player0'])
+        self.assertEqual((rows[0]['lower'], rows[0]['upper']), (320, 390))
+
+
+class AnalyticsApiTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        create_game(1, *self.players)
+        
+    def test_dashboard_is_cached_until_league_changes(self):
+        response = self.client.get(reverse('api:analytics'))
+        self.assertEqual(response.json()['games'], [1])
+        with self.assertNumQueries(0):
+            self.client.get(reverse('api:analytics'))
+        create_game(2, *self.players)
+        self.assertEqual(self.client.get(reverse('api:analytics')).json()['games'], [2])
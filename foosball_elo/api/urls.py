@@ -0,0 +1,17 @@
+from django.urls import path
+from . import views
+
+app_name='api'
+urlpatterns = [
+    path('async/games/', views.game_list, name='game_list'),
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('leaderboard/movers/', views.leaderboard_movers, name='leaderboard_movers'),
+    path('players/search/', views.player_search, name='player_search'),
+    path('players/compare/', views.player_comparison, name='player_comparison'),
+    path('players/<int:pk>/pairs/', views.player_pairs, name='player_pairs'),
+    path('seasons/<int:pk>/', views.season, name='season'),
+    path('matchmaking/', views.matchmaking, name='matchmaking'),
+    path('season/top5/', views.top_5_probabilities, name='top_5_probabilities'),
+    path('rating_intervals/', views.rating_intervals, name='rating_intervals'),
+    path('analytics/', views.analytics, name='analytics'),
+]
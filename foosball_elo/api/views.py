@@ -1,3 +1,256 @@
-from django.shortcuts import render
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpRequest, JsonResponse, HttpResponseBadRequest
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.cache import cache_control
 
-# Create your views here.
+from foosball_elo.middleware import replica_reads
+from elo.models import Player, Game, PairStats, RatingInterval, Season
+from elo.views import (PLAYER_POSITIONS, PLAYER_SEARCH_LIMIT, with_current_rating, get_date_param, get_request_league_id, 
+                       search_players, get_recent_partner_ids)
+from elo.history import SEASON_ARCHIVE_MAX_AGE, leaderboard_as_of, movers_between, get_season_archive
+from elo.pairs import PAIR_STATS_FIELDS, top_partners, top_nemeses
+from elo.matchmaking import propose_matches
+from elo.simulation import get_top_n_probabilities, start_season_simulation
+from elo.analytics import get_dashboard
+from elo.comparison import MIN_COMPARED_PLAYERS, MAX_COMPARED_PLAYERS, DEFAULT_COMPARISON_POINTS, compare_players
+from elo.async_views import alist
+
+import asyncio
+
+
+MAX_MATCHMAKING_POOL = 20
+MAX_PLAYER_SEARCH_LIMIT = 50
+# Ten years of weeks.
+MAX_COMPARISON_POINTS = 520
+
+# Endpoints about a league are about the one given by the league parameter, see elo.views.get_request_league_id.
+
+
+def page_uri(request : HttpRequest, limit : int, offset : int) -> str:
+    params = request.GET.copy()
+    params['limit'] = limit
+    params['offset'] = offset
+    return request.path + '?' + params.urlencode()
+
+def serialize_game(game : Game, ratings : dict[int, int]) -> dict:
+    # Same fields as GameResource.
+    return {
+        'date_played': game.date_played.isoformat(),
+        'id': game.id,
+        'rating_diff': game.get_rating_diff_abs(ratings),
+        'resource_uri': reverse('api_dispatch_detail', kwargs={'resource_name': 'games', 'pk': game.id}),
+        'team_1_attack': game.team_1_attack.player_name,
+        'team_1_defense': game.team_1_defense.player_name,
+        'team_1_score': game.team_1_score,
+        'team_2_attack': game.team_2_attack.player_name,
+        'team_2_defense': game.team_2_defense.player_name,
+        'team_2_score': game.team_2_score,
+        'updates_performed': game.updates_performed,
+    }
+
+def serialize_pair_stats(pair_stats : PairStats) -> dict:
+    out = {'id': pair_stats.other_player_id, 'name': pair_stats.other_player.player_name}
+    out.update({field: getattr(pair_stats, field) for field in PAIR_STATS_FIELDS})
+    return out
+
+
+@replica_reads
+async def game_list(request : HttpRequest):
+    """ Async counterpart of GameResource's list endpoint, with the same output and paging parameters,
+        for the games of one league.
+    """
+    try:
+        limit = int(request.GET.get('limit', 20))
+        offset = int(request.GET.get('offset', 0))
+        if limit < 0 or offset < 0:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest("limit and offset must be non-negative integers.")
+    
+    league_id = await sync_to_async(get_request_league_id)(request)
+    games = Game.objects.filter(league_id=league_id).select_related(*PLAYER_POSITIONS)
+    total_count, page, players = await asyncio.gather(
+        games.acount(),
+        alist(games[offset:offset+limit] if limit > 0 else games[offset:]),
+        alist(with_current_rating(Player.objects.filter(league_id=league_id)))
+    )
+    ratings = {player.id: player.current_rating for player in players}
+    
+    next_offset = offset + limit
+    return JsonResponse({
+        'meta': {
+            'limit': limit,
+            'next': page_uri(request, limit, next_offset) if limit > 0 and next_offset < total_count else None,
+            'offset': offset,
+            'previous': page_uri(request, limit, max(offset - limit, 0)) if limit > 0 and offset > 0 else None,
+            'total_count': total_count,
+        },
+        'objects': [serialize_game(game, ratings) for game in page],
+    })
+
+@replica_reads
+def leaderboard(request : HttpRequest):
+    """ The ranking as of the date given by the date parameter, today by default.
+    """
+    try:
+        date = get_date_param(request.GET, 'date', timezone.now().date())
+    except ValueError:
+        return HttpResponseBadRequest("date must be given as YYYY-MM-DD.")
+    return JsonResponse({'date': date.isoformat(), 'objects': leaderboard_as_of(date, get_request_league_id(request))})
+
+@replica_reads
+def leaderboard_movers(request : HttpRequest):
+    """ The rating and position changes of every player from the date given by the from parameter
+        to the date given by the to parameter (today by default), biggest rating change first.
+    """
+    try:
+        from_date = get_date_param(request.GET, 'from')
+        to_date = get_date_param(request.GET, 'to', timezone.now().date())
+        if from_date == None:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest("Please provide from (and optionally to) as YYYY-MM-DD.")
+    return JsonResponse({'from': from_date.isoformat(), 
+                         'to': to_date.isoformat(), 
+                         'objects': movers_between(from_date, to_date, get_request_league_id(request))})
+
+@replica_reads
+def player_search(request : HttpRequest):
+    """ The players of the league whose names start with the q parameter, ignoring case, for autocompleting
+        player names. The signed in player and the players they recently played with come first.
+    """
+    try:
+        limit = int(request.GET.get('limit', PLAYER_SEARCH_LIMIT))
+        if not 0 < limit <= MAX_PLAYER_SEARCH_LIMIT:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest("limit must be between 1 and {}.".format(MAX_PLAYER_SEARCH_LIMIT))
+    league_id = get_request_league_id(request)
+    first_ids = []
+    if request.user.is_authenticated:
+        player = Player.objects.filter(user=request.user, league_id=league_id).first()
+        if player is not None:
+            first_ids = [player.id] + get_recent_partner_ids(player)
+    players = search_players(request.GET.get('q', ''), league_id, first_ids, limit)
+    return JsonResponse({'objects': [{'id': player.id, 'name': player.player_name} for player in players]})
+
+@replica_reads
+def player_comparison(request : HttpRequest):
+    """ The weekly ratings of the players whose ids are given by the comma separated players parameter, on a
+        common grid of no more than the number of weeks given by the points parameter, and their head-to-head
+        and partnership stats. If the since parameter is given, the ratings start from that date's week.
+    """
+    try:
+        player_ids = [int(player_id) for player_id in request.GET.get('players', '').split(',')]
+        points = int(request.GET.get('points', DEFAULT_COMPARISON_POINTS))
+        since = get_date_param(request.GET, 'since')
+        if not MIN_COMPARED_PLAYERS <= len(set(player_ids)) == len(player_ids) <= MAX_COMPARED_PLAYERS:
+            raise ValueError
+        if not 0 < points <= MAX_COMPARISON_POINTS:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest("players must be {} to {} distinct player ids, points between 1 and {}, and since "
+                                      "a date given as YYYY-MM-DD.".format(MIN_COMPARED_PLAYERS, MAX_COMPARED_PLAYERS, 
+                                                                           MAX_COMPARISON_POINTS))
+    players = Player.objects.in_bulk(player_ids)
+    if len(players) < len(player_ids):
+        raise Http404("No player found matching the query")
+    return JsonResponse(compare_players([players[player_id] for player_id in player_ids], points, since))
+
+@replica_reads
+def player_pairs(request : HttpRequest, pk : int):
+    """ The teammates a player has won the most games with, and the opponents they have lost the most games against.
+        The number of each is given by the limit parameter. If the season parameter gives the id of a closed season,
+        only the games of that season count.
+    """
+    try:
+        limit = int(request.GET.get('limit', 5))
+        season_id = int(request.GET['season']) if request.GET.get('season') else None
+        if limit <= 0:
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest("limit must be a positive integer, and season the id of a season.")
+    if not Player.objects.filter(pk=pk).exists():
+        raise Http404("No player found matching the query")
+    if season_id is not None and not Season.objects.filter(pk=season_id).exists():
+        raise Http404("No season found matching the query")
+    response = JsonResponse({
+        'partners': [serialize_pair_stats(pair_stats) for pair_stats in top_partners(pk, limit, season_id)],
+        'nemeses': [serialize_pair_stats(pair_stats) for pair_stats in top_nemeses(pk, limit, season_id)],
+    })
+    if season_id is not None:
+        # Closed seasons never change.
+        patch_cache_control(response, public=True, max_age=SEASON_ARCHIVE_MAX_AGE, immutable=True)
+    return response
+
+@replica_reads
+@cache_control(public=True, max_age=SEASON_ARCHIVE_MAX_AGE, immutable=True)
+def season(request : HttpRequest, pk : int):
+    """ The final standings of a closed season, with every player's statistics from its games.
+    """
+    try:
+        return JsonResponse(get_season_archive(pk))
+    except Season.DoesNotExist:
+        raise Http404("No season found matching the query")
+
+@replica_reads
+def matchmaking(request : HttpRequest):
+    """ The fairest matches among the players given by the comma separated ids in the players parameter.
+        k is the number of matches, and roles=1 prefers matches where players play their usual role.
+    """
+    try:
+        player_ids = [int(player_id) for player_id in request.GET['players'].split(',')]
+        k = int(request.GET.get('k', 5))
+        if not 4 <= len(set(player_ids)) == len(player_ids) <= MAX_MATCHMAKING_POOL or k <= 0:
+            raise ValueError
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Please provide between 4 and {} distinct player ids, and a positive k."
+                                      .format(MAX_MATCHMAKING_POOL))
+    try:
+        return JsonResponse(propose_matches(player_ids, k, respect_roles=request.GET.get('roles') == '1',
+                                            league_id=get_request_league_id(request)))
+    except Player.DoesNotExist:
+        raise Http404("No player found matching the query")
+
+@replica_reads
+def top_5_probabilities(request : HttpRequest):
+    """ Each player's probability of finishing the season in the top 5, from simulating the rest of the season.
+        If the simulate_season command hasn't simulated the current league version, the simulation is started
+        in the background and 202 is returned until it is done.
+    """
+    today = timezone.now().date()
+    league_id = get_request_league_id(request)
+    result = get_top_n_probabilities(today, compute=False, league_id=league_id)
+    if result is None:
+        start_season_simulation(today, league_id)
+        response = JsonResponse({'status': 'simulating'}, status=202)
+        response['Retry-After'] = '5'
+        return response
+    return JsonResponse(result)
+
+@replica_reads
+def rating_intervals(request : HttpRequest):
+    """ The stored bootstrap confidence interval of every player's rating, highest rating first.
+    """
+    intervals = RatingInterval.objects.filter(player__league_id=get_request_league_id(request)) \
+                                      .select_related('player') \
+                                      .order_by('-rating', 'player__player_name')
+    return JsonResponse({'objects': [{
+        'id': interval.player_id,
+        'name': interval.player.player_name,
+        'rating': interval.rating,
+        'lower': interval.lower,
+        'upper': interval.upper,
+        'games': interval.games,
+        'confidence': interval.confidence,
+        'computed_at': interval.computed_at.isoformat(),
+    } for interval in intervals]})
+
+@replica_reads
+def analytics(request : HttpRequest):
+    """ Every series of the analytics dashboard of the league, read from its weekly rollups (see elo.analytics),
+        and cached until the league changes.
+    """
+    return JsonResponse(get_dashboard(get_request_league_id(request)))
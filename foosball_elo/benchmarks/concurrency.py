@@ -0,0 +1,71 @@
+"""
+Load test comparing the sync (WSGI) and async (ASGI) versions of the read views.
+
+Populate a database, e.g. with `python manage.py generate_league`, and serve
+the app with a WSGI and an ASGI server side by side:
+
+    gunicorn foosball_elo.wsgi -b 127.0.0.1:8001 -w 4 --threads 8
+    uvicorn foosball_elo.asgi:application --port 8002 --workers 4
+
+then run
+
+    python benchmarks/concurrency.py --concurrency 200 --requests 2000 \
+        http://127.0.0.1:8001/elo/ http://127.0.0.1:8002/elo/async/
+
+Each url gets the given number of requests, with at most --concurrency of them
+in flight at a time. Only the standard library is used.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+from urllib.error import URLError
+
+import argparse
+import statistics
+import time
+
+
+def timed_get(url : str) -> tuple[float, bool]:
+    start = time.perf_counter()
+    try:
+        with urlopen(url, timeout=60) as response:
+            response.read()
+            ok = response.status == 200
+    except (URLError, OSError):
+        ok = False
+    return time.perf_counter() - start, ok
+
+def benchmark(url : str, request_count : int, concurrency : int) -> dict[str, float]:
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(timed_get, [url] * request_count))
+        elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, ok in results if ok)
+    if len(latencies) < 2:
+        return {'requests/s': 0, 'failed': request_count - len(latencies)}
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        'requests/s': len(latencies) / elapsed,
+        'p50 ms': 1000 * percentiles[49],
+        'p95 ms': 1000 * percentiles[94],
+        'p99 ms': 1000 * percentiles[98],
+        'failed': request_count - len(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('urls', nargs='+')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+
+    for url in args.urls:
+        # Warm up connections and caches before measuring.
+        benchmark(url, min(args.concurrency, args.requests), args.concurrency)
+        result = benchmark(url, args.requests, args.concurrency)
+        print(url)
+        for key, value in result.items():
+            print("    {:<12}{:>10.1f}".format(key, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Measures what storing only the ratings that change saves, in rows and in the
+time it takes to read every player's rating history.
+
+Populate a database, e.g. with `python manage.py generate_league`, and run
+
+    python benchmarks/rating_storage.py --dates 50
+
+from the directory of manage.py. The history is first expanded to a rating
+per player per update, as rating updates stored it before compaction, then
+compacted again with the compact_ratings command's code, and the reads are
+timed on both. The ratings read are checked to be identical. The database is
+left compacted, and its caches invalidated.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foosball_elo.settings')
+
+import django
+django.setup()
+
+from django.db import transaction
+
+from elo.models import League, Player, PlayerRating, RatingUpdate
+from elo.caching import bump_league_version, bump_history_version
+from elo.compaction import compact_ratings
+from elo.views import get_rating_history
+
+
+def read_ratings(players : list[Player], dates : list) -> tuple[float, list]:
+    """ Reads every player's chart and their rating at dates, like the player pages do. Returns the time it
+        took, and what was read.
+    """
+    start = time.perf_counter()
+    read = []
+    for player in players:
+        history = get_rating_history(player)
+        read.append(([(r.timestamp, r.rating) for r in history], [player.get_rating(date) for date in dates]))
+    return time.perf_counter() - start, read
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dates', type=int, default=50, help="Number of random dates to read every player's rating at.")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    players = list(Player.objects.all())
+    update_dates = list(RatingUpdate.objects.values_list('timestamp', flat=True))
+    if not players or not update_dates:
+        sys.exit("The database has no rating updates to measure.")
+    rng = random.Random(args.seed)
+    dates = sorted(rng.choice(update_dates) for _ in range(args.dates))
+
+    with transaction.atomic():
+        stored = {(r.player_id, r.timestamp) for r in PlayerRating.objects.only('player_id', 'timestamp')}
+        PlayerRating.objects.bulk_create([PlayerRating(player_id=r.player_id, timestamp=r.timestamp, rating=r.rating)
+                                          for player in players for r in get_rating_history(player)
+                                          if (r.player_id, r.timestamp) not in stored])
+    results = {}
+    for storage in ['every update', 'changes only']:
+        if storage == 'changes only':
+            with transaction.atomic():
+                compact_ratings()
+        elapsed, read = read_ratings(players, dates)
+        results[storage] = (PlayerRating.objects.count(), elapsed, read)
+    for league_id in League.objects.values_list('id', flat=True):
+        bump_league_version(league_id)
+        bump_history_version(league_id)
+
+    if results['every update'][2] != results['changes only'][2]:
+        sys.exit("The ratings read differ between the storages.")
+    print("{} players, {} rating updates, ratings read at {} dates".format(len(players), len(update_dates), len(dates)))
+    for storage, (row_count, elapsed, _) in results.items():
+        print("    {:<14}{:>10} rows {:>10.1f} ms".format(storage, row_count, 1000 * elapsed))
+
+
+if __name__ == '__main__':
+    main()
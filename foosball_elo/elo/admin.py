@@ -1,29 +1,108 @@
-from django.contrib import admin
-from .models import Game, Player, PlayerRating
+from django import forms
+from django.contrib import admin, messages
+from django.utils import timezone
+from .models import League, Game, Player, PlayerRating, PLAYER_POSITIONS, default_league_id
+from .views import PENDING_GAME_RELATIONS, ClosedSeasonError, revert_games
 
 admin.site.site_header="Elo Administration"
 
+# The changelists below join what they show in their own query, search by name prefix and never
+# list every player, so they stay quick however many games and ratings there are.
+
+def revert_selected_games(modeladmin : admin.ModelAdmin, request, queryset, pending : bool, done : str):
+    try:
+        player_count = revert_games(queryset, timezone.now().date(), pending)
+    except ClosedSeasonError as e:
+        modeladmin.message_user(request, str(e), messages.ERROR)
+        return
+    modeladmin.message_user(request, done.format(player_count), messages.SUCCESS)
+
+@admin.action(description="Recompute the ratings of the selected games at the next rating update")
+def recompute_ratings(modeladmin, request, queryset):
+    revert_selected_games(modeladmin, request, queryset, True,
+                          "Took back the rating changes of the games for {} players. The next rating update rates them again.")
+
+@admin.action(description="Void the ratings of the selected games")
+def void_ratings(modeladmin, request, queryset):
+    revert_selected_games(modeladmin, request, queryset, False,
+                          "Took back the rating changes of the games for {} players. No rating update will use them.")
+
+
+class LeagueAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'id')
+    prepopulated_fields = {'slug': ('name',)}
+
 class PlayerAdmin(admin.ModelAdmin):
-    list_display = ('player_name', 'id')
-    search_fields = ('player_name',)
+    list_display = ('player_name', 'id', 'league')
+    list_select_related = ('league',)
+    # Also what the autocomplete widgets of the other admins search.
+    search_fields = ('^player_name',)
+    list_filter = ('league',)
+    
+    def get_search_results(self, request, queryset, search_term):
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        # The players of a game are only looked up in the league picked on its form, see GameAdminForm.
+        league_id = request.GET.get('league')
+        if request.GET.get('model_name') == 'game' and league_id:
+            queryset = queryset.filter(league_id=league_id if league_id.isdigit() else None)
+        return queryset, may_have_duplicates
+    
+class GameAdminForm(forms.ModelForm):
+    # Not saved, as a game is in the league of its players. The player autocompletes only offer
+    # the players of this league (see elo/static/elo/admin/game_form.js).
+    player_league = forms.ModelChoiceField(League.objects.all(), label="League",
+                                           help_text="The league the players are picked from.")
+    
+    class Meta:
+        model = Game
+        fields = '__all__'
+        
+    class Media:
+        js = ['admin/js/autocomplete.js', 'elo/admin/game_form.js']
+        
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['player_league'].initial = self.instance.league_id if self.instance.pk else default_league_id()
+        
+    def clean(self):
+        cleaned_data = super().clean()
+        league = cleaned_data.get('player_league')
+        players = [cleaned_data[position] for position in PLAYER_POSITIONS if cleaned_data.get(position) is not None]
+        if league is not None and any(player.league_id != league.id for player in players):
+            raise forms.ValidationError("All players must be in the league {}.".format(league))
+        return cleaned_data
     
 class GameAdmin(admin.ModelAdmin):
+    form = GameAdminForm
     fieldsets = [
-        ('Players', {'fields': ('team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack')}),
+        ('Players', {'fields': ('player_league', 'team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack')}),
          ('Data', {'fields': ('team_1_score', 'team_2_score', 'date_played')}),
          ('Status', {'fields': ('updates_performed',)})
     ]
     list_display = ['date_played', 'team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack', 'updates_performed', 'submitted_by']
-    search_fields = ['team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack']
-    list_filter = ['date_played']
+    list_select_related = PENDING_GAME_RELATIONS
+    autocomplete_fields = ['team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack']
+    search_fields = ['^team_1_defense__player_name', '^team_1_attack__player_name', 
+                     '^team_2_defense__player_name', '^team_2_attack__player_name']
+    list_filter = ['league', 'updates_performed']
+    date_hierarchy = 'date_played'
+    ordering = ['-date_played', '-id']
+    show_full_result_count = False
+    actions = [recompute_ratings, void_ratings]
     
 class PlayerRatingAdmin(admin.ModelAdmin):
     list_display = ['player', 'timestamp', 'rating']
-    search_fields = ['player']
-    list_filter = ['player']
+    list_select_related = ['player']
+    autocomplete_fields = ['player']
+    search_fields = ['^player__player_name']
+    list_filter = ['player__league']
+    date_hierarchy = 'timestamp'
+    ordering = ['-timestamp', '-id']
+    show_full_result_count = False
     
 
 # Register your models here.
+admin.site.register(League, LeagueAdmin)
 admin.site.register(Game, GameAdmin)
 admin.site.register(Player, PlayerAdmin)
-admin.site.register(PlayerRating, PlayerRatingAdmin)
\ No newline at end of file
+admin.site.register(PlayerRating, PlayerRatingAdmin)
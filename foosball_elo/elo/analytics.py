@@ -0,0 +1,220 @@
+"""
+Weekly rollups of the games and ratings of each league, for the analytics dashboard.
+
+Charting a league's whole history would otherwise scan all its games and
+ratings for every chart. Instead, a game is counted in the WeeklyRollup of
+the week it was played as it is submitted, and taken back out if it is
+edited or deleted (see signals.py). The rating update using a game then
+counts what depends on the ratings it is rated with: whether the higher
+rated team won, and whether the team with the stronger attacker beat the
+one with the stronger defender. Every rating update also stores how the
+ratings of the league are distributed after it, in the rollup of the week
+it starts, as weeks start on sundays like rating updates (see week_start).
+The dashboard reads nothing but a league's rollups, one row per week, and
+is cached for the league's version.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .models import Player, Game, PlayerRating, RatingUpdate, WeeklyRollup, default_league_id, rating_at
+from .caching import get_league_version
+from .records import STREAM_CHUNK_SIZE
+from .replay import week_of
+
+from collections import defaultdict
+import datetime
+
+
+RATING_BUCKET_SIZE = 50
+ANALYTICS_CACHE_KEY = 'elo:analytics:{}:{}'
+
+RATED_FIELDS = ['rated_game_count', 'margins', 'attack_defense_game_count', 'attack_team_wins']
+
+
+#############
+## HELPERS ##
+#############
+
+def week_start(date : datetime.date) -> datetime.date:
+    """ The sunday the week of date starts on. Weeks are those of replay.week_of(), which start with the
+        sunday rating update, so the ratings of a week's rollup are the ones its games are played with.
+    """
+    # date_played is still a string if the game was created from form data.
+    date = Game._meta.get_field('date_played').to_python(date)
+    return datetime.date.fromordinal(week_of(date) * 7)
+
+def is_egg(game : Game) -> bool:
+    return min(int(game.team_1_score), int(game.team_2_score)) == 0
+
+def rollup_key(game : Game) -> tuple[int, datetime.date, bool]:
+    """ What decides how a game is counted as it is submitted.
+    """
+    return game.league_id, week_start(game.date_played), is_egg(game)
+
+def add_rated_game(rollup : WeeklyRollup, game : Game, ratings : dict[int, int], sign : int = 1):
+    """ Counts game in rollup as rated with ratings, which map the ids of its players to their ratings.
+        A sign of -1 takes it back out.
+    """
+    scores = [int(game.team_1_score), int(game.team_2_score)]
+    teams = [(ratings[game.team_1_defense_id], ratings[game.team_1_attack_id]),
+             (ratings[game.team_2_defense_id], ratings[game.team_2_attack_id])]
+    winner = game.winner() - 1
+    rollup.rated_game_count += sign
+
+    team_ratings = [sum(team) / 2 for team in teams]
+    # Only games with a higher rated team count towards the margins.
+    if team_ratings[0] != team_ratings[1]:
+        favourite = 0 if team_ratings[0] > team_ratings[1] else 1
+        counts = rollup.margins.setdefault(str(abs(scores[0] - scores[1])), [0, 0])
+        counts[0] += sign
+        counts[1] += sign * (winner == favourite)
+
+    attack_teams = [idx for idx, (defense, attack) in enumerate(teams) if attack > defense]
+    defense_teams = [idx for idx, (defense, attack) in enumerate(teams) if defense > attack]
+    if len(attack_teams) == 1 and len(defense_teams) == 1:
+        rollup.attack_defense_game_count += sign
+        rollup.attack_team_wins += sign * (winner == attack_teams[0])
+
+def rating_histogram(ratings : list[int]) -> dict[str, int]:
+    histogram = defaultdict(int)
+    for rating in ratings:
+        histogram[str(rating - rating % RATING_BUCKET_SIZE)] += 1
+    return dict(histogram)
+
+def create_rollups(league_id : int, weeks : set[datetime.date]):
+    WeeklyRollup.objects.bulk_create([WeeklyRollup(league_id=league_id, week=week) for week in weeks], ignore_conflicts=True)
+
+##############
+## UPDATING ##
+##############
+
+def record_game(game : Game, sign : int = 1):
+    """ Counts a submitted game in the rollup of its week. A sign of -1 takes it back out.
+    """
+    league_id, week, egg = rollup_key(game)
+    create_rollups(league_id, {week})
+    WeeklyRollup.objects.filter(league_id=league_id, week=week).update(game_count=F('game_count') + sign,
+                                                                       egg_count=F('egg_count') + sign * egg)
+
+def record_rated_games(league_id : int, rated_games : list[tuple[Game, dict[int, int]]], sign : int = 1):
+    """ Counts games of the league in the rollups of their weeks, each rated with the ratings paired with it.
+        Must be called with the league locked, like rating updates do.
+    """
+    games_by_week = defaultdict(list)
+    for game, ratings in rated_games:
+        games_by_week[week_start(game.date_played)].append((game, ratings))
+    if len(games_by_week) == 0:
+        return
+    create_rollups(league_id, set(games_by_week))
+    rollups = list(WeeklyRollup.objects.filter(league_id=league_id, week__in=games_by_week))
+    for rollup in rollups:
+        for game, ratings in games_by_week[rollup.week]:
+            add_rated_game(rollup, game, ratings, sign)
+    # Only the fields counted here, so games submitted meanwhile still count.
+    WeeklyRollup.objects.bulk_update(rollups, RATED_FIELDS)
+
+def record_ratings(league_id : int, timestamp : datetime.date, ratings : list[int]):
+    """ Stores the distribution of the ratings of the league after its rating update timestamped with timestamp.
+    """
+    week = week_start(timestamp)
+    create_rollups(league_id, {week})
+    WeeklyRollup.objects.filter(league_id=league_id, week=week).update(rating_histogram=rating_histogram(ratings))
+
+def rebuild_rollups(league_id : int = None) -> int:
+    """ Recomputes the rollups of the league (the default league if not given) in one pass over its games
+        and ratings. Rated games are counted as rated with the ratings in effect on the day they were played.
+        Returns the number of weeks.
+    """
+    league_id = league_id or default_league_id()
+    rating_histories = {player_id: [] for player_id in Player.objects.filter(league_id=league_id).values_list('id', flat=True)}
+    for player_id, timestamp, rating in PlayerRating.objects.filter(player__league_id=league_id) \
+                                                            .order_by('player_id', 'timestamp', 'id') \
+                                                            .values_list('player_id', 'timestamp', 'rating') \
+                                                            .iterator(chunk_size=STREAM_CHUNK_SIZE):
+        rating_histories[player_id].append((timestamp, rating))
+    rollups = {}
+    def rollup_of(week : datetime.date) -> WeeklyRollup:
+        if week not in rollups:
+            rollups[week] = WeeklyRollup(league_id=league_id, week=week)
+        return rollups[week]
+
+    for game in Game.objects.filter(league_id=league_id).order_by('date_played', 'id').iterator(chunk_size=STREAM_CHUNK_SIZE):
+        rollup = rollup_of(week_start(game.date_played))
+        rollup.game_count += 1
+        rollup.egg_count += is_egg(game)
+        if game.updates_performed:
+            player_ids = {game.team_1_defense_id, game.team_1_attack_id, game.team_2_defense_id, game.team_2_attack_id}
+            add_rated_game(rollup, game, {player_id: rating_at(rating_histories[player_id], game.date_played)
+                                          for player_id in player_ids})
+    for timestamp in RatingUpdate.objects.filter(league_id=league_id).order_by('timestamp').values_list('timestamp', flat=True):
+        # Ratings timestamped with the update are in effect from the next day, and players who joined later don't count.
+        rollup_of(week_start(timestamp)).rating_histogram = rating_histogram([
+            rating_at(history, timestamp + datetime.timedelta(days=1))
+            for history in rating_histories.values() if len(history) > 0 and history[0][0] <= timestamp
+        ])
+
+    with transaction.atomic():
+        WeeklyRollup.objects.filter(league_id=league_id).delete()
+        WeeklyRollup.objects.bulk_create(rollups.values(), batch_size=STREAM_CHUNK_SIZE)
+    return len(rollups)
+
+###############
+## DASHBOARD ##
+###############
+
+def rate(count : int, total : int) -> float:
+    return round(count / total, 3) if total > 0 else None
+
+def query_dashboard(league_id : int) -> dict:
+    """ Returns every series of the analytics dashboard of the league, from its rollups.
+    """
+    rollups = {rollup.week: rollup for rollup in WeeklyRollup.objects.filter(league_id=league_id)}
+    # Every week from the first to the last, whether games were played or not.
+    weeks = []
+    if len(rollups) > 0:
+        week, last_week = min(rollups), max(rollups)
+        while week <= last_week:
+            weeks.append(week)
+            week += datetime.timedelta(weeks=1)
+    empty = WeeklyRollup()
+
+    margins = defaultdict(lambda: [0, 0])
+    for rollup in rollups.values():
+        for margin, (games, favourite_wins) in rollup.margins.items():
+            margins[int(margin)][0] += games
+            margins[int(margin)][1] += favourite_wins
+    attack_defense_game_count = sum(rollup.attack_defense_game_count for rollup in rollups.values())
+    attack_team_wins = sum(rollup.attack_team_wins for rollup in rollups.values())
+    histogram_week = max([week for week, rollup in rollups.items() if rollup.rating_histogram is not None], default=None)
+    histogram = {int(bucket): count for bucket, count in rollups[histogram_week].rating_histogram.items()} if histogram_week else {}
+
+    return {
+        'weeks': [week.isoformat() for week in weeks],
+        'games': [rollups.get(week, empty).game_count for week in weeks],
+        'egg_rates': [rate(rollups.get(week, empty).egg_count, rollups.get(week, empty).game_count) for week in weeks],
+        'margins': [{'margin': margin, 'games': games, 'favourite_win_rate': rate(favourite_wins, games)}
+                    for margin, (games, favourite_wins) in sorted(margins.items()) if games > 0],
+        'attack_defense': {
+            'games': attack_defense_game_count,
+            'attack_win_rate': rate(attack_team_wins, attack_defense_game_count),
+            'defense_win_rate': rate(attack_defense_game_count - attack_team_wins, attack_defense_game_count),
+        },
+        'rating_histogram': {
+            'week': histogram_week.isoformat() if histogram_week else None,
+            'bucket_size': RATING_BUCKET_SIZE,
+            'buckets': [{'rating': bucket, 'players': histogram.get(bucket, 0)}
+                        for bucket in range(min(histogram, default=0), max(histogram, default=-1) + 1, RATING_BUCKET_SIZE)],
+        },
+    }
+
+def get_dashboard(league_id : int = None) -> dict:
+    """ Cached version of query_dashboard(), for the current version of the league (the default league if not given).
+    """
+    league_id = league_id or default_league_id()
+    key = ANALYTICS_CACHE_KEY.format(league_id, get_league_version(league_id))
+    dashboard = cache.get(key)
+    if dashboard is None:
+        dashboard = query_dashboard(league_id)
+        cache.set(key, dashboard, None)
+    return dashboard
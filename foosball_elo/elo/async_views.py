@@ -0,0 +1,189 @@
+from asgiref.sync import sync_to_async
+from django.db.models.query import QuerySet
+from django.shortcuts import render
+from django.http import Http404, HttpRequest, HttpResponse, StreamingHttpResponse
+from django.utils.functional import SimpleLazyObject
+
+from foosball_elo.middleware import replica_reads
+
+from .models import Player, Game, RatingUpdate, expand_rating_history
+from .broadcast import get_broadcaster, snapshot_payload
+from .caching import aget_league_version, afragment_is_cached
+from .views import (PLAYER_POSITIONS, get_request_league_id, league_query, pending_games_queryset, paginate_pending_games, with_current_rating, 
+                    sort_by_rating, compute_all_rating_diffs, season_ratings, season_games, carry_over_rating, rating_history_values, 
+                    group_rating_histories, get_opponent_ids, summarize_player_games, player_seasons_queryset,
+                    get_player_list, get_player_statistics, get_rating_history)
+
+import asyncio
+import json
+from typing import Any, Callable
+
+
+# Async counterparts of IndexView, AllView and PlayerDetailView, for serving
+# the read-heavy pages under an ASGI server (see foosball_elo/asgi.py) without
+# occupying a thread per request. Queries that don't depend on each other are
+# awaited concurrently, and everything the templates need is loaded up front,
+# except what cached fragments show. That is passed lazily and the templates
+# are rendered in a thread, in case the fragment is evicted before it's read.
+
+#############
+## HELPERS ##
+#############
+
+# Seconds between comments sent to keep idle streams from being closed by proxies.
+STREAM_KEEPALIVE_INTERVAL = 15
+
+async def alist(queryset : QuerySet) -> list:
+    return [obj async for obj in queryset.aiterator()]
+
+async def aconstant(value : Any) -> Any:
+    """ Stands in for a query that can be skipped in asyncio.gather().
+    """
+    return value
+
+def loaded_or_lazy(value : Any, compute : Callable[[], Any]) -> Any:
+    """ Returns value, or compute() as a lazy object if value wasn't loaded because its fragment was cached.
+    """
+    return SimpleLazyObject(compute) if value is None else value
+
+async def aget_player_list(league_id : int) -> list[tuple[Player, int]]:
+    """ Returns (player, pending rating diff) pairs of all players of the league, highest rated first.
+    """
+    players, unrecorded_games = await asyncio.gather(
+        alist(with_current_rating(Player.objects.filter(league_id=league_id).select_related('rating_interval'))),
+        alist(Game.objects.filter(league_id=league_id, updates_performed=False))
+    )
+    rating_diffs = compute_all_rating_diffs(players, unrecorded_games)
+    return [(p, rating_diffs[p]) for p in sort_by_rating(players)]
+
+async def aget_rating_histories(player_ids : set[int], since : Any = None) -> dict[int, list[tuple[Any, int]]]:
+    # aiterator() can't be used on values_list() querysets in Django 4.2, as
+    # they start querying as soon as the iterator is created.
+    rows = [row async for row in rating_history_values(player_ids, since)]
+    return group_rating_histories(player_ids, rows)
+
+async def aget_rating_history(player : Player, since : Any = None) -> list:
+    """ Async counterpart of get_rating_history.
+    """
+    ratings = await alist(season_ratings([player.id], since).order_by('timestamp', 'id'))
+    if len(ratings) == 0:
+        return []
+    carry_over_rating(ratings, since)
+    update_dates = [date async for date in RatingUpdate.objects.filter(league_id=player.league_id, 
+                                                                       timestamp__gt=ratings[0].timestamp)
+                                                               .values_list('timestamp', flat=True)]
+    return expand_rating_history(ratings, update_dates)
+
+async def aget_player_statistics(player : Player, since : Any = None) -> dict[str, int]:
+    games_by_position = await asyncio.gather(
+        *[alist(season_games(Game.objects.filter(**{position: player}), since)) for position in PLAYER_POSITIONS]
+    )
+    games_by_position = [set(games) for games in games_by_position]
+    rating_histories = await aget_rating_histories(get_opponent_ids(set().union(*games_by_position), player), since)
+    return summarize_player_games(player, *games_by_position, rating_histories)
+
+def server_sent_event(event : str, data : dict) -> str:
+    return "event: {}\ndata: {}\n\n".format(event, json.dumps(data, separators=(',', ':')))
+
+async def leaderboard_events(league_id : int):
+    """ Yields a snapshot event followed by a delta event for every change to the leaderboard of the league.
+    """
+    broadcaster = get_broadcaster(league_id)
+    snapshot, queue = await broadcaster.subscribe()
+    try:
+        yield server_sent_event('snapshot', snapshot_payload(snapshot))
+        while True:
+            try:
+                delta = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if delta is None:
+                return
+            yield server_sent_event('delta', delta)
+    finally:
+        broadcaster.unsubscribe(queue)
+
+
+###########
+## VIEWS ##
+###########
+
+# Like their sync counterparts, the views skip computing whatever the templates
+# have cached for the current league version.
+
+@replica_reads
+async def index(request : HttpRequest) -> HttpResponse:
+    league_id = await sync_to_async(get_request_league_id)(request)
+    league_version = await aget_league_version(league_id)
+    leaderboard_cached, pending_games_cached = await asyncio.gather(
+        afragment_is_cached('leaderboard', league_id, league_version),
+        afragment_is_cached('pending_games', league_id, league_version)
+    )
+    player_list, recent_games = await asyncio.gather(
+        aconstant(None) if leaderboard_cached else aget_player_list(league_id),
+        aconstant(None) if pending_games_cached else alist(pending_games_queryset(league_id=league_id))
+    )
+    player_list = loaded_or_lazy(player_list, lambda: get_player_list(league_id))
+    recent_games = loaded_or_lazy(recent_games, lambda: list(pending_games_queryset(league_id=league_id)))
+    recent_games_page = SimpleLazyObject(lambda: paginate_pending_games(recent_games, request.GET.get('league')))
+    return await sync_to_async(render)(request, 'elo/index.html', {
+        'league_id': league_id,
+        'league_query': league_query(request),
+        'league_version': league_version,
+        'top_5_list': SimpleLazyObject(lambda: player_list[:5]),
+        'recent_games': SimpleLazyObject(lambda: recent_games_page['games']),
+        'recent_games_next_page_url': SimpleLazyObject(lambda: recent_games_page['next_page_url']),
+    })
+
+@replica_reads
+async def all_players(request : HttpRequest) -> HttpResponse:
+    league_id = await sync_to_async(get_request_league_id)(request)
+    league_version = await aget_league_version(league_id)
+    ranking_cached = await afragment_is_cached('ranking', league_id, league_version)
+    player_list = None if ranking_cached else await aget_player_list(league_id)
+    return await sync_to_async(render)(request, 'elo/player_list.html', {
+        'league_id': league_id,
+        'league_query': league_query(request),
+        'league_version': league_version,
+        'player_list': loaded_or_lazy(player_list, lambda: get_player_list(league_id))
+    })
+
+@replica_reads
+async def player_detail(request : HttpRequest, pk : int) -> HttpResponse:
+    try:
+        player = await Player.objects.select_related('league').aget(pk=pk)
+    except Player.DoesNotExist:
+        raise Http404("No player found matching the query")
+    season_start = player.league.season_start
+    league_version = await aget_league_version(player.league_id)
+    stats_cached = await afragment_is_cached('player_stats', player.id, league_version)
+    chart_cached = await afragment_is_cached('rating_chart', player.id, league_version)
+
+    player_stats, player_seasons, rating_history = await asyncio.gather(
+        aconstant(None) if stats_cached else aget_player_statistics(player, season_start),
+        aconstant(None) if stats_cached else alist(player_seasons_queryset(player)),
+        aconstant(None) if stats_cached and chart_cached else aget_rating_history(player, season_start)
+    )
+    player_stats = loaded_or_lazy(player_stats, lambda: get_player_statistics(player, season_start))
+    player_seasons = loaded_or_lazy(player_seasons, lambda: list(player_seasons_queryset(player)))
+    rating_history = loaded_or_lazy(rating_history, lambda: get_rating_history(player, season_start))
+    return await sync_to_async(render)(request, 'elo/player_detail.html', {
+        'player': player,
+        'season_start': season_start,
+        'player_seasons': player_seasons,
+        'league_version': league_version,
+        'high_score': SimpleLazyObject(lambda: max([r.rating for r in rating_history], default=None)),
+        'rating_history': rating_history,
+        'player_stats': SimpleLazyObject(lambda: {key: round(value, 2) for key, value in player_stats.items()}),
+    })
+
+async def leaderboard_stream(request : HttpRequest) -> StreamingHttpResponse:
+    """ Server-Sent Events stream of the leaderboard, for the live page. Requires an ASGI server.
+    """
+    league_id = await sync_to_async(get_request_league_id)(request)
+    response = StreamingHttpResponse(leaderboard_events(league_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
@@ -0,0 +1,123 @@
+"""
+Bootstrap confidence intervals of the players' ratings.
+
+Every bootstrap replicate resamples the games of each week with replacement,
+and replays the resampled history (see replay.py). How much a player's final
+rating varies across replicates shows how much it depends on the luck of
+which games they happened to play: it varies a lot for a player with a
+dozen games, and little for one with a thousand.
+
+The resampling is of the whole league's games within each week, not of each
+player's own history: a player's number of games in a replicate varies, and
+a resampled game changes the ratings of all four of its players at once. So
+the intervals show how the league's ratings depend on which games were
+played, and aren't independent per-player bootstrap intervals.
+
+Replicates are independent, so they are spread over worker processes, which
+get the game array once when they start.
+"""
+from .penalties import InactivityPolicy
+from .replay import replay_weeks
+
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def resample_games(games : np.ndarray, rng : np.random.Generator) -> np.ndarray:
+    """ Draws as many games as each week has from all the games of the same week, with replacement.
+        games must be ordered by week.
+    """
+    if len(games) == 0:
+        return games
+    week_starts = np.flatnonzero(np.diff(games['week'], prepend=games['week'][0] - 1))
+    week_sizes = np.diff(np.append(week_starts, len(games)))
+    starts = np.repeat(week_starts, week_sizes)
+    sizes = np.repeat(week_sizes, week_sizes)
+    return games[starts + (rng.random(len(games)) * sizes).astype(np.intp)]
+
+def final_ratings(data : dict[str, np.ndarray],
+                  scaling_factor : float,
+                  adaption_step : float,
+                  policy : InactivityPolicy) -> np.ndarray:
+    ratings = data['initial_ratings'].astype(np.int64)
+    for _, _, _, ratings in replay_weeks(data, scaling_factor, adaption_step, policy):
+        pass
+    return ratings
+
+def bootstrap_final_ratings(data : dict[str, np.ndarray],
+                            replicates : int,
+                            seed : np.random.SeedSequence,
+                            scaling_factor : float,
+                            adaption_step : float,
+                            policy : InactivityPolicy) -> np.ndarray:
+    """ The final ratings of every player in each replicate, one row per replicate.
+    """
+    rng = np.random.default_rng(seed)
+    return np.array([final_ratings(dict(data, games=resample_games(data['games'], rng)), scaling_factor, adaption_step, policy)
+                     for _ in range(replicates)], dtype=np.int64).reshape(replicates, len(data['initial_ratings']))
+
+def count_games(data : dict[str, np.ndarray]) -> np.ndarray:
+    """ The number of games of every player. Playing alone counts once.
+    """
+    games = data['games']
+    positions = np.stack([games['team_1_defense'], games['team_1_attack'], games['team_2_defense'], games['team_2_attack']], axis=1)
+    positions[:, 1] = np.where(positions[:, 1] == positions[:, 0], -1, positions[:, 1])
+    positions[:, 3] = np.where(positions[:, 3] == positions[:, 2], -1, positions[:, 3])
+    players = positions[positions >= 0]
+    return np.bincount(players, minlength=len(data['initial_ratings']))
+
+
+#############
+## WORKERS ##
+#############
+
+_worker_args = None
+
+def init_worker(data : dict[str, np.ndarray], scaling_factor : float, adaption_step : float, policy : InactivityPolicy):
+    global _worker_args
+    _worker_args = (data, scaling_factor, adaption_step, policy)
+
+def bootstrap_in_worker(shard : tuple[int, np.random.SeedSequence]) -> np.ndarray:
+    replicates, seed = shard
+    data, scaling_factor, adaption_step, policy = _worker_args
+    return bootstrap_final_ratings(data, replicates, seed, scaling_factor, adaption_step, policy)
+
+
+###############
+## INTERVALS ##
+###############
+
+def compute_rating_intervals(data : dict[str, np.ndarray],
+                             scaling_factor : float,
+                             adaption_step : float,
+                             policy : InactivityPolicy,
+                             replicates : int = 200,
+                             confidence : float = .95,
+                             workers : int = 1,
+                             seed : int = None) -> dict[str, np.ndarray]:
+    """ Returns the rating replayed from all games and the bounds of its confidence interval,
+        as arrays indexed like the players of data (see load_replay_data).
+    """
+    shard_sizes = [len(shard) for shard in np.array_split(np.arange(replicates), workers) if len(shard) > 0]
+    shards = list(zip(shard_sizes, np.random.SeedSequence(seed).spawn(len(shard_sizes))))
+    if len(shards) == 1:
+        init_worker(data, scaling_factor, adaption_step, policy)
+        samples = [bootstrap_in_worker(shards[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards),
+                                 initializer=init_worker,
+                                 initargs=(data, scaling_factor, adaption_step, policy)) as executor:
+            samples = list(executor.map(bootstrap_in_worker, shards))
+    samples = np.concatenate(samples)
+
+    tail = 50 * (1 - confidence)
+    lower, upper = np.percentile(samples, [tail, 100 - tail], axis=0, method='nearest')
+    rating = final_ratings(data, scaling_factor, adaption_step, policy)
+    # The resampled histories can be biased, so the interval is widened to include the rating if need be.
+    return {
+        'rating': rating,
+        'lower': np.minimum(lower, rating).astype(np.int64),
+        'upper': np.maximum(upper, rating).astype(np.int64),
+        'games': count_games(data),
+    }
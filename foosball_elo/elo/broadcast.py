@@ -0,0 +1,197 @@
+"""
+In-process broadcasting of leaderboard changes to the live stream (see
+async_views.leaderboard_stream).
+
+Every league has its own broadcaster, which model signals notify whenever the
+league's games or ratings change. The broadcaster then recomputes the
+leaderboard once, diffs it against the previous one and pushes the delta to
+every connected screen, so the cost of a change doesn't grow with the number
+of screens. Changes made by other processes, like the update_ratings command,
+notify nobody here, but they change the league's version in the shared cache
+(see caching.py), which the broadcaster checks every poll_interval seconds.
+"""
+from asgiref.sync import sync_to_async
+
+from .models import Player, Game, default_league_id
+from .caching import aget_league_version
+from .views import PLAYER_POSITIONS, with_current_rating, sort_by_rating, compute_all_rating_diffs
+
+import asyncio
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+#############
+## HELPERS ##
+#############
+
+def compute_leaderboard_snapshot(league_id : int = None) -> dict[str, dict]:
+    """ Returns the ranking rows, pending rating diffs and pending games of the league, each keyed by id.
+    """
+    league_id = league_id or default_league_id()
+    players = list(with_current_rating(Player.objects.filter(league_id=league_id)))
+    pending_games = list(Game.objects.filter(league_id=league_id, updates_performed=False)
+                                     .select_related(*PLAYER_POSITIONS, 'submitted_by')
+                                     .order_by('-date_played', '-id'))
+    rating_diffs = compute_all_rating_diffs(players, pending_games)
+
+    ranking = {}
+    for position, player in enumerate(sort_by_rating(players), start=1):
+        ranking[player.id] = {'id': player.id,
+                              'name': player.player_name,
+                              'position': position,
+                              'rating': player.current_rating}
+    pending_games_rows = {}
+    for game in pending_games:
+        pending_games_rows[game.id] = {'id': game.id,
+                                       'date_played': game.date_played.isoformat(),
+                                       'team_1': [game.team_1_defense.player_name, game.team_1_attack.player_name],
+                                       'team_2': [game.team_2_defense.player_name, game.team_2_attack.player_name],
+                                       'team_1_score': game.team_1_score,
+                                       'team_2_score': game.team_2_score,
+                                       'submitted_by': game.submitted_by.username}
+    return {
+        'ranking': ranking,
+        'pending_diffs': {player.id: diff for player, diff in rating_diffs.items()},
+        'pending_games': pending_games_rows,
+    }
+
+def snapshot_payload(snapshot : dict[str, dict]) -> dict:
+    """ Converts a snapshot to the payload sent to newly connected screens.
+    """
+    return {
+        'ranking': sorted(snapshot['ranking'].values(), key=lambda row: row['position']),
+        'pending_diffs': snapshot['pending_diffs'],
+        'pending_games': list(snapshot['pending_games'].values()),
+    }
+
+def diff_snapshots(old : dict[str, dict], new : dict[str, dict]) -> dict:
+    """ Returns the changes from old to new, or an empty dict if nothing changed.
+        Pending games are only ever added, or removed once they are recorded.
+    """
+    delta = {
+        'ranking': [row for player_id, row in new['ranking'].items() if old['ranking'].get(player_id) != row],
+        'removed_players': [player_id for player_id in old['ranking'] if player_id not in new['ranking']],
+        'pending_diffs': {player_id: diff for player_id, diff in new['pending_diffs'].items()
+                          if old['pending_diffs'].get(player_id) != diff},
+        'pending_games': [row for game_id, row in new['pending_games'].items() if game_id not in old['pending_games']],
+        'recorded_games': [game_id for game_id in old['pending_games'] if game_id not in new['pending_games']],
+    }
+    return {key: value for key, value in delta.items() if value}
+
+
+#################
+## BROADCASTER ##
+#################
+
+class LeaderboardBroadcaster:
+    """ Fans the leaderboard deltas of a league out to subscribers, which are asyncio queues on a single
+        event loop. notify_change() may be called from any thread. Bursts of changes, like the rating
+        updates of every player, are collected for debounce seconds and sent as one delta. While there
+        are subscribers, the league's version is checked every poll_interval seconds for changes made
+        by other processes.
+    """
+
+    def __init__(self, league_id : int = None, debounce : float = .5, max_queued_deltas : int = 100,
+                 poll_interval : float = 5):
+        self.league_id = league_id
+        self.debounce = debounce
+        self.max_queued_deltas = max_queued_deltas
+        self.poll_interval = poll_interval
+        self.subscribers = set()
+        self.snapshot = None
+        # The league version the snapshot was computed for.
+        self.version = None
+        self.loop = None
+        self.refresh_scheduled = False
+        self.refresh_task = None
+        self.poll_task = None
+
+    async def subscribe(self) -> tuple[dict, asyncio.Queue]:
+        """ Returns the current snapshot and a queue that receives every following delta.
+        """
+        self.loop = asyncio.get_running_loop()
+        if self.snapshot is None:
+            self.version = await aget_league_version(self.league_id)
+            self.snapshot = await sync_to_async(compute_leaderboard_snapshot)(self.league_id)
+        queue = asyncio.Queue(maxsize=self.max_queued_deltas)
+        self.subscribers.add(queue)
+        if self.poll_task is None:
+            self.poll_task = self.loop.create_task(self.poll_version())
+            self.poll_task.add_done_callback(self.task_done)
+        return self.snapshot, queue
+
+    def unsubscribe(self, queue : asyncio.Queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers:
+            # Nobody is keeping the snapshot up to date anymore.
+            self.snapshot = None
+
+    def notify_change(self):
+        loop = self.loop
+        if loop is None or loop.is_closed() or not self.subscribers:
+            self.snapshot = None
+            return
+        loop.call_soon_threadsafe(self.schedule_refresh)
+
+    def schedule_refresh(self):
+        if self.refresh_scheduled:
+            return
+        self.refresh_scheduled = True
+        self.loop.call_later(self.debounce, self.start_refresh)
+
+    def start_refresh(self):
+        # The loop only keeps a weak reference to its tasks.
+        self.refresh_task = self.loop.create_task(self.refresh())
+        self.refresh_task.add_done_callback(self.task_done)
+
+    def task_done(self, task : asyncio.Task):
+        if self.refresh_task is task:
+            self.refresh_task = None
+        if self.poll_task is task:
+            self.poll_task = None
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Broadcasting the leaderboard of league %s failed', self.league_id, exc_info=task.exception())
+
+    async def poll_version(self):
+        while self.subscribers:
+            await asyncio.sleep(self.poll_interval)
+            if self.subscribers and await aget_league_version(self.league_id) != self.version:
+                self.schedule_refresh()
+
+    async def refresh(self):
+        self.refresh_scheduled = False
+        if not self.subscribers:
+            return
+        # Read first, so changes made while computing the snapshot are caught by the next poll.
+        self.version = await aget_league_version(self.league_id)
+        new_snapshot = await sync_to_async(compute_leaderboard_snapshot)(self.league_id)
+        delta = diff_snapshots(self.snapshot, new_snapshot) if self.snapshot is not None else None
+        self.snapshot = new_snapshot
+        if not delta:
+            return
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(delta)
+            except asyncio.QueueFull:
+                # The screen isn't keeping up. Ending its stream with None lets
+                # it reconnect and start over from a fresh snapshot.
+                self.unsubscribe(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+broadcasters = {}
+
+def get_broadcaster(league_id : int) -> LeaderboardBroadcaster:
+    if league_id not in broadcasters:
+        broadcasters[league_id] = LeaderboardBroadcaster(league_id)
+    return broadcasters[league_id]
+
+def notify_league_change(league_id : int):
+    # Leagues nobody has subscribed to have no broadcaster to notify.
+    if league_id in broadcasters:
+        broadcasters[league_id].notify_change()
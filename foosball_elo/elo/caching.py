@@ -0,0 +1,67 @@
+"""
+Versioning of cached league data.
+
+Everything cached about a league (e.g. the template fragments of the
+leaderboard) is keyed on the league's version, which changes whenever one of
+its players, games or ratings changes (see signals.py). Cached data therefore
+never has to be invalidated, it simply stops being looked up. Every league
+has its own versions, so changes to one league never invalidate the caches of
+another. Functions taking a league_id use the default league if it's not given.
+"""
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+import time
+
+
+LEAGUE_VERSION_CACHE_KEY = 'elo:league_version:{}'
+# Changes only when rating history before today changes (see history.py),
+# which normal rating updates never do.
+HISTORY_VERSION_CACHE_KEY = 'elo:history_version:{}'
+
+
+def league_key(key_format : str, league_id : int = None) -> str:
+    if league_id is None:
+        # Imported here, as importing models requires Django to be set up, which worker processes aren't.
+        from .models import default_league_id
+        league_id = default_league_id()
+    return key_format.format(league_id)
+
+def bump_version(key : str) -> int:
+    # A timestamp rather than a counter, so versions are never reused, even
+    # if the cache is flushed.
+    version = time.time_ns()
+    cache.set(key, version, None)
+    return version
+
+def get_version(key : str) -> int:
+    version = cache.get(key)
+    if version is None:
+        version = bump_version(key)
+    return version
+
+def bump_league_version(league_id : int = None) -> int:
+    return bump_version(league_key(LEAGUE_VERSION_CACHE_KEY, league_id))
+
+def get_league_version(league_id : int = None) -> int:
+    return get_version(league_key(LEAGUE_VERSION_CACHE_KEY, league_id))
+
+def bump_history_version(league_id : int = None) -> int:
+    return bump_version(league_key(HISTORY_VERSION_CACHE_KEY, league_id))
+
+def get_history_version(league_id : int = None) -> int:
+    return get_version(league_key(HISTORY_VERSION_CACHE_KEY, league_id))
+
+async def aget_league_version(league_id : int = None) -> int:
+    key = league_key(LEAGUE_VERSION_CACHE_KEY, league_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = time.time_ns()
+        await cache.aset(key, version, None)
+    return version
+
+async def afragment_is_cached(fragment_name : str, *vary_on) -> bool:
+    """ Tells whether the template fragment cached by {% cache ... fragment_name *vary_on %} is present,
+        in which case async views can skip computing its context.
+    """
+    return await cache.ahas_key(make_template_fragment_key(fragment_name, vary_on))
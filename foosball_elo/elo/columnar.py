@@ -0,0 +1,138 @@
+"""
+Columnar snapshots of the league's history, for analysis without the database.
+
+The players, games and rating series are stored as fixed-width NumPy arrays,
+either as the members of an uncompressed .npz file or as .npy files in a
+directory (see the export_history command). Both are memory-mapped when
+loaded, so a snapshot is ready to use as soon as it is opened, and only the
+pages that are read are ever loaded.
+
+The replay, tuning and simulation tools take the same arrays, whether loaded
+from a snapshot or queried by query_history().
+"""
+import datetime
+import os
+import zipfile
+
+import numpy as np
+
+
+PLAYER_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('name', 'U50'),
+])
+
+GAME_COLUMNS_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('date_played', 'datetime64[D]'),
+    ('team_1_defense', np.int64),
+    ('team_1_attack', np.int64),
+    ('team_2_defense', np.int64),
+    ('team_2_attack', np.int64),
+    ('team_1_score', np.int8),
+    ('team_2_score', np.int8),
+    ('updates_performed', np.bool_),
+])
+
+RATING_DTYPE = np.dtype([
+    ('player_id', np.int64),
+    ('timestamp', 'datetime64[D]'),
+    ('rating', np.int32),
+])
+
+ARRAYS = {'players': PLAYER_DTYPE, 'games': GAME_COLUMNS_DTYPE, 'ratings': RATING_DTYPE}
+
+# The ordinal of the first day of datetime64[D].
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def to_ordinals(dates : np.ndarray) -> np.ndarray:
+    """ The ordinals of datetime64[D] dates, as date.toordinal() gives them.
+    """
+    return dates.astype(np.int64) + EPOCH_ORDINAL
+
+def player_indices(players : np.ndarray, player_ids : np.ndarray) -> np.ndarray:
+    """ The index in players of the player of every id of player_ids.
+    """
+    order = np.argsort(players['id'])
+    return order[np.searchsorted(players['id'], player_ids, sorter=order)]
+
+def query_history(games_since : datetime.date = None, league_id : int = None) -> dict[str, np.ndarray]:
+    """ Loads the players of the league (the default league if not given), ordered by name like the
+        leaderboard's tie breaks, their games, ordered by date, and their ratings, ordered by player
+        and timestamp, in 3 queries. If games_since is given, only games played since then and pending
+        games are loaded.
+    """
+    # Imported here, as importing models requires Django to be set up, which worker processes aren't.
+    from django.db.models import Q
+    from .models import Player, Game, PlayerRating, default_league_id
+
+    league_id = league_id or default_league_id()
+    games = Game.objects.filter(league_id=league_id).order_by('date_played', 'id')
+    if games_since is not None:
+        games = games.filter(Q(date_played__gte=games_since) | Q(updates_performed=False))
+    return {
+        'players': np.array(list(Player.objects.filter(league_id=league_id).values_list('id', 'player_name')), 
+                            dtype=PLAYER_DTYPE),
+        'games': np.array(list(games.values_list('id', 'date_played', 'team_1_defense_id', 'team_1_attack_id',
+                                                 'team_2_defense_id', 'team_2_attack_id', 'team_1_score',
+                                                 'team_2_score', 'updates_performed')
+                                    .iterator(chunk_size=2000)),
+                          dtype=GAME_COLUMNS_DTYPE),
+        'ratings': np.array(list(PlayerRating.objects.filter(player__league_id=league_id)
+                                                     .order_by('player_id', 'timestamp', 'id')
+                                                     .values_list('player_id', 'timestamp', 'rating')
+                                                     .iterator(chunk_size=2000)),
+                            dtype=RATING_DTYPE),
+    }
+
+def save_history(history : dict[str, np.ndarray], path : str):
+    """ Saves history to path, as an .npz file if path ends with .npz, or else as a directory of .npy files.
+    """
+    if path.endswith('.npz'):
+        # Uncompressed, so the arrays can be memory-mapped.
+        np.savez(path, **{name: history[name] for name in ARRAYS})
+    else:
+        os.makedirs(path, exist_ok=True)
+        for name in ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), history[name])
+
+def _memmap_npz_member(path : str, member : zipfile.ZipInfo) -> np.ndarray:
+    if member.compress_type != zipfile.ZIP_STORED:
+        raise ValueError("{} is compressed and can't be memory-mapped.".format(member.filename))
+    with open(path, 'rb') as file:
+        # The data of a member starts after its local header, whose name and extra fields can
+        # differ in length from those of the central directory.
+        file.seek(member.header_offset + 26)
+        name_length, extra_length = np.frombuffer(file.read(4), dtype='<u2')
+        file.seek(member.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(file)
+        read_array_header = np.lib.format.read_array_header_1_0 if version == (1, 0) else np.lib.format.read_array_header_2_0
+        shape, fortran_order, dtype = read_array_header(file)
+        offset = file.tell()
+    if np.prod(shape) == 0:
+        # Nothing to map.
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape, order='F' if fortran_order else 'C', offset=offset)
+
+def load_history(path : str) -> dict[str, np.ndarray]:
+    """ Memory-maps the arrays of a snapshot saved by save_history(). Raises ValueError if
+        path is missing any of them, or they have an unexpected dtype.
+    """
+    if path.endswith('.npz'):
+        try:
+            with zipfile.ZipFile(path) as archive:
+                members = {member.filename[:-len('.npy')]: member for member in archive.infolist()}
+        except zipfile.BadZipFile:
+            raise ValueError("{} is not an .npz file.".format(path))
+        history = {name: _memmap_npz_member(path, members[name])
+                   for name in ARRAYS if name in members}
+    else:
+        history = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+                   for name in ARRAYS if os.path.exists(os.path.join(path, name + '.npy'))}
+    for name, dtype in ARRAYS.items():
+        if name not in history:
+            raise ValueError("The snapshot at {} has no {}.".format(path, name))
+        if history[name].dtype != dtype:
+            raise ValueError("The {} of the snapshot at {} have an unexpected format.".format(name, path))
+    return history
@@ -0,0 +1,74 @@
+"""
+Compaction of the rating history to the ratings that changed.
+
+Rating updates used to store a rating for every player, whether it changed
+or not. A rating equal to the player's previous one doesn't change the rating
+in effect at any date (see rating_at), so it can be deleted, as long as the
+date of the update is kept as a RatingUpdate of the player's league, for the
+player's chart (see expand_rating_history). The 0008 migration compacted the
+history stored before, and the compact_ratings command does the same for
+ratings stored while ELO_COMPACT_RATINGS was off.
+"""
+from django.db import connections, router
+
+from .models import PlayerRating, RatingUpdate
+
+from collections import defaultdict
+import datetime
+
+
+def find_update_dates(rows : list[tuple[int, int, datetime.date]]) -> list[tuple[int, datetime.date]]:
+    """ The (league id, date) of the rating updates found in (league id, player id, timestamp) rows, ordered
+        by player and timestamp. An update stores a rating for every player of its league who has joined,
+        so its date is the timestamp of some rating other than a player's first, unlike the date a player
+        joins on.
+    """
+    dates = set()
+    previous_player_id = None
+    for league_id, player_id, timestamp in rows:
+        if player_id == previous_player_id:
+            dates.add((league_id, timestamp))
+        previous_player_id = player_id
+    return sorted(dates)
+
+def find_redundant_ratings(rows : list[tuple[int, int, int, int]]) -> dict[int, list[int]]:
+    """ The ids of the ratings of (id, league id, player id, rating) rows, ordered by player and timestamp,
+        that are equal to the player's previous rating, by league id.
+    """
+    redundant = defaultdict(list)
+    previous_player_id = previous_rating = None
+    for rating_id, league_id, player_id, rating in rows:
+        if player_id == previous_player_id and rating == previous_rating:
+            redundant[league_id].append(rating_id)
+        previous_player_id, previous_rating = player_id, rating
+    return dict(redundant)
+
+def delete_ratings(rating_ids : list[int], batch_size : int):
+    """ Deletes the ratings in plain SQL, as QuerySet.delete() would load every rating to send its signals,
+        which bump the caches and record a RATING_REMOVED event, for every rating. So the event log keeps
+        the deleted ratings, which is fine, as they don't change the ratings in effect. Only the caches of
+        the leagues are left for the caller to invalidate.
+    """
+    db = router.db_for_write(PlayerRating)
+    connection = connections[db]
+    table = connection.ops.quote_name(PlayerRating._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rating_ids), batch_size):
+            batch = rating_ids[start:start + batch_size]
+            cursor.execute('DELETE FROM {} WHERE id IN ({})'.format(table, ', '.join(['%s'] * len(batch))), batch)
+
+def compact_ratings(batch_size : int = 1000) -> tuple[int, dict[int, int]]:
+    """ Records the dates of the rating updates, and deletes the ratings that didn't change.
+        Returns the number of update dates found, and of ratings deleted by league id.
+    """
+    ratings = PlayerRating.objects.order_by('player_id', 'timestamp', 'id')
+    update_dates = find_update_dates(ratings.values_list('player__league_id', 'player_id', 'timestamp')
+                                            .iterator(chunk_size=2000))
+    recorded = RatingUpdate.objects.bulk_create([RatingUpdate(league_id=league_id, timestamp=date) 
+                                                 for league_id, date in update_dates],
+                                                ignore_conflicts=True)
+    redundant = find_redundant_ratings(ratings.values_list('id', 'player__league_id', 'player_id', 'rating')
+                                              .iterator(chunk_size=2000))
+    rating_ids = [rating_id for league_ratings in redundant.values() for rating_id in league_ratings]
+    delete_ratings(rating_ids, batch_size)
+    return len(recorded), {league_id: len(league_ratings) for league_id, league_ratings in redundant.items()}
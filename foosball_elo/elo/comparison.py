@@ -0,0 +1,74 @@
+"""
+The rating histories of a few players side by side, for comparing them.
+
+The players' ratings are read in a single query (see get_rating_histories)
+and aligned on a common weekly grid: a player's rating in a week is the one
+in effect at its end, carried forward through weeks without rating changes,
+and missing before they had a rating. Long histories are downsampled to a
+given number of weeks, always keeping the latest. How the players did with
+and against each other comes from their PairStats, which pairs.py keeps up
+to date.
+"""
+from django.utils import timezone
+
+from .models import Player, PairStats, rating_at
+from .analytics import week_start
+from .pairs import PAIR_STATS_FIELDS
+from .views import get_rating_histories
+
+import datetime
+import math
+
+
+MIN_COMPARED_PLAYERS = 2
+MAX_COMPARED_PLAYERS = 5
+DEFAULT_COMPARISON_POINTS = 52
+
+
+def weekly_grid(rating_histories : dict[int, list[tuple[datetime.date, int]]],
+                today : datetime.date,
+                since : datetime.date = None) -> list[datetime.date]:
+    """ Returns the sundays starting the weeks from the first rating of the histories, or since if given, until today.
+    """
+    first_timestamps = [history[0][0] for history in rating_histories.values() if len(history) > 0]
+    if len(first_timestamps) == 0:
+        return []
+    week, last_week = week_start(max(min(first_timestamps), since or datetime.date.min)), week_start(today)
+    weeks = []
+    while week <= last_week:
+        weeks.append(week)
+        week += datetime.timedelta(weeks=1)
+    return weeks
+
+def downsample(weeks : list[datetime.date], points : int) -> list[datetime.date]:
+    """ Keeps every n-th week, counting back from the latest, so no more than points weeks are left.
+    """
+    if len(weeks) <= points:
+        return weeks
+    step = math.ceil(len(weeks) / points)
+    return weeks[::-1][::step][::-1]
+
+def align_rating_history(rating_history : list[tuple[datetime.date, int]], weeks : list[datetime.date]) -> list[int]:
+    week_ends = [week + datetime.timedelta(weeks=1) for week in weeks]
+    # A rating is in effect from the day after its timestamp, see rating_at().
+    return [rating_at(rating_history, week_end) if len(rating_history) > 0 and rating_history[0][0] < week_end else None
+            for week_end in week_ends]
+
+def compare_players(players : list[Player], points : int = DEFAULT_COMPARISON_POINTS, since : datetime.date = None) -> dict:
+    """ Returns the weekly ratings of the players, downsampled to points weeks, and what they did with and against
+        each other, in 2 queries. If since is given, the ratings start from the week of since.
+    """
+    player_ids = [player.id for player in players]
+    rating_histories = get_rating_histories(set(player_ids), since)
+    weeks = downsample(weekly_grid(rating_histories, timezone.now().date(), since), points)
+    # Every pair is stored from both players' point of view, of which the first player's is enough.
+    pair_stats = PairStats.objects.filter(player_id__in=player_ids, other_player_id__in=player_ids) \
+                                  .order_by('player_id', 'other_player_id', 'relation')
+    return {
+        'weeks': [week.isoformat() for week in weeks],
+        'players': [{'id': player.id, 'name': player.player_name,
+                     'ratings': align_rating_history(rating_histories[player.id], weeks)} for player in players],
+        'head_to_head': [{'player': stats.player_id, 'other_player': stats.other_player_id, 'relation': stats.relation,
+                          **{field: getattr(stats, field) for field in PAIR_STATS_FIELDS}}
+                         for stats in pair_stats if stats.player_id < stats.other_player_id],
+    }
@@ -0,0 +1,252 @@
+"""
+Rating engines, the rating systems the league's history can be rated with.
+
+An engine rates a batch of games at a time, all from the state at the start
+of the batch, like the weekly rating updates do. Games are GAME_DTYPE arrays
+(see replay.py) whose players index a state table, a structured NumPy array
+with a row per player, whose fields depend on the engine. Engines are pure
+functions of their inputs and never touch the database, so they can rate
+whole histories in worker processes, and several of them can be compared in
+one pass over the history (see replay_engines()).
+
+EloEngine is the rating system the league uses, and the reference every
+other engine is compared to.
+"""
+import numpy as np
+
+
+POSITIONS = ['team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack']
+
+
+class RatingEngine:
+
+    state_dtype : np.dtype = None
+
+    def initial_state(self, ratings : np.ndarray) -> np.ndarray:
+        """ The state of players starting out with ratings.
+        """
+        raise NotImplementedError
+
+    def ratings(self, state : np.ndarray) -> np.ndarray:
+        """ The rating of every player in state, as shown on the leaderboard.
+        """
+        return state['rating'].astype(np.int64)
+
+    def expected_outcomes(self, state : np.ndarray, games : np.ndarray) -> np.ndarray:
+        """ The probability of team 1 winning each game.
+        """
+        raise NotImplementedError
+
+    def rate(self, state : np.ndarray, games : np.ndarray, team_1_expected_outcome : np.ndarray = None) -> np.ndarray:
+        """ Returns the state after rating games. team_1_expected_outcome, if given, must be
+            expected_outcomes(state, games).
+        """
+        raise NotImplementedError
+
+    def adjust(self, state : np.ndarray, diffs : np.ndarray, min_rating : int) -> np.ndarray:
+        """ Returns state with diffs, e.g. inactivity penalties, added to the ratings, none of which
+            drop below min_rating.
+        """
+        new_state = state.copy()
+        new_state['rating'] = np.maximum(state['rating'] + diffs, min_rating)
+        return new_state
+
+
+class EloEngine(RatingEngine):
+    """ The elo rating system of Game.compute_rating_diffs. A team's rating is the mean of its players'
+        ratings, and both players get half the team's rating diff.
+    """
+
+    state_dtype = np.dtype([('rating', np.int64)])
+
+    def __init__(self, scaling_factor : float, adaption_step : float):
+        self.scaling_factor = scaling_factor
+        self.adaption_step = adaption_step
+
+    def initial_state(self, ratings : np.ndarray) -> np.ndarray:
+        state = np.zeros(len(ratings), dtype=self.state_dtype)
+        state['rating'] = ratings
+        return state
+
+    def expected_outcomes(self, state : np.ndarray, games : np.ndarray) -> np.ndarray:
+        ratings = state['rating']
+        team_1_rating = .5 * (ratings[games['team_1_defense']] + ratings[games['team_1_attack']])
+        team_2_rating = .5 * (ratings[games['team_2_defense']] + ratings[games['team_2_attack']])
+        return 1 / (1 + 10**((team_2_rating - team_1_rating) / self.scaling_factor))
+
+    def rating_diffs(self, state : np.ndarray, games : np.ndarray, team_1_expected_outcome : np.ndarray = None) -> np.ndarray:
+        """ The rating diff of every player from games, like compute_all_rating_diffs computes it
+            before inactivity penalties.
+        """
+        if team_1_expected_outcome is None:
+            team_1_expected_outcome = self.expected_outcomes(state, games)
+        team_1_diff = self.adaption_step * (games['team_1_won'] - team_1_expected_outcome)
+        # As the expected outcomes add up to 1, team 2 loses what team 1 wins.
+        team_1_share, team_2_share = np.round(.5 * team_1_diff), np.round(-.5 * team_1_diff)
+        diffs = np.zeros(len(state), dtype=np.int64)
+        for position, share in zip(POSITIONS, [team_1_share, team_1_share, team_2_share, team_2_share]):
+            np.add.at(diffs, games[position], share.astype(np.int64))
+        return diffs
+
+    def rate(self, state : np.ndarray, games : np.ndarray, team_1_expected_outcome : np.ndarray = None) -> np.ndarray:
+        new_state = state.copy()
+        new_state['rating'] += self.rating_diffs(state, games, team_1_expected_outcome)
+        return new_state
+
+
+class RoleEloEngine(EloEngine):
+    """ Elo with separate ratings for playing defense and attack. A team's rating is the mean of its
+        defender's defense rating and its attacker's attack rating, and the team's rating diff is
+        shared between those. The rating shown is the mean of the two.
+    """
+
+    state_dtype = np.dtype([('defense', np.int64), ('attack', np.int64)])
+
+    def initial_state(self, ratings : np.ndarray) -> np.ndarray:
+        state = np.zeros(len(ratings), dtype=self.state_dtype)
+        state['defense'] = state['attack'] = ratings
+        return state
+
+    def ratings(self, state : np.ndarray) -> np.ndarray:
+        return np.round(.5 * (state['defense'] + state['attack'])).astype(np.int64)
+
+    def expected_outcomes(self, state : np.ndarray, games : np.ndarray) -> np.ndarray:
+        team_1_rating = .5 * (state['defense'][games['team_1_defense']] + state['attack'][games['team_1_attack']])
+        team_2_rating = .5 * (state['defense'][games['team_2_defense']] + state['attack'][games['team_2_attack']])
+        return 1 / (1 + 10**((team_2_rating - team_1_rating) / self.scaling_factor))
+
+    def rate(self, state : np.ndarray, games : np.ndarray, team_1_expected_outcome : np.ndarray = None) -> np.ndarray:
+        if team_1_expected_outcome is None:
+            team_1_expected_outcome = self.expected_outcomes(state, games)
+        team_1_diff = self.adaption_step * (games['team_1_won'] - team_1_expected_outcome)
+        team_1_share, team_2_share = np.round(.5 * team_1_diff), np.round(-.5 * team_1_diff)
+        new_state = state.copy()
+        for role, team, share in [('defense', 1, team_1_share), ('attack', 1, team_1_share),
+                                  ('defense', 2, team_2_share), ('attack', 2, team_2_share)]:
+            np.add.at(new_state[role], games['team_{}_{}'.format(team, role)], share.astype(np.int64))
+        return new_state
+
+    def adjust(self, state : np.ndarray, diffs : np.ndarray, min_rating : int) -> np.ndarray:
+        new_state = state.copy()
+        for role in ['defense', 'attack']:
+            new_state[role] = np.maximum(state[role] + diffs, min_rating)
+        return new_state
+
+
+class Glicko2Engine(RatingEngine):
+    """ Glicko-2 (Glickman, 2013), where every batch is a rating period. Each player is rated as if
+        their team, rated by the mean of its players, played the other team, rated by the mean of its
+        players and the root mean square of their deviations. Ratings are on the league's scale,
+        i.e., a difference of 400 points means the same as in elo.
+    """
+
+    state_dtype = np.dtype([('rating', np.float64), ('deviation', np.float64), ('volatility', np.float64)])
+    # Ratings per Glicko-2 unit. It matches the elo scaling factor of 400.
+    SCALE = 400 / np.log(10)
+
+    def __init__(self, initial_deviation : float = 350, initial_volatility : float = .06, tau : float = .5,
+                 tolerance : float = 1e-6):
+        self.initial_deviation = initial_deviation
+        self.initial_volatility = initial_volatility
+        self.tau = tau
+        self.tolerance = tolerance
+
+    def initial_state(self, ratings : np.ndarray) -> np.ndarray:
+        state = np.zeros(len(ratings), dtype=self.state_dtype)
+        state['rating'] = ratings
+        state['deviation'] = self.initial_deviation
+        state['volatility'] = self.initial_volatility
+        return state
+
+    def ratings(self, state : np.ndarray) -> np.ndarray:
+        return np.rint(state['rating']).astype(np.int64)
+
+    def _teams(self, state : np.ndarray, games : np.ndarray) -> tuple[np.ndarray, ...]:
+        """ The rating and deviation of both teams of each game, in Glicko-2 units.
+        """
+        mu = state['rating'] / self.SCALE
+        phi = state['deviation'] / self.SCALE
+        teams = []
+        for team in ['team_1', 'team_2']:
+            defense, attack = games[team + '_defense'], games[team + '_attack']
+            teams += [.5 * (mu[defense] + mu[attack]), np.sqrt(.5 * (phi[defense]**2 + phi[attack]**2))]
+        return tuple(teams)
+
+    @staticmethod
+    def _g(phi : np.ndarray) -> np.ndarray:
+        return 1 / np.sqrt(1 + 3 * phi**2 / np.pi**2)
+
+    def expected_outcomes(self, state : np.ndarray, games : np.ndarray) -> np.ndarray:
+        team_1_mu, team_1_phi, team_2_mu, team_2_phi = self._teams(state, games)
+        return 1 / (1 + np.exp(-self._g(np.sqrt(team_1_phi**2 + team_2_phi**2)) * (team_1_mu - team_2_mu)))
+
+    def _new_volatilities(self, phi : np.ndarray, sigma : np.ndarray, v : np.ndarray, delta : np.ndarray) -> np.ndarray:
+        """ Step 5 of Glicko-2, the Illinois algorithm, run for all players at once.
+        """
+        a = np.log(sigma**2)
+        tau_squared = self.tau**2
+        def f(x):
+            return np.exp(x) * (delta**2 - phi**2 - v - np.exp(x)) / (2 * (phi**2 + v + np.exp(x))**2) - (x - a) / tau_squared
+
+        A = a.copy()
+        B = np.log(np.maximum(delta**2 - phi**2 - v, np.finfo(float).tiny))
+        no_bracket = delta**2 <= phi**2 + v
+        k = np.ones_like(a)
+        while True:
+            lower = no_bracket & (f(a - k * self.tau) < 0)
+            if not lower.any():
+                break
+            k[lower] += 1
+        B[no_bracket] = (a - k * self.tau)[no_bracket]
+
+        f_A, f_B = f(A), f(B)
+        unconverged = np.abs(B - A) > self.tolerance
+        while unconverged.any():
+            # Players who have converged are carried along, whatever C is for them.
+            with np.errstate(divide='ignore', invalid='ignore'):
+                C = A + (A - B) * f_A / (f_B - f_A)
+                f_C = f(C)
+            crossed = f_C * f_B <= 0
+            A, f_A = np.where(unconverged & crossed, B, A), np.where(unconverged & crossed, f_B, f_A / np.where(unconverged, 2, 1))
+            B, f_B = np.where(unconverged, C, B), np.where(unconverged, f_C, f_B)
+            unconverged &= np.abs(B - A) > self.tolerance
+        return np.exp(A / 2)
+
+    def rate(self, state : np.ndarray, games : np.ndarray, team_1_expected_outcome : np.ndarray = None) -> np.ndarray:
+        team_1_mu, team_1_phi, team_2_mu, team_2_phi = self._teams(state, games)
+        team_1_won = games['team_1_won'].astype(float)
+        # Every player's results, seen from their team, against the other team. A player playing
+        # alone played one game, not two.
+        plays = np.concatenate([np.ones(len(games), dtype=np.bool_), games['team_1_attack'] != games['team_1_defense'],
+                                np.ones(len(games), dtype=np.bool_), games['team_2_attack'] != games['team_2_defense']])
+        players = np.concatenate([games[position] for position in POSITIONS])[plays]
+        own_mu = np.concatenate([team_1_mu, team_1_mu, team_2_mu, team_2_mu])[plays]
+        other_mu = np.concatenate([team_2_mu, team_2_mu, team_1_mu, team_1_mu])[plays]
+        g = self._g(np.concatenate([team_2_phi, team_2_phi, team_1_phi, team_1_phi]))[plays]
+        score = np.concatenate([team_1_won, team_1_won, 1 - team_1_won, 1 - team_1_won])[plays]
+        expected = 1 / (1 + np.exp(-g * (own_mu - other_mu)))
+
+        player_count = len(state)
+        played = np.bincount(players, minlength=player_count) > 0
+        information = np.bincount(players, weights=g**2 * expected * (1 - expected), minlength=player_count)[played]
+        improvement = np.bincount(players, weights=g * (score - expected), minlength=player_count)[played]
+        v = 1 / information
+        delta = v * improvement
+
+        mu = state['rating'] / self.SCALE
+        phi = state['deviation'] / self.SCALE
+        sigma = state['volatility'].copy()
+        sigma[played] = self._new_volatilities(phi[played], sigma[played], v, delta)
+        # Players who didn't play only grow more uncertain, up to the deviation of a new player.
+        phi_star = np.minimum(np.sqrt(phi**2 + sigma**2), self.initial_deviation / self.SCALE)
+        new_phi = phi_star.copy()
+        new_phi[played] = 1 / np.sqrt(1 / phi_star[played]**2 + 1 / v)
+        new_mu = mu.copy()
+        new_mu[played] += new_phi[played]**2 * improvement
+
+        new_state = state.copy()
+        new_state['rating'] = new_mu * self.SCALE
+        new_state['deviation'] = new_phi * self.SCALE
+        new_state['volatility'] = sigma
+        return new_state
+
@@ -0,0 +1,193 @@
+"""
+Append-only log of the changes to the state of each league, with periodic snapshots.
+
+The state of a league is the latest rating of every player, and the games
+not yet used for rating updates. Every change to it is recorded as a
+LeagueEvent of the league, by the signals of the models and by
+apply_rating_updates(): a game being submitted, edited or deleted, a rating
+being set or removed, and the pending games being used for a rating update.
+The state after any event is that of the league's latest LeagueSnapshot up to
+it, with the league's events since replayed on top (see state_at()). A
+snapshot is taken once SNAPSHOT_INTERVAL events of any league have been
+recorded since the league's last one, so no more than that many events are
+ever replayed.
+
+Snapshots are stored as JSON, so their player and game ids are strings, and
+a rating is stored with its timestamp, as [timestamp, rating].
+"""
+from django.db.models import Max
+
+from .models import Game, PlayerRating, LeagueEvent, LeagueSnapshot, default_league_id
+
+import datetime
+
+
+SNAPSHOT_INTERVAL = 200
+
+
+#############
+## HELPERS ##
+#############
+
+def game_data(game : Game) -> dict:
+    """ The fields of game that make up the state of the league, as stored in the log.
+    """
+    return {
+        'team_1_defense': game.team_1_defense_id,
+        'team_1_attack': game.team_1_attack_id,
+        'team_2_defense': game.team_2_defense_id,
+        'team_2_attack': game.team_2_attack_id,
+        'team_1_score': int(game.team_1_score),
+        'team_2_score': int(game.team_2_score),
+        # Games created from form data have a string date.
+        'date_played': Game._meta.get_field('date_played').to_python(game.date_played).isoformat(),
+        'updates_performed': game.updates_performed,
+    }
+
+def rating_data(rating : PlayerRating) -> dict:
+    return {
+        'player': rating.player_id,
+        'timestamp': PlayerRating._meta.get_field('timestamp').to_python(rating.timestamp).isoformat(),
+        'rating': rating.rating,
+    }
+
+def removed_rating_data(rating : PlayerRating) -> dict:
+    """ rating_data() of a deleted rating, with the latest rating its player is left with, as [timestamp, rating].
+    """
+    current = PlayerRating.objects.filter(player_id=rating.player_id).order_by('-timestamp', '-id') \
+                                  .values_list('timestamp', 'rating').first()
+    return dict(rating_data(rating), current=[current[0].isoformat(), current[1]] if current is not None else None)
+
+def empty_state() -> dict:
+    return {'ratings': {}, 'pending_games': {}}
+
+def apply_event(state : dict, kind : str, game_id : int, data : dict) -> dict:
+    """ Applies an event to state, a snapshot's state, in place. Returns state.
+    """
+    ratings, pending_games = state['ratings'], state['pending_games']
+    if kind in [LeagueEvent.GAME_SUBMITTED, LeagueEvent.GAME_EDITED]:
+        if data['updates_performed']:
+            pending_games.pop(str(game_id), None)
+        else:
+            pending_games[str(game_id)] = data
+    elif kind == LeagueEvent.GAME_DELETED:
+        pending_games.pop(str(game_id), None)
+    elif kind == LeagueEvent.RATING_SET:
+        # Like with_current_rating(), the latest rating is the one with the latest timestamp,
+        # and of those, the one set last.
+        current = ratings.get(str(data['player']))
+        if current is None or data['timestamp'] >= current[0]:
+            ratings[str(data['player'])] = [data['timestamp'], data['rating']]
+    elif kind == LeagueEvent.RATING_REMOVED:
+        # The state only keeps the latest rating, so the event stores the one the player is left with.
+        if data['current'] is None:
+            ratings.pop(str(data['player']), None)
+        else:
+            ratings[str(data['player'])] = data['current']
+    elif kind == LeagueEvent.RATINGS_APPLIED:
+        for used_game_id in data['games']:
+            pending_games.pop(str(used_game_id), None)
+    return state
+
+def seed_events(ratings : list[tuple[int, datetime.date, int]], games : list[tuple[int, dict]]) -> list[tuple[str, int, dict]]:
+    """ The (kind, game id, data) of events that lead to the state of the league given by its ratings,
+        as (player id, timestamp, rating) rows, and its games, as (id, game_data()) pairs, in the
+        order the events would have happened in: games are submitted on the day they are played,
+        and used by the first rating update after that.
+    """
+    timeline = sorted([(data['date_played'], 0, game_id, data) for game_id, data in games] +
+                      [(timestamp.isoformat(), 1, idx, (player_id, timestamp, rating))
+                       for idx, (player_id, timestamp, rating) in enumerate(ratings)],
+                      key=lambda entry: entry[:3])
+    events = []
+    used_games = []
+    for date, is_rating, key, data in timeline:
+        if is_rating:
+            player_id, timestamp, rating = data
+            if used_games:
+                events.append((LeagueEvent.RATINGS_APPLIED, None, {'games': used_games}))
+                used_games = []
+            events.append((LeagueEvent.RATING_SET, None,
+                           {'player': player_id, 'timestamp': timestamp.isoformat(), 'rating': rating}))
+        else:
+            events.append((LeagueEvent.GAME_SUBMITTED, key, dict(data, updates_performed=False)))
+            if data['updates_performed']:
+                used_games.append(key)
+    if used_games:
+        events.append((LeagueEvent.RATINGS_APPLIED, None, {'games': used_games}))
+    return events
+
+
+#########
+## LOG ##
+#########
+
+def record_event(league_id : int, kind : str, game_id : int = None, data : dict = None) -> LeagueEvent:
+    """ Appends an event of the league to the log, and takes a snapshot of the league if SNAPSHOT_INTERVAL
+        events have been recorded since its last one.
+    """
+    event = LeagueEvent.objects.create(league_id=league_id, kind=kind, game_id=game_id, data=data or {})
+    last_snapshot = LeagueSnapshot.objects.filter(event__league_id=league_id) \
+                                          .aggregate(event_id=Max('event_id'))['event_id'] or 0
+    # Ids are shared by the leagues, so this overestimates the league's events since its last snapshot.
+    if event.id - last_snapshot >= SNAPSHOT_INTERVAL:
+        take_snapshot(event)
+    return event
+
+def take_snapshot(event : LeagueEvent) -> LeagueSnapshot:
+    return LeagueSnapshot.objects.create(event=event, state=load_state(event.id, event.league_id))
+
+def load_state(event_id : int = None, league_id : int = None) -> dict:
+    """ The state of the league (the default league if not given) after the event with event_id, or after
+        the league's latest event if it's not given, as a snapshot stores it. Loads the latest snapshot up
+        to the event and the events since, in 2 queries.
+    """
+    league_id = league_id or default_league_id()
+    snapshots = LeagueSnapshot.objects.filter(event__league_id=league_id).order_by('-event_id')
+    events = LeagueEvent.objects.filter(league_id=league_id).order_by('id')
+    if event_id is not None:
+        snapshots = snapshots.filter(event_id__lte=event_id)
+        events = events.filter(id__lte=event_id)
+    snapshot = snapshots.values_list('event_id', 'state').first()
+    state_event_id, state = snapshot if snapshot is not None else (0, empty_state())
+    for kind, game_id, data in events.filter(id__gt=state_event_id).values_list('kind', 'game_id', 'data'):
+        apply_event(state, kind, game_id, data)
+    return state
+
+def state_at(event_id : int = None, league_id : int = None) -> dict:
+    """ The state of the league (the default league if not given) after the event with event_id, or after
+        the league's latest event if it's not given. Events of other leagues don't change it.
+        Returns a dict of
+        - ratings: the latest rating of every player, by player id
+        - pending_games: the game_data() of every game not yet used for a rating update, by game id
+    """
+    state = load_state(event_id, league_id)
+    return {
+        'ratings': {int(player_id): rating for player_id, (_, rating) in state['ratings'].items()},
+        'pending_games': {int(game_id): data for game_id, data in state['pending_games'].items()},
+    }
+
+def state_as_of(moment : datetime.datetime, league_id : int = None) -> dict:
+    """ state_at() the last event of the league (the default league if not given) recorded up to moment.
+    """
+    league_id = league_id or default_league_id()
+    event_id = LeagueEvent.objects.filter(league_id=league_id, recorded_at__lte=moment) \
+                                  .aggregate(event_id=Max('id'))['event_id']
+    # Before the first event, the league was empty.
+    return state_at(event_id or 0, league_id)
+
+def rebuild_event_log(league_id : int = None) -> int:
+    """ Replaces the log of the league (the default league if not given) with seed_events() of its current
+        state, e.g. after creating games or ratings with bulk_create(), which bypasses the signals.
+        Returns the number of events.
+    """
+    league_id = league_id or default_league_id()
+    LeagueEvent.objects.filter(league_id=league_id).delete()
+    ratings = PlayerRating.objects.filter(player__league_id=league_id).order_by('timestamp', 'id') \
+                                  .values_list('player_id', 'timestamp', 'rating')
+    games = [(game.id, game_data(game)) for game in Game.objects.filter(league_id=league_id).order_by('date_played', 'id')]
+    events = LeagueEvent.objects.bulk_create([LeagueEvent(league_id=league_id, kind=kind, game_id=game_id, data=data)
+                                              for kind, game_id, data in seed_events(list(ratings), games)])
+    if events:
+        take_snapshot(LeagueEvent.objects.filter(league_id=league_id).order_by('id').last())
+    return len(events)
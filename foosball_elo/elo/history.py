@@ -0,0 +1,120 @@
+"""
+The leaderboard as it looked on any past date.
+
+Like Player.get_rating(date), the leaderboard as of a date uses the ratings
+in effect on that date, i.e., the latest rating of each player timestamped
+strictly before it. Rating updates are timestamped with the day they are
+performed, so the leaderboard as of today or any earlier date never changes,
+and is cached for good. Only edits to past ratings and players, e.g. through
+the admin interface, change the history version and with it the cache keys
+(see signals.py).
+
+Closed seasons (see seasons.py) are served from their archives, which never
+change at all, so they are cached for good without a version, and may be
+cached by browsers too.
+"""
+from django.core.cache import cache
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import PlayerRating, Season, default_league_id
+from .caching import get_history_version
+
+import datetime
+
+
+LEADERBOARD_CACHE_KEY = 'elo:leaderboard:{}:{}:{}'
+SEASON_ARCHIVE_CACHE_KEY = 'elo:season:{}:{}'
+# A year, which is as long as browsers and proxies keep anything.
+SEASON_ARCHIVE_MAX_AGE = 365*24*60*60
+
+
+def query_leaderboard_as_of(date : datetime.date, league_id : int = None) -> list[dict]:
+    """ Returns the ranking rows of all players of the league (the default league if not given)
+        who had a rating before date, highest rated first.
+    """
+    # Numbers every player's ratings before date from the latest one, and keeps the latest.
+    latest_ratings = PlayerRating.objects.filter(player__league_id=league_id or default_league_id(), timestamp__lt=date) \
+                                         .annotate(recency=Window(RowNumber(),
+                                                                  partition_by=F('player_id'),
+                                                                  order_by=[F('timestamp').desc(), F('id').desc()])) \
+                                         .filter(recency=1) \
+                                         .order_by('-rating', 'player_id') \
+                                         .values_list('player_id', 'player__player_name', 'rating')
+    return [{'id': player_id, 'name': player_name, 'position': position, 'rating': rating}
+            for position, (player_id, player_name, rating) in enumerate(latest_ratings, start=1)]
+
+def leaderboard_as_of(date : datetime.date, league_id : int = None) -> list[dict]:
+    """ Cached version of query_leaderboard_as_of(). Dates after today aren't cached, as their
+        leaderboard still changes with the next rating update.
+    """
+    league_id = league_id or default_league_id()
+    if date > timezone.now().date():
+        return query_leaderboard_as_of(date, league_id)
+    key = LEADERBOARD_CACHE_KEY.format(league_id, date.isoformat(), get_history_version(league_id))
+    leaderboard = cache.get(key)
+    if leaderboard is None:
+        leaderboard = query_leaderboard_as_of(date, league_id)
+        cache.set(key, leaderboard, None)
+    return leaderboard
+
+def compute_movers(old_leaderboard : list[dict], new_leaderboard : list[dict]) -> list[dict]:
+    """ Returns the rating and position changes of the players on both leaderboards,
+        the ones who moved the most rating points first.
+    """
+    old_rows = {row['id']: row for row in old_leaderboard}
+    movers = []
+    for row in new_leaderboard:
+        old_row = old_rows.get(row['id'])
+        if old_row is None:
+            continue
+        movers.append({'id': row['id'],
+                       'name': row['name'],
+                       'old_position': old_row['position'],
+                       'new_position': row['position'],
+                       'position_change': old_row['position'] - row['position'],
+                       'old_rating': old_row['rating'],
+                       'new_rating': row['rating'],
+                       'rating_change': row['rating'] - old_row['rating']})
+    return sorted(movers, key=lambda mover: (-abs(mover['rating_change']), mover['new_position']))
+
+def movers_between(from_date : datetime.date, to_date : datetime.date, league_id : int = None) -> list[dict]:
+    return compute_movers(leaderboard_as_of(from_date, league_id), leaderboard_as_of(to_date, league_id))
+
+def query_season_archive(season : Season) -> dict:
+    """ Returns the season with its final standings, best first.
+    """
+    standings = season.standings.select_related('player').order_by('position')
+    return {
+        'id': season.id,
+        'name': season.name,
+        'league': season.league.slug,
+        'start': season.start.isoformat(),
+        'end': season.end.isoformat(),
+        'standings': [{
+            'id': standing.player_id,
+            'name': standing.player.player_name,
+            'position': standing.position,
+            'rating': standing.rating,
+            'games': standing.game_count,
+            'wins': standing.games_won,
+            'losses': standing.games_lost,
+            'eggs_dealt': standing.eggs_dealt_count,
+            'eggs_collected': standing.eggs_collected_count,
+            'average_opponent_rating': round(standing.average_opponent_rating, 2),
+        } for standing in standings],
+    }
+
+def get_season_archive(season_id : int) -> dict:
+    """ Cached version of query_season_archive(). Archives never change, so they are cached without a version,
+        but with the time the season was closed, in case it is deleted and its id reused.
+        Raises Season.DoesNotExist if there is no such season.
+    """
+    season = Season.objects.select_related('league').get(pk=season_id)
+    key = SEASON_ARCHIVE_CACHE_KEY.format(season.id, season.closed_at.timestamp())
+    archive = cache.get(key)
+    if archive is None:
+        archive = query_season_archive(season)
+        cache.set(key, archive, None)
+    return archive
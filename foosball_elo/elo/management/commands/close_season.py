@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from elo.models import League, get_league_id
+from elo.seasons import SeasonError, close_season
+
+import datetime
+
+
+class Command(BaseCommand):
+    help = ("Closes the current season of a league, archiving its final standings and statistics, and starts the "
+            "next season the day after. Update the ratings on the season's last day first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="Name of the season, e.g. 2025.")
+        parser.add_argument('--end', type=datetime.date.fromisoformat, default=None,
+                            help="Last day of the season as YYYY-MM-DD, today if not given.")
+        parser.add_argument('--league', help="Slug of the league, the default league if not given.")
+
+    def handle(self, *args, **options):
+        try:
+            league_id = get_league_id(options['league'])
+        except League.DoesNotExist:
+            raise CommandError("There is no league {}.".format(options['league']))
+        try:
+            season = close_season(league_id, options['name'], options['end'] or timezone.now().date())
+        except SeasonError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS("Closed season {} of {} ({} to {}) with {} players.".format(
+            season.name, season.league.name, season.start, season.end, season.standings.count())))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from elo.models import PlayerRating
+from elo.compaction import compact_ratings
+from elo.caching import bump_league_version, bump_history_version
+
+import time
+
+
+class Command(BaseCommand):
+    help = ("Deletes the ratings equal to the player's previous rating, which rating updates stored while "
+            "ELO_COMPACT_RATINGS was off. Ratings in effect at any date stay the same.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rating_count = PlayerRating.objects.count()
+        with transaction.atomic():
+            update_count, deleted_counts = compact_ratings()
+        for league_id in deleted_counts:
+            bump_league_version(league_id)
+            bump_history_version(league_id)
+        deleted_count = sum(deleted_counts.values())
+        self.stdout.write(self.style.SUCCESS(
+            "Deleted {} of {} ratings, from {} rating updates, in {:.2f}s.".format(
+                deleted_count, rating_count, update_count, time.perf_counter() - start)))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from elo.models import League, get_league_id, SCALING_FACTOR, ADAPTION_STEP
+from elo.columnar import load_history
+from elo.engines import EloEngine, RoleEloEngine, Glicko2Engine
+from elo.penalties import get_inactivity_policy
+from elo.replay import load_replay_data, evaluate_engines
+
+import time
+
+
+class Command(BaseCommand):
+    help = ("Compares how well the league's elo and the alternative rating engines predict the outcome of each "
+            "week's games, by replaying the game history with all of them in one pass.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scaling-factor', type=float, default=SCALING_FACTOR, 
+                            help="Scaling factor of the elo engines.")
+        parser.add_argument('--adaption-step', type=float, default=ADAPTION_STEP, 
+                            help="Adaption step of the elo engines.")
+        parser.add_argument('--tau', type=float, default=.5, help="How fast Glicko-2 volatilities change.")
+        parser.add_argument('--burn-in-weeks', type=int, default=4,
+                            help="Number of weeks replayed before predictions are scored.")
+        parser.add_argument('--snapshot', help="Path of a snapshot written by export_history, to use instead of the database.")
+        parser.add_argument('--league', help="Slug of the league, the default league if not given.")
+
+    def handle(self, *args, **options):
+        if options['scaling_factor'] <= 0:
+            raise CommandError("The scaling factor must be positive.")
+        engines = {
+            'elo': EloEngine(options['scaling_factor'], options['adaption_step']),
+            'role_elo': RoleEloEngine(options['scaling_factor'], options['adaption_step']),
+            'glicko2': Glicko2Engine(tau=options['tau']),
+        }
+
+        try:
+            league_id = get_league_id(options['league'])
+        except League.DoesNotExist:
+            raise CommandError("There is no league {}.".format(options['league']))
+        history = None
+        if options['snapshot']:
+            try:
+                history = load_history(options['snapshot'])
+            except (OSError, ValueError) as e:
+                raise CommandError("Couldn't load the snapshot: {}".format(e))
+        data = load_replay_data(history, league_id)
+        if len(data['games']) == 0:
+            raise CommandError("There are no games to replay.")
+        start = time.perf_counter()
+        scores = evaluate_engines(data, list(engines.values()), get_inactivity_policy(), options['burn_in_weeks'])
+        if scores[0]['games_scored'] == 0:
+            raise CommandError("No games were scored. Try fewer burn-in weeks.")
+        self.stdout.write("Replayed {} games with {} engines in {:.2f}s.".format(
+            len(data['games']), len(engines), time.perf_counter() - start))
+
+        self.stdout.write("{:>10} {:>10} {:>12}".format('engine', 'log_loss', 'brier_score'))
+        for name, score in sorted(zip(engines, scores), key=lambda engine: engine[1]['log_loss']):
+            self.stdout.write("{:>10} {:>10.4f} {:>12.4f}".format(name, score['log_loss'], score['brier_score']))
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from elo.models import League, RatingInterval, SCALING_FACTOR, ADAPTION_STEP
+from elo.bootstrap import compute_rating_intervals
+from elo.caching import bump_league_version
+from elo.penalties import get_inactivity_policy
+from elo.replay import load_replay_data
+
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the bootstrap confidence intervals of all ratings shown on the leaderboard. "
+            "Meant to run nightly, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--replicates', type=int, default=200)
+        parser.add_argument('--confidence', type=float, default=.95)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--league', help="Slug of the league, every league if not given.")
+
+    def handle(self, *args, **options):
+        if options['replicates'] <= 0 or options['workers'] <= 0:
+            raise CommandError("The number of replicates and workers must be positive.")
+        if not 0 < options['confidence'] < 1:
+            raise CommandError("The confidence must be between 0 and 1.")
+
+        leagues = League.objects.all()
+        if options['league']:
+            leagues = leagues.filter(slug=options['league'])
+            if not leagues.exists():
+                raise CommandError("There is no league {}.".format(options['league']))
+
+        for league in leagues:
+            start = time.perf_counter()
+            data = load_replay_data(league_id=league.id)
+            intervals = compute_rating_intervals(data, SCALING_FACTOR, ADAPTION_STEP, get_inactivity_policy(),
+                                                 options['replicates'], options['confidence'], options['workers'],
+                                                 options['seed'])
+            computed_at = timezone.now()
+            with transaction.atomic():
+                RatingInterval.objects.filter(player__league=league).delete()
+                RatingInterval.objects.bulk_create([
+                    RatingInterval(player_id=player_id, rating=rating, lower=lower, upper=upper, games=games,
+                                   confidence=options['confidence'], replicates=options['replicates'], computed_at=computed_at)
+                    for player_id, rating, lower, upper, games in zip(data['player_ids'].tolist(), 
+                                                                      intervals['rating'].tolist(), 
+                                                                      intervals['lower'].tolist(), 
+                                                                      intervals['upper'].tolist(), 
+                                                                      intervals['games'].tolist())
+                ])
+            # bulk_create() bypasses the signals, so the cached leaderboards are invalidated here.
+            bump_league_version(league.id)
+            self.stdout.write(self.style.SUCCESS("Computed the rating intervals of {} players of {} from {} replicates in {:.2f}s.".format(
+                len(data['player_ids']), league.name, options['replicates'], time.perf_counter() - start)))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from elo.models import League, get_league_id
+from elo.columnar import query_history, save_history
+
+import time
+
+
+class Command(BaseCommand):
+    help = ("Exports the players, games and rating series of a league as fixed-width NumPy arrays, to an .npz file if the path "
+            "ends with .npz, or else to a directory of .npy files. Load them with elo.columnar.load_history(), or "
+            "pass the path as --snapshot to the replay, tuning and simulation commands.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--league', help="Slug of the league, the default league if not given.")
+
+    def handle(self, *args, **options):
+        try:
+            league_id = get_league_id(options['league'])
+        except League.DoesNotExist:
+            raise CommandError("There is no league {}.".format(options['league']))
+        start = time.perf_counter()
+        history = query_history(league_id=league_id)
+        save_history(history, options['path'])
+        self.stdout.write(self.style.SUCCESS("Exported {} players, {} games and {} ratings to {} in {:.2f}s.".format(
+            len(history['players']), len(history['games']), len(history['ratings']), options['path'],
+            time.perf_counter() - start)))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from elo.models import League, Game, get_league_id
+
+from itertools import groupby
+
+
+class Command(BaseCommand):
+    help = ("Lists the clusters of games with the same date, teams and scores, which are likely duplicates, "
+            "in one pass over the games in the order of their signatures.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', help="Slug of the league, every league if not given.")
+
+    def handle(self, *args, **options):
+        games = Game.objects.all()
+        if options['league']:
+            try:
+                games = games.filter(league_id=get_league_id(options['league']))
+            except League.DoesNotExist:
+                raise CommandError("There is no league {}.".format(options['league']))
+
+        cluster_count = 0
+        duplicate_count = 0
+        # Games with the same signature are next to each other in the index on it.
+        rows = games.order_by('signature', 'id').values_list('signature', 'id', 'submitted_by__username').iterator(chunk_size=2000)
+        for signature, cluster in groupby(rows, key=lambda row: row[0]):
+            cluster = list(cluster)
+            if len(cluster) > 1:
+                self.stdout.write("{}: {}".format(signature, ', '.join("game {} submitted by {}".format(game_id, username) 
+                                                                       for _, game_id, username in cluster)))
+                cluster_count += 1
+                duplicate_count += len(cluster) - 1
+        self.stdout.write(self.style.SUCCESS("Found {} likely duplicates in {} clusters.".format(duplicate_count, cluster_count)))
+
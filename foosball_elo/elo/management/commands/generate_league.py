@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from elo.models import League, Player, Game, PlayerRating, default_league_id, game_signature, SCALING_FACTOR
+from elo.views import with_current_rating, apply_rating_updates
+from elo.events import rebuild_event_log
+from elo.pairs import rebuild_pair_stats
+from elo.records import rebuild_records
+from elo.analytics import rebuild_rollups
+
+import datetime
+import random
+
+
+class Command(BaseCommand):
+    help = "Populates a league, the default league unless given, with synthetic players and games, for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--players', type=int, default=50)
+        parser.add_argument('--weeks', type=int, default=52)
+        parser.add_argument('--games-per-week', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--league', help="Slug of the league, the default league if not given.")
+
+    def handle(self, *args, **options):
+        if options['players'] < 4:
+            raise CommandError("A league needs at least 4 players.")
+        try:
+            league = League.objects.get(slug=options['league']) if options['league'] else League.objects.get(pk=default_league_id())
+        except League.DoesNotExist:
+            raise CommandError("There is no league {}.".format(options['league']))
+        # Player names are unique across leagues.
+        name_prefix = 'synthetic_{}_'.format(league.slug)
+        if Player.objects.filter(player_name__startswith=name_prefix).exists():
+            raise CommandError("The league already contains synthetic players.")
+        rng = random.Random(options['seed'])
+
+        # Ratings are updated on sundays, so the league starts on a sunday.
+        start = datetime.date.today() - datetime.timedelta(weeks=options['weeks'])
+        start -= datetime.timedelta(days=(start.weekday() + 1) % 7)
+
+        with transaction.atomic():
+            users = User.objects.bulk_create([User(username=name_prefix + str(i), password='!')
+                                              for i in range(options['players'])])
+            players = Player.objects.bulk_create([Player(user=user, player_name=user.username, league=league) 
+                                                  for user in users])
+            PlayerRating.objects.bulk_create([PlayerRating(player=player, timestamp=start, rating=800)
+                                              for player in players])
+
+            for week in range(options['weeks']):
+                ratings = {p.id: p.current_rating for p in with_current_rating(league.players.all())}
+                week_start = start + datetime.timedelta(weeks=week)
+                games = []
+                for _ in range(options['games_per_week']):
+                    team_1_defense, team_1_attack, team_2_defense, team_2_attack = rng.sample(players, 4)
+                    game = Game(team_1_defense=team_1_defense,
+                                team_1_attack=team_1_attack,
+                                team_2_defense=team_2_defense,
+                                team_2_attack=team_2_attack,
+                                league=league,
+                                team_1_score=10,
+                                team_2_score=10,
+                                date_played=week_start + datetime.timedelta(days=rng.randint(1, 6)),
+                                submitted_by=users[0])
+                    # Pick the winner according to the expected outcome of the game.
+                    team_1_rating = .5 * (ratings[team_1_defense.id] + ratings[team_1_attack.id])
+                    team_2_rating = .5 * (ratings[team_2_defense.id] + ratings[team_2_attack.id])
+                    team_1_expected_outcome = 1 / (1 + 10**((team_2_rating - team_1_rating) / SCALING_FACTOR))
+                    if rng.random() < team_1_expected_outcome:
+                        game.team_2_score = rng.randint(0, 9)
+                    else:
+                        game.team_1_score = rng.randint(0, 9)
+                    # bulk_create() doesn't call save(), which signs games.
+                    game.signature = game_signature(game)
+                    games.append(game)
+                Game.objects.bulk_create(games)
+                apply_rating_updates(week_start + datetime.timedelta(weeks=1), league.id)
+            # bulk_create() bypasses the signals that keep the pair statistics, the records, the weekly rollups
+            # and the event log up to date.
+            rebuild_pair_stats()
+            rebuild_records(league.id)
+            rebuild_rollups(league.id)
+            rebuild_event_log(league.id)
+
+        self.stdout.write(self.style.SUCCESS("Created {} players and {} games in {}.".format(
+            options['players'], options['weeks'] * options['games_per_week'], league.name)))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from elo.pairs import rebuild_pair_stats
+
+
+class Command(BaseCommand):
+    help = "Recomputes the teammate and opponent statistics of every pair of players from all games."
+
+    def handle(self, *args, **options):
+        pair_count = rebuild_pair_stats()
+        self.stdout.write(self.style.SUCCESS("Rebuilt the statistics of {} pairs.".format(pair_count)))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from elo.models import League
+from elo.records import rebuild_records
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the streaks and records of the players of every league, or of the league given, "
+            "from all games, e.g. after migrating or bulk imports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', help="Slug of the league, every league if not given.")
+
+    def handle(self, *args, **options):
+        leagues = League.objects.all()
+        if options['league']:
+            leagues = leagues.filter(slug=options['league'])
+            if not leagues.exists():
+                raise CommandError("There is no league {}.".format(options['league']))
+        for league in leagues:
+            game_count = rebuild_records(league.id)
+            self.stdout.write(self.style.SUCCESS("Rebuilt the records of {} from {} games.".format(league.name, game_count)))
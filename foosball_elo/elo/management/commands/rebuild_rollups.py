@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from elo.models import League
+from elo.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = ("Recomputes the weekly rollups of the analytics dashboard of every league, or of the league given, "
+            "from all games and ratings, e.g. after migrating or bulk imports.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', help="Slug of the league, every league if not given.")
+
+    def handle(self, *args, **options):
+        leagues = League.objects.all()
+        if options['league']:
+            leagues = leagues.filter(slug=options['league'])
+            if not leagues.exists():
+                raise CommandError("There is no league {}.".format(options['league']))
+        for league in leagues:
+            week_count = rebuild_rollups(league.id)
+            self.stdout.write(self.style.SUCCESS("Rebuilt {} weeks of rollups of {}.".format(week_count, league.name)))
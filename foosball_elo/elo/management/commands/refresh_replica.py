@@ -0,0 +1,37 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = "Refreshes the read-only replica with a consistent snapshot copy of the primary database."
+
+    def handle(self, *args, **options):
+        replica_alias = settings.REPLICA_DATABASE
+        if replica_alias is None:
+            raise CommandError("No replica is configured. Set FOOSBALL_ELO_USE_REPLICA to enable it.")
+
+        primary_settings = connections[DEFAULT_DB_ALIAS].settings_dict
+        replica_settings = connections[replica_alias].settings_dict
+        for db_settings in (primary_settings, replica_settings):
+            if db_settings['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError("Snapshot copies are only supported between SQLite databases.")
+
+        # Make sure no connection of ours holds the replica open while it is overwritten.
+        connections[replica_alias].close()
+
+        # sqlite3's online backup copies a consistent snapshot, even while
+        # the primary is being written to.
+        source = sqlite3.connect(primary_settings['NAME'])
+        target = sqlite3.connect(replica_settings['NAME'])
+        try:
+            with target:
+                source.backup(target)
+        finally:
+            source.close()
+            target.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            "Copied {} to {}.".format(primary_settings['NAME'], replica_settings['NAME'])))
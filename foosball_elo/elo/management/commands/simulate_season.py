@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from elo.models import League, get_league_id
+from elo.columnar import load_history
+from elo.simulation import TOP_N, load_simulation_inputs, simulate_season, run_season_simulation
+
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = ("Simulates the rest of the season to estimate each player's probability of finishing in the top {}, "
+            "and caches the result for the current state of the league. Results from a snapshot aren't cached, "
+            "as the league may have changed since.".format(TOP_N))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simulations', type=int, default=50000)
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--snapshot', help="Path of a snapshot written by export_history, to use instead of the database.")
+        parser.add_argument('--league', help="Slug of the league, the default league if not given.")
+
+    def handle(self, *args, **options):
+        if options['simulations'] <= 0 or options['workers'] <= 0:
+            raise CommandError("The number of simulations and workers must be positive.")
+        try:
+            league_id = get_league_id(options['league'])
+        except League.DoesNotExist:
+            raise CommandError("There is no league {}.".format(options['league']))
+        start = time.perf_counter()
+        today = timezone.now().date()
+        if options['snapshot']:
+            try:
+                history = load_history(options['snapshot'])
+            except (OSError, ValueError) as e:
+                raise CommandError("Couldn't load the snapshot: {}".format(e))
+            result = simulate_season(today, load_simulation_inputs(today, history), options['simulations'], options['workers'])
+        else:
+            result = run_season_simulation(today, options['simulations'], options['workers'], league_id)
+        self.stdout.write("Simulated {} seasons of {} rating updates in {:.2f}s.".format(
+            result['simulations'], result['remaining_updates'], time.perf_counter() - start))
+        for row in result['players'][:2 * TOP_N]:
+            self.stdout.write("{:>30} {:>7.1%}".format(row['name'], row['probability']))
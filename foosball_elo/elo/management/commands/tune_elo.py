@@ -0,0 +1,91 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from elo.models import League, get_league_id, SCALING_FACTOR, ADAPTION_STEP
+from elo.columnar import load_history
+from elo.penalties import get_inactivity_policy
+from elo.replay import load_replay_data, init_worker, evaluate_in_worker
+
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = ("Searches for the scaling_factor and adaption_step that best predict the outcome of each week's games "
+            "from the ratings at the start of the week, by replaying the game history.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--search', choices=['grid', 'random'], default='grid')
+        parser.add_argument('--scaling-factors', type=float, nargs='+', default=[200, 300, 400, 500, 600, 800],
+                            help="Scaling factors of the grid search.")
+        parser.add_argument('--adaption-steps', type=float, nargs='+', default=[8, 16, 24, 32, 48, 64, 96, 128],
+                            help="Adaption steps of the grid search.")
+        parser.add_argument('--samples', type=int, default=50, help="Number of candidates of the random search.")
+        parser.add_argument('--scaling-factor-range', type=float, nargs=2, default=[100, 1000])
+        parser.add_argument('--adaption-step-range', type=float, nargs=2, default=[4, 160])
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--burn-in-weeks', type=int, default=4,
+                            help="Number of weeks replayed before predictions are scored.")
+        parser.add_argument('--snapshot', help="Path of a snapshot written by export_history, to use instead of the database.")
+        parser.add_argument('--league', help="Slug of the league, the default league if not given.")
+        parser.add_argument('--metric', choices=['log_loss', 'brier_score'], default='log_loss')
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+        parser.add_argument('--top', type=int, default=10, help="Number of candidates to report.")
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 0:
+            raise CommandError("The number of workers must be positive.")
+        if options['search'] == 'grid':
+            candidates = list(itertools.product(options['scaling_factors'], options['adaption_steps']))
+        else:
+            rng = random.Random(options['seed'])
+            candidates = [(rng.uniform(*options['scaling_factor_range']), rng.uniform(*options['adaption_step_range']))
+                          for _ in range(options['samples'])]
+        # The current parameters are always evaluated, to compare against.
+        if (SCALING_FACTOR, ADAPTION_STEP) not in candidates:
+            candidates.append((SCALING_FACTOR, ADAPTION_STEP))
+        if any(scaling_factor <= 0 for scaling_factor, _ in candidates):
+            raise CommandError("Scaling factors must be positive.")
+
+        try:
+            league_id = get_league_id(options['league'])
+        except League.DoesNotExist:
+            raise CommandError("There is no league {}.".format(options['league']))
+
+        start = time.perf_counter()
+        history = None
+        if options['snapshot']:
+            try:
+                history = load_history(options['snapshot'])
+            except (OSError, ValueError) as e:
+                raise CommandError("Couldn't load the snapshot: {}".format(e))
+        data = load_replay_data(history, league_id)
+        if len(data['games']) == 0:
+            raise CommandError("There are no games to replay.")
+        self.stdout.write("Loaded {} games of {} players in {:.2f}s. Evaluating {} candidates...".format(
+            len(data['games']), len(data['player_ids']), time.perf_counter() - start, len(candidates)))
+
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=options['workers'],
+                                 initializer=init_worker,
+                                 initargs=(data, get_inactivity_policy(), options['burn_in_weeks'])) as executor:
+            scores = list(executor.map(evaluate_in_worker, candidates,
+                                       chunksize=max(1, len(candidates) // (4 * options['workers']))))
+        self.stdout.write("Evaluated the candidates in {:.2f}s.".format(time.perf_counter() - start))
+        if scores[0]['games_scored'] == 0:
+            raise CommandError("No games were scored. Try fewer burn-in weeks.")
+
+        metric = options['metric']
+        ranked = sorted(zip(candidates, scores), key=lambda candidate: candidate[1][metric])
+        self.stdout.write("{:>15} {:>15} {:>10} {:>12}".format('scaling_factor', 'adaption_step', 'log_loss', 'brier_score'))
+        for (scaling_factor, adaption_step), score in ranked[:options['top']]:
+            current = "  (current)" if (scaling_factor, adaption_step) == (SCALING_FACTOR, ADAPTION_STEP) else ""
+            self.stdout.write("{:>15.1f} {:>15.1f} {:>10.4f} {:>12.4f}{}".format(
+                scaling_factor, adaption_step, score['log_loss'], score['brier_score'], current))
+
+        (best_scaling_factor, best_adaption_step), best_score = ranked[0]
+        self.stdout.write(self.style.SUCCESS(
+            "Best by {} over {} games: scaling_factor={:.1f}, adaption_step={:.1f}".format(
+                metric, best_score['games_scored'], best_scaling_factor, best_adaption_step)))
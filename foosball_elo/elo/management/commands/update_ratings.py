@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from elo.models import League
+from elo.views import apply_rating_updates
+
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import time
+
+
+def update_league(league : League, timestamp : datetime.date) -> tuple[League, float, Exception]:
+    """ Returns the league, how long its update took, and the exception it failed with, if it did.
+    """
+    start = time.perf_counter()
+    try:
+        apply_rating_updates(timestamp, league.id)
+    except Exception as error:
+        return league, time.perf_counter() - start, error
+    return league, time.perf_counter() - start, None
+
+def update_league_in_thread(args : tuple[League, datetime.date]) -> tuple[League, float, Exception]:
+    try:
+        return update_league(*args)
+    finally:
+        # Every thread has its own connection, which nothing else closes.
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = ("Performs the rating update of every league, or of the leagues given, e.g. from cron on each league's "
+            "schedule. Leagues are updated independently of each other, up to --workers at a time, except on "
+            "SQLite, which takes one write at a time. Updates of the same league wait for each other.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', action='append', help="Slug of a league to update. May be repeated.")
+        parser.add_argument('--workers', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 0:
+            raise CommandError("The number of workers must be positive.")
+        leagues = League.objects.all()
+        if options['league']:
+            leagues = leagues.filter(slug__in=options['league'])
+            missing = set(options['league']) - {league.slug for league in leagues}
+            if missing:
+                raise CommandError("There is no league {}.".format(', '.join(sorted(missing))))
+
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            # Concurrent updates would fail with "database is locked" rather than wait for each other.
+            self.stderr.write(self.style.WARNING("SQLite takes one write at a time, so the leagues are updated one by one."))
+            workers = 1
+        timestamp = timezone.now().date()
+        leagues = list(leagues)
+        if workers == 1 or len(leagues) <= 1:
+            results = [update_league(league, timestamp) for league in leagues]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(update_league_in_thread, [(league, timestamp) for league in leagues]))
+        failed = []
+        for league, elapsed, error in results:
+            if error is None:
+                self.stdout.write(self.style.SUCCESS("Updated the ratings of {} in {:.2f}s.".format(league.name, elapsed)))
+            else:
+                failed.append(league.name)
+                self.stderr.write(self.style.ERROR("Updating the ratings of {} failed: {!r}".format(league.name, error)))
+        if failed:
+            raise CommandError("The ratings of {} were not updated.".format(', '.join(failed)))
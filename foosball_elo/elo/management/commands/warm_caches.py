@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from elo.models import League
+from elo.warming import cache_is_shared, warm_caches
+
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = ("Renders the leaderboard, the player list and every player page of every league, or of the leagues "
+            "given, so their cached fragments are in place before the first visitors arrive, e.g. after a deploy "
+            "or a cache flush. Player pages are warmed by up to --workers processes.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--league', action='append', help="Slug of a league to warm. May be repeated.")
+        parser.add_argument('--workers', type=int, default=os.cpu_count())
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 0:
+            raise CommandError("The number of workers must be positive.")
+        leagues = League.objects.all()
+        if options['league']:
+            leagues = leagues.filter(slug__in=options['league'])
+            missing = set(options['league']) - {league.slug for league in leagues}
+            if missing:
+                raise CommandError("There is no league {}.".format(', '.join(sorted(missing))))
+
+        workers = options['workers']
+        if not cache_is_shared():
+            self.stderr.write(self.style.WARNING("The cache is local to each process, so the server won't see what "
+                                                 "this command caches. Configure a shared cache."))
+            workers = 1
+        start = time.perf_counter()
+        results = warm_caches(list(leagues), workers)
+        for result in results:
+            self.stdout.write(self.style.SUCCESS("Warmed {}/{} league pages and {}/{} player pages of {} in {:.2f}s.".format(
+                result['league_pages'], result['league_page_count'], result['player_pages'], result['player_count'],
+                result['league'].name, result['elapsed'])))
+        self.stdout.write("Warmed {}/{} pages in {:.2f}s.".format(
+            sum(result['league_pages'] + result['player_pages'] for result in results),
+            sum(result['league_page_count'] + result['player_count'] for result in results),
+            time.perf_counter() - start))
@@ -0,0 +1,173 @@
+"""
+Proposes the fairest matches among the players available at the table.
+
+A match is fairer the closer the expected outcome of team 1, computed like in
+Game.compute_rating_diffs, is to 0.5. Optionally, matches where players get
+to play the role (defense or attack) they usually play are preferred. All
+matches of the pool are scored with NumPy, a chunk of 4-player combinations
+at a time, until either every combination is scored or the time budget runs
+out.
+"""
+from django.core.cache import cache
+from django.db.models import Count, F
+
+from .models import Player, Game, default_league_id, SCALING_FACTOR
+from .views import with_current_rating
+from .caching import get_league_version
+
+from itertools import combinations, islice
+import time
+
+import numpy as np
+
+
+# Every set of 4 players can be split into two teams in 3 ways.
+TEAM_SPLITS = np.array([[0, 1, 2, 3], [0, 2, 1, 3], [0, 3, 1, 2]])
+COMBINATIONS_PER_CHUNK = 2048
+
+
+#############
+## HELPERS ##
+#############
+
+def compute_defense_shares(league_id : int) -> dict[int, float]:
+    """ Returns the share of games each player of the league has played on defense, not counting games
+        where they played alone.
+    """
+    counts = {}
+    for position, role in [('team_1_defense', 0), ('team_1_attack', 1), ('team_2_defense', 0), ('team_2_attack', 1)]:
+        partner = position.replace('defense', 'attack') if role == 0 else position.replace('attack', 'defense')
+        rows = Game.objects.filter(league_id=league_id) \
+                           .exclude(**{position: F(partner)}) \
+                           .order_by() \
+                           .values_list(position) \
+                           .annotate(games=Count('id'))
+        for player_id, games in rows:
+            counts.setdefault(player_id, [0, 0])[role] += games
+    return {player_id: defense / (defense + attack) for player_id, (defense, attack) in counts.items()}
+
+def get_player_profiles(league_id : int = None) -> dict[int, tuple[str, int, float]]:
+    """ Returns the (name, current rating, defense share) of every player of the league (the default league
+        if not given), cached per league version. Players who haven't played in a team yet have a defense
+        share of 0.5.
+    """
+    league_id = league_id or default_league_id()
+    key = 'elo:player_profiles:{}:{}'.format(league_id, get_league_version(league_id))
+    profiles = cache.get(key)
+    if profiles is None:
+        defense_shares = compute_defense_shares(league_id)
+        profiles = {player.id: (player.player_name, player.current_rating, defense_shares.get(player.id, .5))
+                    for player in with_current_rating(Player.objects.filter(league_id=league_id))}
+        cache.set(key, profiles, None)
+    return profiles
+
+def score_matches(matches : np.ndarray,
+                  ratings : np.ndarray,
+                  defense_shares : np.ndarray,
+                  role_weight : float,
+                  scaling_factor : float) -> tuple[np.ndarray, ...]:
+    """ Scores matches, an array of rows (team 1 player, team 1 player, team 2 player, team 2 player)
+        indexing ratings and defense_shares. Returns the cost of each match (lower is fairer), the
+        expected outcome of team 1, and whether each team's players are to swap roles, i.e.,
+        whether the second player of the team should play defense.
+    """
+    match_ratings = ratings[matches]
+    team_1_rating = .5 * (match_ratings[:, 0] + match_ratings[:, 1])
+    team_2_rating = .5 * (match_ratings[:, 2] + match_ratings[:, 3])
+    expected_outcome = 1 / (1 + 10**((team_2_rating - team_1_rating) / scaling_factor))
+    cost = np.abs(expected_outcome - .5)
+
+    # How much players play out of their usual role, from 0 (always their usual role) to 1.
+    shares = defense_shares[matches]
+    as_listed = shares[:, [1, 3]] + 1 - shares[:, [0, 2]]
+    swapped = shares[:, [0, 2]] + 1 - shares[:, [1, 3]]
+    swap_roles = swapped < as_listed
+    role_cost = .25 * np.minimum(as_listed, swapped).sum(axis=1)
+    return cost + role_weight * role_cost, expected_outcome, swap_roles
+
+def prune_by_fairness(matches : np.ndarray, ratings : np.ndarray, scaling_factor : float, max_cost : float) -> np.ndarray:
+    """ Returns a mask of the matches whose expected outcome alone doesn't make them cost more than max_cost.
+    """
+    match_ratings = ratings[matches]
+    rating_diff = .5 * (match_ratings[:, 2] + match_ratings[:, 3] - match_ratings[:, 0] - match_ratings[:, 1])
+    return np.abs(1 / (1 + 10**(rating_diff / scaling_factor)) - .5) <= max_cost
+
+def find_fairest_matches(ratings : np.ndarray,
+                         defense_shares : np.ndarray,
+                         k : int = 5,
+                         role_weight : float = 0.,
+                         scaling_factor : float = SCALING_FACTOR,
+                         time_budget : float = .05) -> tuple[list[tuple], bool]:
+    """ Returns the k fairest matches among the players given by their ratings and defense shares,
+        fairest first, as (match, cost, expected outcome, swap roles) tuples, and whether all matches
+        were considered within time_budget seconds.
+    """
+    deadline = time.perf_counter() + time_budget
+    best_matches = np.empty((0, 4), dtype=np.intp)
+    best_costs = np.empty(0)
+    player_combinations = combinations(range(len(ratings)), 4)
+    next_chunk = lambda: np.array(list(islice(player_combinations, COMBINATIONS_PER_CHUNK)), dtype=np.intp).reshape(-1, 4)
+    chunk = next_chunk()
+    while len(chunk) > 0:
+        matches = chunk[:, TEAM_SPLITS].reshape(-1, 4)
+        # The role cost can only add to the cost, so matches that are already less fair than
+        # the k best found so far are pruned before scoring them in full.
+        if len(best_costs) == k:
+            matches = matches[prune_by_fairness(matches, ratings, scaling_factor, best_costs.max())]
+        costs = score_matches(matches, ratings, defense_shares, role_weight, scaling_factor)[0]
+        best_matches = np.concatenate([best_matches, matches])
+        best_costs = np.concatenate([best_costs, costs])
+        if len(best_costs) > k:
+            keep = np.argpartition(best_costs, k)[:k]
+            best_matches, best_costs = best_matches[keep], best_costs[keep]
+        chunk = next_chunk()
+        if time.perf_counter() > deadline:
+            break
+    complete = len(chunk) == 0
+
+    order = np.argsort(best_costs, kind='stable')
+    best_matches = best_matches[order]
+    costs, expected_outcomes, swap_roles = score_matches(best_matches, ratings, defense_shares, role_weight, scaling_factor)
+    return list(zip(best_matches.tolist(), costs.tolist(), expected_outcomes.tolist(), swap_roles.tolist())), complete
+
+
+
+#################
+## MATCHMAKING ##
+#################
+
+def propose_matches(player_ids : list[int],
+                    k : int = 5,
+                    respect_roles : bool = False,
+                    time_budget : float = .05,
+                    league_id : int = None) -> dict:
+    """ Proposes the k fairest matches among the players given by player_ids, of the league (the default
+        league if not given). Raises Player.DoesNotExist if any of them isn't a player of the league.
+    """
+    profiles = get_player_profiles(league_id)
+    missing = [player_id for player_id in player_ids if player_id not in profiles]
+    if missing:
+        raise Player.DoesNotExist("No player with id {}".format(missing[0]))
+    ratings = np.array([profiles[player_id][1] for player_id in player_ids], dtype=float)
+    defense_shares = np.array([profiles[player_id][2] for player_id in player_ids])
+
+    matches, complete = find_fairest_matches(ratings, defense_shares, k,
+                                             role_weight=1. if respect_roles else 0., time_budget=time_budget)
+
+    def player_row(idx):
+        player_id = player_ids[idx]
+        return {'id': player_id, 'name': profiles[player_id][0], 'rating': profiles[player_id][1]}
+
+    proposals = []
+    for match, cost, expected_outcome, (swap_team_1, swap_team_2) in matches:
+        team_1 = match[1::-1] if swap_team_1 else match[:2]
+        team_2 = match[:1:-1] if swap_team_2 else match[2:]
+        proposals.append({
+            'team_1_defense': player_row(team_1[0]),
+            'team_1_attack': player_row(team_1[1]),
+            'team_2_defense': player_row(team_2[0]),
+            'team_2_attack': player_row(team_2[1]),
+            'team_1_expected_outcome': expected_outcome,
+            'cost': cost,
+        })
+    return {'matches': proposals, 'complete': complete}
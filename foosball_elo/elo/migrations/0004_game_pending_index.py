@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0003_alter_player_options_alter_playerrating_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(('updates_performed', False)), fields=['date_played', 'id'], name='elo_game_pending_idx'),
+        ),
+    ]
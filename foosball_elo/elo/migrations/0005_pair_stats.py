@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0004_game_pending_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PairStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relation', models.CharField(choices=[('teammate', 'Teammate'), ('opponent', 'Opponent')], max_length=8)),
+                ('games', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0)),
+                ('losses', models.IntegerField(default=0)),
+                ('eggs_dealt', models.IntegerField(default=0)),
+                ('eggs_collected', models.IntegerField(default=0)),
+                ('rating_exchanged', models.IntegerField(default=0, verbose_name='rating exchanged')),
+                ('other_player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elo.player')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_stats', to='elo.player')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['player', 'relation', '-wins', '-games'], name='elo_pairstats_wins_idx'), models.Index(fields=['player', 'relation', '-losses', '-games'], name='elo_pairstats_losses_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pairstats',
+            constraint=models.UniqueConstraint(fields=('player', 'relation', 'other_player'), name='elo_pairstats_unique'),
+        ),
+    ]
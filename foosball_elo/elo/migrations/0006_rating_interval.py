@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-19 04:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0005_pair_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rating', models.IntegerField(verbose_name='replayed rating')),
+                ('lower', models.IntegerField(verbose_name='lower bound')),
+                ('upper', models.IntegerField(verbose_name='upper bound')),
+                ('games', models.IntegerField(verbose_name='games played')),
+                ('confidence', models.FloatField()),
+                ('replicates', models.IntegerField()),
+                ('computed_at', models.DateTimeField(verbose_name='computed at')),
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rating_interval', to='elo.player')),
+            ],
+        ),
+    ]
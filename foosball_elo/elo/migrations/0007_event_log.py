@@ -0,0 +1,109 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# Copied from elo/events.py as it was when the migration was written, as the migration must keep
+# doing the same even as the app changes.
+
+def seed_events(ratings, games):
+    """ The (kind, game id, data) of events that lead to the state of the league given by its ratings,
+        as (player id, timestamp, rating) rows, and its games, as (id, data) pairs, in the order the
+        events would have happened in: games are submitted on the day they are played, and used by
+        the first rating update after that.
+    """
+    timeline = sorted([(data['date_played'], 0, game_id, data) for game_id, data in games] +
+                      [(timestamp.isoformat(), 1, idx, (player_id, timestamp, rating))
+                       for idx, (player_id, timestamp, rating) in enumerate(ratings)],
+                      key=lambda entry: entry[:3])
+    events = []
+    used_games = []
+    for date, is_rating, key, data in timeline:
+        if is_rating:
+            player_id, timestamp, rating = data
+            if used_games:
+                events.append(('ratings_applied', None, {'games': used_games}))
+                used_games = []
+            events.append(('rating_set', None, {'player': player_id, 'timestamp': timestamp.isoformat(), 'rating': rating}))
+        else:
+            events.append(('game_submitted', key, dict(data, updates_performed=False)))
+            if data['updates_performed']:
+                used_games.append(key)
+    if used_games:
+        events.append(('ratings_applied', None, {'games': used_games}))
+    return events
+
+
+def apply_event(state, kind, game_id, data):
+    """ Applies one of the events of seed_events() to state, in place.
+    """
+    ratings, pending_games = state['ratings'], state['pending_games']
+    if kind == 'game_submitted':
+        pending_games[str(game_id)] = data
+    elif kind == 'rating_set':
+        current = ratings.get(str(data['player']))
+        if current is None or data['timestamp'] >= current[0]:
+            ratings[str(data['player'])] = [data['timestamp'], data['rating']]
+    elif kind == 'ratings_applied':
+        for used_game_id in data['games']:
+            pending_games.pop(str(used_game_id), None)
+
+
+def seed_event_log(apps, schema_editor):
+    """ Starts the log with events leading to the current state of the league, see seed_events().
+    """
+    Game = apps.get_model('elo', 'Game')
+    PlayerRating = apps.get_model('elo', 'PlayerRating')
+    LeagueEvent = apps.get_model('elo', 'LeagueEvent')
+    LeagueSnapshot = apps.get_model('elo', 'LeagueSnapshot')
+
+    ratings = PlayerRating.objects.order_by('timestamp', 'id').values_list('player_id', 'timestamp', 'rating')
+    games = []
+    for game in Game.objects.order_by('date_played', 'id') \
+                            .values('id', 'team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack',
+                                    'team_1_score', 'team_2_score', 'date_played', 'updates_performed'):
+        game_id = game.pop('id')
+        game['date_played'] = game['date_played'].isoformat()
+        games.append((game_id, game))
+    events = seed_events(list(ratings), games)
+    if not events:
+        return
+    LeagueEvent.objects.bulk_create([LeagueEvent(kind=kind, game_id=game_id, data=data) for kind, game_id, data in events])
+    state = {'ratings': {}, 'pending_games': {}}
+    for kind, game_id, data in events:
+        apply_event(state, kind, game_id, data)
+    LeagueSnapshot.objects.create(event=LeagueEvent.objects.order_by('id').last(), state=state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0006_rating_interval'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeagueEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('game_submitted', 'Game submitted'), ('game_edited', 'Game edited'), ('game_deleted', 'Game deleted'), ('rating_set', 'Rating set'), ('ratings_applied', 'Ratings applied')], max_length=16)),
+                ('game_id', models.BigIntegerField(blank=True, null=True)),
+                ('data', models.JSONField(default=dict)),
+                ('recorded_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='recorded at')),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='LeagueSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.JSONField()),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='snapshot', to='elo.leagueevent')),
+            ],
+        ),
+        migrations.RunPython(seed_event_log, migrations.RunPython.noop),
+    ]
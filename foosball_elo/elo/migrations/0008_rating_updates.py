@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:16
+
+from django.db import migrations, models
+
+
+# Copied from elo/compaction.py as it was when the migration was written, as the migration must keep
+# doing the same even as the app changes.
+
+def find_update_dates(rows):
+    """ The dates of the rating updates found in (player id, timestamp) rows, ordered by player and timestamp.
+    """
+    dates = set()
+    previous_player_id = None
+    for player_id, timestamp in rows:
+        if player_id == previous_player_id:
+            dates.add(timestamp)
+        previous_player_id = player_id
+    return sorted(dates)
+
+
+def find_redundant_ratings(rows):
+    """ The ids of the ratings of (id, player id, rating) rows, ordered by player and timestamp,
+        that are equal to the player's previous rating.
+    """
+    redundant = []
+    previous_player_id = previous_rating = None
+    for rating_id, player_id, rating in rows:
+        if player_id == previous_player_id and rating == previous_rating:
+            redundant.append(rating_id)
+        previous_player_id, previous_rating = player_id, rating
+    return redundant
+
+
+def compact_rating_history(apps, schema_editor):
+    """ Keeps only the ratings that changed, see elo/compaction.py.
+    """
+    PlayerRating = apps.get_model('elo', 'PlayerRating')
+    RatingUpdate = apps.get_model('elo', 'RatingUpdate')
+    ratings = PlayerRating.objects.order_by('player_id', 'timestamp', 'id')
+    update_dates = find_update_dates(ratings.values_list('player_id', 'timestamp').iterator(chunk_size=2000))
+    RatingUpdate.objects.bulk_create([RatingUpdate(timestamp=date) for date in update_dates], ignore_conflicts=True)
+    redundant = find_redundant_ratings(ratings.values_list('id', 'player_id', 'rating').iterator(chunk_size=2000))
+    for start in range(0, len(redundant), 1000):
+        PlayerRating.objects.filter(pk__in=redundant[start:start + 1000]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0007_event_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingUpdate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateField(unique=True, verbose_name='date')),
+            ],
+            options={
+                'ordering': ['timestamp'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='playerrating',
+            index=models.Index(fields=['player', 'timestamp'], name='elo_rating_player_date_idx'),
+        ),
+        migrations.RunPython(compact_rating_history, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-19 09:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.text
+import elo.models
+
+
+def create_default_league(apps, schema_editor):
+    """ The league every existing player, game and rating update belongs to.
+    """
+    League = apps.get_model('elo', 'League')
+    League.objects.get_or_create(pk=elo.models.default_league_id(), defaults={'name': 'Main', 'slug': 'main'})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0008_rating_updates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='League',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('slug', models.SlugField(unique=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RunPython(create_default_league, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='player',
+            name='league',
+            field=models.ForeignKey(default=elo.models.default_league_id, on_delete=django.db.models.deletion.PROTECT, related_name='players', to='elo.league'),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='league',
+            field=models.ForeignKey(default=elo.models.default_league_id, editable=False, on_delete=django.db.models.deletion.PROTECT, related_name='games', to='elo.league'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='ratingupdate',
+            name='league',
+            field=models.ForeignKey(default=elo.models.default_league_id, on_delete=django.db.models.deletion.PROTECT, related_name='rating_updates', to='elo.league'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='ratingupdate',
+            name='timestamp',
+            field=models.DateField(verbose_name='date'),
+        ),
+        migrations.AddConstraint(
+            model_name='ratingupdate',
+            constraint=models.UniqueConstraint(fields=('league', 'timestamp'), name='elo_ratingupdate_unique'),
+        ),
+        migrations.RemoveIndex(
+            model_name='game',
+            name='elo_game_pending_idx',
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(condition=models.Q(('updates_performed', False)), fields=['league', 'date_played', 'id'], name='elo_game_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['league', 'date_played'], name='elo_game_league_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(models.F('league'), django.db.models.functions.text.Upper('player_name'), name='elo_player_league_name_idx'),
+        ),
+    ]
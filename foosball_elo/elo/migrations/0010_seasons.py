@@ -0,0 +1,90 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0009_leagues'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Season',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('start', models.DateField(verbose_name='first day')),
+                ('end', models.DateField(verbose_name='last day')),
+                ('closed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='closed at')),
+            ],
+            options={
+                'ordering': ['-end'],
+            },
+        ),
+        migrations.AddField(
+            model_name='league',
+            name='season_start',
+            field=models.DateField(blank=True, editable=False, null=True, verbose_name='current season started'),
+        ),
+        migrations.CreateModel(
+            name='SeasonPairStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('relation', models.CharField(choices=[('teammate', 'Teammate'), ('opponent', 'Opponent')], max_length=8)),
+                ('games', models.IntegerField()),
+                ('wins', models.IntegerField()),
+                ('losses', models.IntegerField()),
+                ('eggs_dealt', models.IntegerField()),
+                ('eggs_collected', models.IntegerField()),
+                ('rating_exchanged', models.IntegerField(verbose_name='rating exchanged')),
+                ('other_player', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='elo.player')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='season_pair_stats', to='elo.player')),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_stats', to='elo.season')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='season',
+            name='league',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='seasons', to='elo.league'),
+        ),
+        migrations.CreateModel(
+            name='SeasonStanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.IntegerField()),
+                ('rating', models.IntegerField(verbose_name='final rating')),
+                ('game_count', models.IntegerField(verbose_name='games played')),
+                ('defense_games_count', models.IntegerField(verbose_name='defense games')),
+                ('attack_games_count', models.IntegerField(verbose_name='attack games')),
+                ('single_games_count', models.IntegerField(verbose_name='single games')),
+                ('games_won', models.IntegerField(verbose_name='games won')),
+                ('games_lost', models.IntegerField(verbose_name='games lost')),
+                ('eggs_dealt_count', models.IntegerField(verbose_name='eggs dealt')),
+                ('eggs_collected_count', models.IntegerField(verbose_name='eggs collected')),
+                ('average_opponent_rating', models.FloatField(verbose_name='opponent av. rating')),
+                ('highest_opponent_rating', models.FloatField(verbose_name='highest rated opponent')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='season_standings', to='elo.player')),
+                ('season', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='elo.season')),
+            ],
+            options={
+                'ordering': ['season', 'position'],
+                'indexes': [models.Index(fields=['player', 'season'], name='elo_standing_player_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='seasonstanding',
+            constraint=models.UniqueConstraint(fields=('season', 'player'), name='elo_seasonstanding_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='seasonpairstats',
+            constraint=models.UniqueConstraint(fields=('season', 'player', 'relation', 'other_player'), name='elo_seasonpairstats_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='season',
+            constraint=models.UniqueConstraint(fields=('league', 'name'), name='elo_season_unique_name'),
+        ),
+    ]
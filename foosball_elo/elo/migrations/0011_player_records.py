@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-19 05:53
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0010_seasons'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerRecords',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_game_date', models.DateField(blank=True, null=True)),
+                ('last_game_id', models.BigIntegerField(blank=True, null=True)),
+                ('win_streak', models.IntegerField(default=0)),
+                ('longest_win_streak', models.IntegerField(default=0, verbose_name='longest win streak')),
+                ('egg_streak', models.IntegerField(default=0)),
+                ('longest_egg_streak', models.IntegerField(default=0, verbose_name='longest egg streak')),
+                ('day_game_count', models.IntegerField(default=0)),
+                ('most_games_in_a_day', models.IntegerField(default=0, verbose_name='most games in a day')),
+                ('biggest_upset', models.FloatField(default=0, verbose_name='biggest upset')),
+                ('highest_rating', models.IntegerField(default=0, verbose_name='highest rating ever')),
+                ('biggest_upset_game', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='elo.game')),
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='records', to='elo.player')),
+            ],
+        ),
+    ]
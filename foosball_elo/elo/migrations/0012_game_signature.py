@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:04
+
+from django.db import migrations, models
+
+
+def game_signature(game):
+    """ Copied from elo/models.py as it was when the migration was written, as the migration must keep
+        doing the same even as the app changes.
+    """
+    teams = sorted([(sorted([game.team_1_defense_id, game.team_1_attack_id]), game.team_1_score),
+                    (sorted([game.team_2_defense_id, game.team_2_attack_id]), game.team_2_score)])
+    return '/'.join([game.date_played.isoformat()] + ['{}-{}:{}'.format(*team, score) for team, score in teams])
+
+
+def sign_games(apps, schema_editor):
+    Game = apps.get_model('elo', 'Game')
+    games = list(Game.objects.all())
+    for game in games:
+        game.signature = game_signature(game)
+    Game.objects.bulk_update(games, ['signature'], batch_size=2000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0011_player_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='signature',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(sign_games, migrations.RunPython.noop),
+    ]
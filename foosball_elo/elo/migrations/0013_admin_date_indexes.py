@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0012_game_signature'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['date_played', 'id'], name='elo_game_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='playerrating',
+            index=models.Index(fields=['timestamp', 'id'], name='elo_rating_date_idx'),
+        ),
+    ]
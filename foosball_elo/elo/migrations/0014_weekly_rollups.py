@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0013_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.DateField()),
+                ('game_count', models.IntegerField(default=0)),
+                ('egg_count', models.IntegerField(default=0)),
+                ('rated_game_count', models.IntegerField(default=0)),
+                ('margins', models.JSONField(default=dict)),
+                ('attack_defense_game_count', models.IntegerField(default=0)),
+                ('attack_team_wins', models.IntegerField(default=0)),
+                ('rating_histogram', models.JSONField(blank=True, null=True)),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weekly_rollups', to='elo.league')),
+            ],
+            options={
+                'ordering': ['league', 'week'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyrollup',
+            constraint=models.UniqueConstraint(fields=('league', 'week'), name='elo_weeklyrollup_unique'),
+        ),
+    ]
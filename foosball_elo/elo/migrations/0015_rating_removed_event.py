@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-19 06:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0014_weekly_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='leagueevent',
+            name='kind',
+            field=models.CharField(choices=[('game_submitted', 'Game submitted'), ('game_edited', 'Game edited'), ('game_deleted', 'Game deleted'), ('rating_set', 'Rating set'), ('rating_removed', 'Rating removed'), ('ratings_applied', 'Ratings applied')], max_length=16),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def clear_weekly_rollups(apps, schema_editor):
+    """ Rollups now start on sundays rather than mondays, and the rows of monday weeks would be mixed
+        up with them. `python manage.py rebuild_rollups` recomputes them.
+    """
+    apps.get_model('elo', 'WeeklyRollup').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0015_rating_removed_event'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_weekly_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Copied from elo.engines, as migrations shouldn't depend on the current app code.
+POSITIONS = ['team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack']
+
+
+def event_league_id(game_id : int, data : dict, game_leagues : dict, player_leagues : dict, default_league_id : int) -> int:
+    """ The league of the event's game or player, or the default league if it was deleted since.
+    """
+    for game_id in [game_id] + data.get('games', []):
+        if game_id in game_leagues:
+            return game_leagues[game_id]
+    for player_id in [data.get('player')] + [data.get(position) for position in POSITIONS]:
+        if player_id in player_leagues:
+            return player_leagues[player_id]
+    return default_league_id
+
+
+def assign_events_to_leagues(apps, schema_editor):
+    """ Snapshots held the state of every league, so they are deleted, to be taken again per league
+        as events are recorded.
+    """
+    LeagueEvent = apps.get_model('elo', 'LeagueEvent')
+    game_leagues = dict(apps.get_model('elo', 'Game').objects.values_list('id', 'league_id'))
+    player_leagues = dict(apps.get_model('elo', 'Player').objects.values_list('id', 'league_id'))
+    default_league_id = getattr(settings, 'ELO_DEFAULT_LEAGUE', 1)
+    events = list(LeagueEvent.objects.only('id', 'game_id', 'data'))
+    for event in events:
+        event.league_id = event_league_id(event.game_id, event.data, game_leagues, player_leagues, default_league_id)
+    LeagueEvent.objects.bulk_update(events, ['league'], batch_size=1000)
+    apps.get_model('elo', 'LeagueSnapshot').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elo', '0016_sunday_weekly_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='leagueevent',
+            name='league',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='elo.league'),
+        ),
+        migrations.RunPython(assign_events_to_leagues, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='leagueevent',
+            name='league',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='elo.league'),
+        ),
+        migrations.AddIndex(
+            model_name='leagueevent',
+            index=models.Index(fields=['league', 'id'], name='elo_leagueevent_league_idx'),
+        ),
+    ]
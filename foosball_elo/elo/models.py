@@ -1,52 +1,124 @@
+from django.conf import settings
 from django.db import models
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.contrib import admin
 from django.contrib.auth.models import User
+from django.utils import timezone
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from bisect import bisect_left
+
+
+# Default parameters of the elo rating system, see Game.compute_rating_diffs.
+SCALING_FACTOR = 400
+ADAPTION_STEP = 64
+
+PLAYER_POSITIONS = ['team_1_defense', 'team_1_attack', 'team_2_defense', 'team_2_attack']
+
+
+class MixedLeaguesError(Exception):
+    def __str__(self):
+        return "All players of a game must be in the same league."
+
+
+def rating_at(rating_history: list[tuple[datetime.date, int]], date: datetime.date = None) -> int:
+    """ Returns the rating in effect at the time given by date, or the latest rating if date isn't specified.
+        rating_history is a list of (timestamp, rating) pairs sorted by timestamp.
+        A rating timestamped on the date itself is not yet in effect on that date.
+    """
+    if len(rating_history) == 0:
+        # Can only happen if player was added through admin interface.
+        return 0
+    if date == None:
+        return rating_history[-1][1]
+    # Index of the last rating timestamped strictly before date. If there is none, the
+    # game_date was at some point moved back in time by a user with admin privileges,
+    # and the first rating is used.
+    idx = bisect_left(rating_history, date, key=lambda r: r[0]) - 1
+    return rating_history[max(idx, 0)][1]
+
+def expand_rating_history(ratings : list['PlayerRating'], update_dates : list[datetime.date]) -> list['PlayerRating']:
+    """ Fills in the ratings of the rating updates that left a player's rating unchanged, which aren't
+        stored (see settings.ELO_COMPACT_RATINGS), as if every update had stored a rating.
+        ratings are a player's ratings sorted by timestamp, and update_dates the dates of the updates.
+    """
+    if len(ratings) == 0:
+        return []
+    rating_history = [(r.timestamp, r.rating) for r in ratings]
+    stored = {r.timestamp for r in ratings}
+    filled = [PlayerRating(player_id=ratings[0].player_id, timestamp=date, rating=rating_at(rating_history, date + timedelta(days=1)))
+              for date in update_dates if date > ratings[0].timestamp and date not in stored]
+    return sorted(ratings + filled, key=lambda r: r.timestamp)
+
+def game_signature(game : 'Game') -> str:
+    """ Identifies a game by its date, teams and scores, regardless of who played which position, 
+        or which team was entered first. Games with the same signature are likely duplicates.
+    """
+    # date_played is still a string if the game was created from form data.
+    date_played = Game._meta.get_field('date_played').to_python(game.date_played)
+    teams = sorted([(sorted([game.team_1_defense_id, game.team_1_attack_id]), game.team_1_score),
+                    (sorted([game.team_2_defense_id, game.team_2_attack_id]), game.team_2_score)])
+    return '/'.join([date_played.isoformat()] + ['{}-{}:{}'.format(*team, score) for team, score in teams])
+
+def default_league_id() -> int:
+    """ The id of the league of new players, and of pages and commands that don't ask for a league.
+    """
+    return getattr(settings, 'ELO_DEFAULT_LEAGUE', 1)
+
+def get_league_id(slug : str = None) -> int:
+    """ The id of the league with slug, or of the default league if slug isn't given.
+        Raises League.DoesNotExist if there is no such league.
+    """
+    if not slug:
+        return default_league_id()
+    return League.objects.values_list('id', flat=True).get(slug=slug)
 
 # Create your models here.
+class League(models.Model):
+    """ A separately ranked league, e.g. of one office. Every player, and with them their games and
+        ratings, belongs to one league, whose rating updates are independent of the other leagues'.
+    """
+    name = models.CharField(max_length=50, unique=True)
+    slug = models.SlugField(max_length=50, unique=True)
+    # The first day of the current season, or null until the league's first season is closed (see seasons.py).
+    season_start = models.DateField('current season started', null=True, blank=True, editable=False)
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        ordering = ['name']
+
+
 class Player(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     player_name = models.CharField(max_length=50, unique=True)
+    league = models.ForeignKey(League, on_delete=models.PROTECT, related_name='players', default=default_league_id)
     
     def get_rating(self, date: datetime.date = None) -> int:
         """ Returns player's rating at the time given by date, or latest rating if date isn't specified.
+            Reads only the rating in effect, as rating_at() would pick it from the whole history.
         """
-        player_ratings = self.playerrating_set.all()
-        
-        if len(player_ratings) == 0:
-            # Can only happen if player was added through admin interface.
-            return 0
-        if date == None:
-            # QuerySets don't support negative indexing :'(
-            return player_ratings[len(player_ratings) - 1].rating
-        if len(player_ratings) == 1:
-            return player_ratings[0].rating
-        elif date <= player_ratings[0].timestamp:
-            # Can only happen in case game_date was at some point moved back in time
-            # by a user with admin privileges.
-            return player_ratings[0].rating
-        elif date > player_ratings[len(player_ratings)-1].timestamp:
-            return player_ratings[len(player_ratings)-1].rating
-        
-        # Bisection search for player's rating at the desired time.
-        idx = 0
-        while not (player_ratings[idx].timestamp < date and date <= player_ratings[idx+1].timestamp):
-            if player_ratings[idx].timestamp >= date:
-                idx = int(idx/2)
-            elif date > player_ratings[idx+1].timestamp:
-                idx += int((len(player_ratings) - 1 - idx) / 2)
-            else:
-                raise RuntimeError("This shouldn't happen!")
-            
-        return player_ratings[idx].rating   
+        latest_first = self.playerrating_set.order_by('-timestamp', '-id').values_list('rating', flat=True)
+        if date is not None:
+            rating = latest_first.filter(timestamp__lt=date).first()
+            if rating is not None:
+                return rating
+            # Before the first rating, the first rating is in effect.
+            latest_first = latest_first.reverse()
+        rating = latest_first.first()
+        return rating if rating is not None else 0
     
     def __str__(self):
         return self.player_name
     
     class Meta:
         ordering = [models.functions.Upper('player_name')]    
+        indexes = [
+            # For the players of a league, in the order above.
+            models.Index(models.F('league'), models.functions.Upper('player_name'), name='elo_player_league_name_idx'),
+        ]
 
     
 class Game(models.Model):
@@ -61,6 +133,10 @@ class Game(models.Model):
                                                         MaxValueValidator(10)])
     
     date_played = models.DateField('date played')
+    # The league of the players, see save().
+    league = models.ForeignKey(League, on_delete=models.PROTECT, related_name='games', editable=False)
+    # See game_signature(), which save() keeps up to date.
+    signature = models.CharField(max_length=100, db_index=True, editable=False)
     
     submitted_by = models.ForeignKey(User, on_delete=models.PROTECT)
     
@@ -75,15 +151,22 @@ class Game(models.Model):
         return 0
     
     def compute_rating_diffs(self, 
-                             scaling_factor : int = 400, 
-                             adaption_step : int = 64) -> tuple[int]:
+                             scaling_factor : int = SCALING_FACTOR, 
+                             adaption_step : int = ADAPTION_STEP,
+                             ratings : dict[int, int] = None) -> tuple[int]:
         """ Computes the ratings diffs of both teams based on the outcome of the game.
             Returns a tuple containing rating diffs for team_1 and team_2 in that order.
+            If given, ratings maps player ids to current ratings, which saves looking them up.
             NB: How the rating diff is shared between the two players, should be determined
             by the caller of this method. 
         """
-        team_1_rating = (self.team_1_defense.get_rating() + self.team_1_attack.get_rating()) * .5
-        team_2_rating = (self.team_2_defense.get_rating() + self.team_2_attack.get_rating()) * .5
+        if ratings == None:
+            ratings = {player.id: player.get_rating() for player in [self.team_1_defense, 
+                                                                     self.team_1_attack, 
+                                                                     self.team_2_defense, 
+                                                                     self.team_2_attack]}
+        team_1_rating = (ratings[self.team_1_defense_id] + ratings[self.team_1_attack_id]) * .5
+        team_2_rating = (ratings[self.team_2_defense_id] + ratings[self.team_2_attack_id]) * .5
         
         team_1_expected_outcome = 1 / (1 + 10**((team_2_rating - team_1_rating) / scaling_factor))
         team_2_expected_outcome = 1 / (1 + 10**((team_1_rating - team_2_rating) / scaling_factor))
@@ -94,12 +177,44 @@ class Game(models.Model):
         team_2_diff = adaption_step * (int(winner==2) - team_2_expected_outcome)
         return team_1_diff, team_2_diff
     
-    def get_rating_diff_abs(self):
-        return abs(self.compute_rating_diffs()[0])
+    def get_rating_diff_abs(self, ratings : dict[int, int] = None):
+        return abs(self.compute_rating_diffs(ratings=ratings)[0])
+    
+    def player_league_ids(self) -> set[int]:
+        """ The leagues of the players set on the game, read from the players if they are loaded.
+        """
+        positions = [position for position in PLAYER_POSITIONS if getattr(self, position + '_id') is not None]
+        if all(Game._meta.get_field(position).is_cached(self) for position in positions):
+            return {getattr(self, position).league_id for position in positions}
+        return set(Player.objects.filter(pk__in=[getattr(self, position + '_id') for position in positions])
+                                 .values_list('league_id', flat=True))
+    
+    def clean(self):
+        if len(self.player_league_ids()) > 1:
+            raise ValidationError(str(MixedLeaguesError()))
+    
+    def save(self, *args, **kwargs):
+        # Games are only played within a league, which rating updates rely on.
+        league_ids = self.player_league_ids()
+        if len(league_ids) > 1:
+            raise MixedLeaguesError
+        self.league_id = league_ids.pop()
+        self.signature = game_signature(self)
+        super().save(*args, **kwargs)
     
     class Meta:
         # For ordering most recent to last
         ordering = ['-date_played']
+        indexes = [
+            # For paging through the pending games of a league, most recent first.
+            models.Index(fields=['league', 'date_played', 'id'],
+                         condition=models.Q(updates_performed=False),
+                         name='elo_game_pending_idx'),
+            # For the history of a league.
+            models.Index(fields=['league', 'date_played'], name='elo_game_league_date_idx'),
+            # For the date hierarchy and ordering of the admin, across leagues.
+            models.Index(fields=['date_played', 'id'], name='elo_game_date_idx'),
+        ]
         
 
 class PlayerRating(models.Model):
@@ -112,3 +227,229 @@ class PlayerRating(models.Model):
     
     class Meta:
         ordering = ['player_id', 'timestamp']
+        indexes = [
+            # For reading a player's rating at a date, see Player.get_rating().
+            models.Index(fields=['player', 'timestamp'], name='elo_rating_player_date_idx'),
+            # For the date hierarchy and ordering of the admin.
+            models.Index(fields=['timestamp', 'id'], name='elo_rating_date_idx'),
+        ]
+        
+        
+class RatingUpdate(models.Model):
+    """ The date of a rating update of a league. As ratings an update leaves unchanged aren't stored,
+        these are needed to tell a player's rating after every update (see expand_rating_history).
+    """
+    league = models.ForeignKey(League, on_delete=models.PROTECT, related_name='rating_updates')
+    timestamp = models.DateField('date')
+    
+    class Meta:
+        ordering = ['timestamp']
+        constraints = [
+            models.UniqueConstraint(fields=['league', 'timestamp'], name='elo_ratingupdate_unique'),
+        ]
+        
+        
+class PairStats(models.Model):
+    """ How player has done with other_player as teammate or against them as opponent, 
+        kept up to date as games are submitted, edited and deleted (see pairs.py).
+        Every pair is stored once from each player's point of view.
+    """
+    TEAMMATE = 'teammate'
+    OPPONENT = 'opponent'
+    RELATIONS = [(TEAMMATE, 'Teammate'), (OPPONENT, 'Opponent')]
+    
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='pair_stats')
+    other_player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    relation = models.CharField(max_length=8, choices=RELATIONS)
+    
+    games = models.IntegerField(default=0)
+    wins = models.IntegerField(default=0)
+    losses = models.IntegerField(default=0)
+    eggs_dealt = models.IntegerField(default=0)
+    eggs_collected = models.IntegerField(default=0)
+    # Sum of player's share of the rating diffs of the games, from the ratings in effect when they were played.
+    rating_exchanged = models.IntegerField('rating exchanged', default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['player', 'relation', 'other_player'], name='elo_pairstats_unique'),
+        ]
+        indexes = [
+            # For the top partners and nemeses of a player.
+            models.Index(fields=['player', 'relation', '-wins', '-games'], name='elo_pairstats_wins_idx'),
+            models.Index(fields=['player', 'relation', '-losses', '-games'], name='elo_pairstats_losses_idx'),
+        ]
+        
+        
+class PlayerRecords(models.Model):
+    """ The records of a player, and what it takes to extend them with their next game,
+        kept up to date as games are submitted (see records.py).
+    """
+    player = models.OneToOneField(Player, on_delete=models.CASCADE, related_name='records')
+    # The player's latest game, in the order of date_played and id.
+    last_game_date = models.DateField(null=True, blank=True)
+    last_game_id = models.BigIntegerField(null=True, blank=True)
+    
+    win_streak = models.IntegerField(default=0)
+    longest_win_streak = models.IntegerField('longest win streak', default=0)
+    # Consecutive games won 10-0.
+    egg_streak = models.IntegerField(default=0)
+    longest_egg_streak = models.IntegerField('longest egg streak', default=0)
+    # Games played on last_game_date.
+    day_game_count = models.IntegerField(default=0)
+    most_games_in_a_day = models.IntegerField('most games in a day', default=0)
+    # How much higher the average rating of the team beaten was than the player's team's.
+    biggest_upset = models.FloatField('biggest upset', default=0)
+    biggest_upset_game = models.ForeignKey(Game, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    highest_rating = models.IntegerField('highest rating ever', default=0)
+        
+        
+class RatingInterval(models.Model):
+    """ Bootstrap confidence interval of a player's rating, recomputed nightly by the
+        compute_rating_intervals command, so pages never compute it themselves.
+    """
+    player = models.OneToOneField(Player, on_delete=models.CASCADE, related_name='rating_interval')
+    # The rating replayed from all games, which the interval surrounds.
+    rating = models.IntegerField('replayed rating')
+    lower = models.IntegerField('lower bound')
+    upper = models.IntegerField('upper bound')
+    games = models.IntegerField('games played')
+    confidence = models.FloatField()
+    replicates = models.IntegerField()
+    computed_at = models.DateTimeField('computed at')
+
+    
+class LeagueEvent(models.Model):
+    """ An entry of the append-only log of changes to the state of a league (see events.py).
+    """
+    GAME_SUBMITTED = 'game_submitted'
+    GAME_EDITED = 'game_edited'
+    GAME_DELETED = 'game_deleted'
+    RATING_SET = 'rating_set'
+    RATING_REMOVED = 'rating_removed'
+    RATINGS_APPLIED = 'ratings_applied'
+    KINDS = [(GAME_SUBMITTED, 'Game submitted'), (GAME_EDITED, 'Game edited'), (GAME_DELETED, 'Game deleted'),
+             (RATING_SET, 'Rating set'), (RATING_REMOVED, 'Rating removed'), (RATINGS_APPLIED, 'Ratings applied')]
+    
+    league = models.ForeignKey(League, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=16, choices=KINDS)
+    # Not a foreign key, as the log outlives deleted games.
+    game_id = models.BigIntegerField(null=True, blank=True)
+    data = models.JSONField(default=dict)
+    recorded_at = models.DateTimeField('recorded at', default=timezone.now, db_index=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['league', 'id'], name='elo_leagueevent_league_idx'),
+        ]
+        
+        
+class LeagueSnapshot(models.Model):
+    """ The state of the league of event after it, so states after it are reconstructed without replaying
+        the log from the start (see events.py).
+    """
+    event = models.OneToOneField(LeagueEvent, on_delete=models.CASCADE, related_name='snapshot')
+    state = models.JSONField()
+        
+        
+class Season(models.Model):
+    """ A closed season of a league, whose final standings and statistics are archived
+        in SeasonStanding and SeasonPairStats, and never change again (see seasons.py).
+    """
+    league = models.ForeignKey(League, on_delete=models.PROTECT, related_name='seasons')
+    name = models.CharField(max_length=50)
+    start = models.DateField('first day')
+    end = models.DateField('last day')
+    closed_at = models.DateTimeField('closed at', default=timezone.now)
+    
+    def __str__(self):
+        return self.name
+    
+    class Meta:
+        ordering = ['-end']
+        constraints = [
+            models.UniqueConstraint(fields=['league', 'name'], name='elo_season_unique_name'),
+        ]
+        
+        
+class SeasonStanding(models.Model):
+    """ A player's final position and rating in a season, and their statistics from its games,
+        as get_player_statistics in views.py computes them.
+    """
+    season = models.ForeignKey(Season, on_delete=models.CASCADE, related_name='standings')
+    player = models.ForeignKey(Player, on_delete=models.PROTECT, related_name='season_standings')
+    position = models.IntegerField()
+    rating = models.IntegerField('final rating')
+    
+    game_count = models.IntegerField('games played')
+    defense_games_count = models.IntegerField('defense games')
+    attack_games_count = models.IntegerField('attack games')
+    single_games_count = models.IntegerField('single games')
+    games_won = models.IntegerField('games won')
+    games_lost = models.IntegerField('games lost')
+    eggs_dealt_count = models.IntegerField('eggs dealt')
+    eggs_collected_count = models.IntegerField('eggs collected')
+    average_opponent_rating = models.FloatField('opponent av. rating')
+    highest_opponent_rating = models.FloatField('highest rated opponent')
+    
+    class Meta:
+        ordering = ['season', 'position']
+        constraints = [
+            models.UniqueConstraint(fields=['season', 'player'], name='elo_seasonstanding_unique'),
+        ]
+        indexes = [
+            # For the seasons of a player.
+            models.Index(fields=['player', 'season'], name='elo_standing_player_idx'),
+        ]
+        
+        
+class SeasonPairStats(models.Model):
+    """ PairStats of the games of a season.
+    """
+    season = models.ForeignKey(Season, on_delete=models.CASCADE, related_name='pair_stats')
+    player = models.ForeignKey(Player, on_delete=models.PROTECT, related_name='season_pair_stats')
+    other_player = models.ForeignKey(Player, on_delete=models.PROTECT, related_name='+')
+    relation = models.CharField(max_length=8, choices=PairStats.RELATIONS)
+    
+    games = models.IntegerField()
+    wins = models.IntegerField()
+    losses = models.IntegerField()
+    eggs_dealt = models.IntegerField()
+    eggs_collected = models.IntegerField()
+    rating_exchanged = models.IntegerField('rating exchanged')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['season', 'player', 'relation', 'other_player'], name='elo_seasonpairstats_unique'),
+        ]
+        
+        
+class WeeklyRollup(models.Model):
+    """ What the analytics dashboard shows about the games a league played in a week, and about its ratings
+        after the rating update starting the week, kept up to date as games are submitted and rated (see analytics.py).
+    """
+    league = models.ForeignKey(League, on_delete=models.CASCADE, related_name='weekly_rollups')
+    # The sunday the week starts on.
+    week = models.DateField()
+    
+    # Counted as games are submitted.
+    game_count = models.IntegerField(default=0)
+    egg_count = models.IntegerField(default=0)
+    
+    # Counted as games are rated, from the ratings they are rated with.
+    rated_game_count = models.IntegerField(default=0)
+    # [games, games won by the higher rated team] by margin of victory, which is a string as a JSON key.
+    margins = models.JSONField(default=dict)
+    # Games between a team whose attacker is rated higher than its defender, and a team whose defender is.
+    attack_defense_game_count = models.IntegerField(default=0)
+    attack_team_wins = models.IntegerField(default=0)
+    
+    # Players per rating bucket after the league's last rating update in the week, if any.
+    rating_histogram = models.JSONField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['league', 'week']
+        constraints = [
+            models.UniqueConstraint(fields=['league', 'week'], name='elo_weeklyrollup_unique'),
+        ]
@@ -0,0 +1,118 @@
+"""
+Maintenance of PairStats, the head-to-head and partnership statistics.
+
+Every game adds to the stats of the (up to) 2 teammate pairs and 8 opponent
+pairs it involves, seen from either player. The signals in signals.py add a
+game's contribution when it is submitted, move it when it is edited and
+remove it when it is deleted, so looking up a player's best partners or worst
+nemeses never has to scan the games. The rebuild_pair_stats command
+recomputes everything from scratch, e.g. after bulk imports, which bypass
+the signals.
+"""
+from django.db import transaction
+from django.db.models import F, QuerySet
+
+from .models import Player, Game, PairStats, SeasonPairStats, rating_at
+from .views import get_rating_histories
+
+from collections import defaultdict
+import datetime
+
+
+PAIR_STATS_FIELDS = ['games', 'wins', 'losses', 'eggs_dealt', 'eggs_collected', 'rating_exchanged']
+
+# The fields of Game that PairStats depend on.
+GAME_FIELDS = ['team_1_defense_id', 'team_1_attack_id', 'team_2_defense_id', 'team_2_attack_id', 
+               'team_1_score', 'team_2_score', 'date_played']
+
+PairKey = tuple[int, int, str]
+
+
+def game_player_ids(game : Game) -> set[int]:
+    return {game.team_1_defense_id, game.team_1_attack_id, game.team_2_defense_id, game.team_2_attack_id}
+
+def game_contributions(game : Game,
+                       rating_histories : dict[int, list[tuple[datetime.date, int]]]) -> dict[PairKey, dict[str, int]]:
+    """ Returns what game adds to the stats of each (player_id, other_player_id, relation) pair it involves.
+        rating_histories must contain the rating history of the players of game (see get_rating_histories).
+    """
+    # date_played is still a string if the game was created from form data.
+    date_played = Game._meta.get_field('date_played').to_python(game.date_played)
+    ratings = {player_id: rating_at(rating_histories[player_id], date_played) for player_id in game_player_ids(game)}
+    winner = game.winner()
+    # Games without a winner can only be entered through the admin interface, and don't exchange any rating.
+    team_diffs = game.compute_rating_diffs(ratings=ratings) if winner != 0 else (0, 0)
+    teams = [{game.team_1_defense_id, game.team_1_attack_id}, {game.team_2_defense_id, game.team_2_attack_id}]
+    scores = [game.team_1_score, game.team_2_score]
+
+    contributions = {}
+    for team_idx, team in enumerate(teams):
+        other_team_idx = 1 - team_idx
+        stats = {
+            'games': 1,
+            'wins': int(winner == team_idx + 1),
+            'losses': int(winner == other_team_idx + 1),
+            'eggs_dealt': int(scores[other_team_idx] == 0),
+            'eggs_collected': int(scores[team_idx] == 0),
+            'rating_exchanged': round(team_diffs[team_idx]*.5),
+        }
+        for player_id in team:
+            for teammate_id in team - {player_id}:
+                contributions[(player_id, teammate_id, PairStats.TEAMMATE)] = stats
+            for opponent_id in teams[other_team_idx]:
+                contributions[(player_id, opponent_id, PairStats.OPPONENT)] = stats
+    return contributions
+
+def apply_contributions(contributions : dict[PairKey, dict[str, int]], sign : int):
+    """ Adds (sign=1) or subtracts (sign=-1) contributions to or from the stored stats.
+    """
+    if sign > 0:
+        PairStats.objects.bulk_create([PairStats(player_id=player_id, other_player_id=other_player_id, relation=relation)
+                                       for player_id, other_player_id, relation in contributions],
+                                      ignore_conflicts=True)
+    for (player_id, other_player_id, relation), stats in contributions.items():
+        PairStats.objects.filter(player_id=player_id, other_player_id=other_player_id, relation=relation) \
+                         .update(**{field: F(field) + sign*value for field, value in stats.items()})
+    if sign < 0:
+        player_ids = {player_id for player_id, _, _ in contributions}
+        PairStats.objects.filter(player_id__in=player_ids, games__lte=0).delete()
+
+def record_game(game : Game, sign : int = 1):
+    """ Adds game to (sign=1) or removes it from (sign=-1) the stats.
+    """
+    with transaction.atomic():
+        apply_contributions(game_contributions(game, get_rating_histories(game_player_ids(game))), sign)
+
+def rebuild_pair_stats() -> int:
+    """ Recomputes all stats from the games. Returns the number of pairs.
+    """
+    rating_histories = get_rating_histories(set(Player.objects.values_list('id', flat=True)))
+    totals = defaultdict(lambda: dict.fromkeys(PAIR_STATS_FIELDS, 0))
+    for game in Game.objects.order_by().iterator(chunk_size=2000):
+        for key, stats in game_contributions(game, rating_histories).items():
+            pair_totals = totals[key]
+            for field, value in stats.items():
+                pair_totals[field] += value
+
+    with transaction.atomic():
+        PairStats.objects.all().delete()
+        PairStats.objects.bulk_create([PairStats(player_id=player_id, other_player_id=other_player_id, relation=relation, **stats)
+                                       for (player_id, other_player_id, relation), stats in totals.items()],
+                                      batch_size=2000)
+    return len(totals)
+
+def pair_stats_of(player_id : int, relation : str, season_id : int = None) -> QuerySet[PairStats]:
+    """ Player's stats of relation, from all games, or from the games of the closed season if season_id is given.
+    """
+    pair_stats = PairStats.objects if season_id is None else SeasonPairStats.objects.filter(season_id=season_id)
+    return pair_stats.filter(player_id=player_id, relation=relation).select_related('other_player')
+
+def top_partners(player_id : int, limit : int = 5, season_id : int = None) -> QuerySet[PairStats]:
+    """ The teammates player has won the most games with.
+    """
+    return pair_stats_of(player_id, PairStats.TEAMMATE, season_id).order_by('-wins', '-games')[:limit]
+
+def top_nemeses(player_id : int, limit : int = 5, season_id : int = None) -> QuerySet[PairStats]:
+    """ The opponents player has lost the most games against.
+    """
+    return pair_stats_of(player_id, PairStats.OPPONENT, season_id).order_by('-losses', '-games')[:limit]
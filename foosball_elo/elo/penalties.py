@@ -0,0 +1,131 @@
+"""
+Inactivity penalties, applied when ratings are updated.
+
+A policy gets the ratings of all players, ranked highest first, and which of
+them have played since the last update, and returns the rating diff each
+player gets for (in)activity. The policy in use is set with the
+ELO_INACTIVITY_POLICY setting, e.g.
+
+    ELO_INACTIVITY_POLICY = {
+        "POLICY": "elo.penalties.DecayTowardMeanPolicy",
+        "OPTIONS": {"rate": .05},
+    }
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from itertools import accumulate
+
+import numpy as np
+
+
+class InactivityPolicy:
+
+    def compute_transfers(self, ranked_ratings : list[int], active : list[bool]) -> list[int]:
+        """ Returns the rating diff of every player due to inactivity.
+            ranked_ratings are the current ratings, highest first, and active[i] tells whether
+            the player with rating ranked_ratings[i] has played since the last update.
+        """
+        raise NotImplementedError
+
+    def compute_transfers_batch(self, ranked_ratings : np.ndarray, active : np.ndarray) -> np.ndarray:
+        """ compute_transfers() of every row of ranked_ratings and active, e.g., the leagues of many simulations.
+            Policies override it with a vectorized version.
+        """
+        return np.array([self.compute_transfers(ratings.tolist(), is_active.tolist())
+                         for ratings, is_active in zip(ranked_ratings, active)], dtype=np.int64).reshape(active.shape)
+
+
+class NoPenaltyPolicy(InactivityPolicy):
+
+    def compute_transfers(self, ranked_ratings : list[int], active : list[bool]) -> list[int]:
+        return [0] * len(ranked_ratings)
+
+    def compute_transfers_batch(self, ranked_ratings : np.ndarray, active : np.ndarray) -> np.ndarray:
+        return np.zeros(active.shape, dtype=np.int64)
+
+
+class LowerActivePlayersPolicy(InactivityPolicy):
+    """ An inactive player loses 1 point for each active player ranking below them (but no more than cap),
+        and each of the nearest such players gains 1 point, to keep the total number of points in the
+        league unchanged.
+    """
+
+    def __init__(self, cap : int = 25):
+        self.cap = cap
+
+    def compute_transfers(self, ranked_ratings : list[int], active : list[bool]) -> list[int]:
+        player_count = len(ranked_ratings)
+        # active_above[i] is the number of active players ranking above player i.
+        active_above = list(accumulate(active, initial=0))
+        active_count = active_above[-1]
+
+        transfers = [0] * player_count
+        # Points gained by the active players, indexed by their rank among the active players.
+        # Every inactive player hands out a point to a contiguous range of them, which is
+        # recorded as a difference array, so all transfers are computed in one pass.
+        gain_changes = [0] * (active_count + 1)
+        for idx in range(player_count):
+            if active[idx]:
+                continue
+            first_below = active_above[idx + 1]
+            penalty = min(self.cap, active_count - first_below)
+            transfers[idx] = -penalty
+            gain_changes[first_below] += 1
+            gain_changes[first_below + penalty] -= 1
+
+        gains = accumulate(gain_changes)
+        for idx, gain in zip([idx for idx in range(player_count) if active[idx]], gains):
+            transfers[idx] = gain
+        return transfers
+
+    def compute_transfers_batch(self, ranked_ratings : np.ndarray, active : np.ndarray) -> np.ndarray:
+        row_count, player_count = active.shape
+        # As an inactive player doesn't count itself, active_up_to[i] is the number of active players
+        # ranking above inactive player i, while active_up_to[j] - 1 is the rank of active player j
+        # among the active players.
+        active_up_to = np.cumsum(active, axis=1)
+        active_count = active_up_to[:, -1:]
+        penalties = np.where(active, 0, np.minimum(self.cap, active_count - active_up_to))
+
+        rows, inactive_idx = np.nonzero(~active)
+        first_below = active_up_to[rows, inactive_idx]
+        offsets = rows * (player_count + 1)
+        gain_changes = np.bincount(offsets + first_below, minlength=row_count * (player_count + 1)) \
+                     - np.bincount(offsets + first_below + penalties[rows, inactive_idx], minlength=row_count * (player_count + 1))
+        gains = np.cumsum(gain_changes.reshape(row_count, player_count + 1), axis=1)
+        active_gains = np.take_along_axis(gains, np.maximum(active_up_to - 1, 0), axis=1)
+        return np.where(active, active_gains, -penalties).astype(np.int64)
+
+
+class DecayTowardMeanPolicy(InactivityPolicy):
+    """ An inactive player's rating moves the fraction rate of the way toward the league's mean rating.
+        Unlike LowerActivePlayersPolicy, this doesn't keep the total number of points unchanged.
+    """
+
+    def __init__(self, rate : float = .1):
+        self.rate = rate
+
+    def compute_transfers(self, ranked_ratings : list[int], active : list[bool]) -> list[int]:
+        if len(ranked_ratings) == 0:
+            return []
+        mean_rating = sum(ranked_ratings) / len(ranked_ratings)
+        return [0 if is_active else round(self.rate * (mean_rating - rating))
+                for rating, is_active in zip(ranked_ratings, active)]
+
+    def compute_transfers_batch(self, ranked_ratings : np.ndarray, active : np.ndarray) -> np.ndarray:
+        if ranked_ratings.shape[1] == 0:
+            return np.zeros(active.shape, dtype=np.int64)
+        mean_ratings = ranked_ratings.mean(axis=1, keepdims=True)
+        return np.where(active, 0, np.round(self.rate * (mean_ratings - ranked_ratings))).astype(np.int64)
+
+
+DEFAULT_INACTIVITY_POLICY = {
+    'POLICY': 'elo.penalties.LowerActivePlayersPolicy',
+    'OPTIONS': {'cap': 25},
+}
+
+
+def get_inactivity_policy() -> InactivityPolicy:
+    config = getattr(settings, 'ELO_INACTIVITY_POLICY', DEFAULT_INACTIVITY_POLICY)
+    return import_string(config['POLICY'])(**config.get('OPTIONS', {}))
@@ -0,0 +1,177 @@
+"""
+Maintenance of PlayerRecords, the streaks and records shown on the records page.
+
+Every player's records are the state of a few counters after going through
+their games in the order they were played, by date_played and id. A game
+that is played after all of its players' other games, i.e., every game
+submitted on the day it was played, only has to extend those counters (see
+record_game). Anything else, like backdated games and games that are edited
+or deleted, goes through all games of the players involved again (see
+rebuild_records), in a single pass streamed from the database. Edits and
+deletes rebuild once their transaction commits, once for all the games it
+changed. The records page then reads nothing but the records of the league's
+players.
+"""
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .models import Player, Game, PlayerRating, PlayerRecords, default_league_id, rating_at
+
+from collections import defaultdict
+import threading
+
+
+# The records on the records page, and what they are called there.
+RECORDS = [
+    ('longest_win_streak', 'Longest win streak'),
+    ('longest_egg_streak', 'Longest egg streak'),
+    ('biggest_upset', 'Biggest upset'),
+    ('most_games_in_a_day', 'Most games in a day'),
+    ('highest_rating', 'Highest rating ever'),
+]
+
+STREAM_CHUNK_SIZE = 2000
+GAME_PLAYER_IDS = ['team_1_defense_id', 'team_1_attack_id', 'team_2_defense_id', 'team_2_attack_id']
+
+# Transactions are per thread, and so are the rebuilds waiting for them, see schedule_rebuild().
+scheduled = threading.local()
+
+
+def game_player_ids(game : Game) -> set[int]:
+    return {getattr(game, field) for field in GAME_PLAYER_IDS}
+
+def game_teams(game : Game) -> list[set[int]]:
+    return [{game.team_1_defense_id, game.team_1_attack_id}, {game.team_2_defense_id, game.team_2_attack_id}]
+
+def add_game(records : dict[int, PlayerRecords], game : Game, ratings : dict[int, int]):
+    """ Extends the records of the players of game, which must have been played after their other games.
+        ratings maps the ids of the players to their ratings on the day the game was played.
+    """
+    # date_played is still a string if the game was created from form data.
+    date_played = Game._meta.get_field('date_played').to_python(game.date_played)
+    teams = game_teams(game)
+    scores = [game.team_1_score, game.team_2_score]
+    winner = game.winner()
+    team_ratings = [sum(ratings[player_id] for player_id in team) / len(team) for team in teams]
+    for team_idx, team in enumerate(teams):
+        won = winner == team_idx + 1
+        egg_dealt = won and scores[1 - team_idx] == 0
+        upset = team_ratings[1 - team_idx] - team_ratings[team_idx] if won else 0
+        for player_id in team:
+            player_records = records[player_id]
+            player_records.win_streak = player_records.win_streak + 1 if won else 0
+            player_records.longest_win_streak = max(player_records.longest_win_streak, player_records.win_streak)
+            player_records.egg_streak = player_records.egg_streak + 1 if egg_dealt else 0
+            player_records.longest_egg_streak = max(player_records.longest_egg_streak, player_records.egg_streak)
+            if player_records.last_game_date == date_played:
+                player_records.day_game_count += 1
+            else:
+                player_records.day_game_count = 1
+            player_records.most_games_in_a_day = max(player_records.most_games_in_a_day, player_records.day_game_count)
+            if upset > player_records.biggest_upset:
+                player_records.biggest_upset = upset
+                player_records.biggest_upset_game_id = game.id
+            player_records.last_game_date = date_played
+            player_records.last_game_id = game.id
+
+def game_filter(player_ids : list[int]) -> Q:
+    """ The games played by any of the players.
+    """
+    return (Q(team_1_defense_id__in=player_ids) | Q(team_1_attack_id__in=player_ids) |
+            Q(team_2_defense_id__in=player_ids) | Q(team_2_attack_id__in=player_ids))
+
+def rebuild_records(league_id : int = None, player_ids : set[int] = None) -> int:
+    """ Recomputes the records of the players of the league (the default league if not given) in one pass
+        over its games, or only those of player_ids, from their games. Returns the number of games.
+    """
+    league_id = league_id or default_league_id()
+    players = Player.objects.filter(league_id=league_id)
+    games = Game.objects.filter(league_id=league_id).order_by('date_played', 'id')
+    ratings = PlayerRating.objects.filter(player__league_id=league_id)
+    if player_ids is not None:
+        players = players.filter(id__in=player_ids)
+        games = games.filter(game_filter(list(player_ids)))
+        # Upsets also take the ratings of their teammates and opponents.
+        ratings = PlayerRating.objects.filter(player_id__in={player_id for row in games.values_list(*GAME_PLAYER_IDS)
+                                                             for player_id in row})
+    player_ids = list(players.values_list('id', flat=True))
+    rating_histories = defaultdict(list)
+    for player_id, timestamp, rating in ratings.order_by('player_id', 'timestamp', 'id') \
+                                               .values_list('player_id', 'timestamp', 'rating') \
+                                               .iterator(chunk_size=STREAM_CHUNK_SIZE):
+        rating_histories[player_id].append((timestamp, rating))
+    highest_ratings = dict(PlayerRating.objects.filter(player_id__in=player_ids)
+                                               .values('player_id')
+                                               .annotate(highest=Max('rating'))
+                                               .values_list('player_id', 'highest'))
+    # The records of the other players of the games are only kept track of, not saved.
+    records = defaultdict(PlayerRecords)
+    for player_id in player_ids:
+        records[player_id] = PlayerRecords(player_id=player_id, highest_rating=highest_ratings.get(player_id, 0))
+
+    game_count = 0
+    for game in games.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        ratings = {player_id: rating_at(rating_histories[player_id], game.date_played) for team in game_teams(game) for player_id in team}
+        add_game(records, game, ratings)
+        game_count += 1
+
+    with transaction.atomic():
+        PlayerRecords.objects.filter(player_id__in=player_ids).delete()
+        PlayerRecords.objects.bulk_create([records[player_id] for player_id in player_ids], batch_size=STREAM_CHUNK_SIZE)
+    return game_count
+
+def schedule_rebuild(league_id : int, player_ids : set[int]):
+    """ Rebuilds the records of the players of the league once the current transaction commits, together
+        with every other rebuild scheduled until then, e.g. for every game of a bulk delete.
+    """
+    if not hasattr(scheduled, 'rebuilds'):
+        scheduled.rebuilds = defaultdict(set)
+    scheduled.rebuilds[league_id] |= player_ids
+    transaction.on_commit(rebuild_scheduled)
+
+def rebuild_scheduled():
+    # Only the first callback of a transaction finds anything left to rebuild. Rebuilds scheduled
+    # in transactions that were rolled back are done too, which is harmless.
+    while scheduled.rebuilds:
+        league_id, player_ids = scheduled.rebuilds.popitem()
+        rebuild_records(league_id, player_ids)
+
+def record_game(game : Game):
+    """ Adds a newly submitted game to the records of its players.
+    """
+    date_played = Game._meta.get_field('date_played').to_python(game.date_played)
+    players = {player.id: player for player in [game.team_1_defense, game.team_1_attack, game.team_2_defense, game.team_2_attack]}
+    with transaction.atomic():
+        PlayerRecords.objects.bulk_create([PlayerRecords(player_id=player_id) for player_id in players], ignore_conflicts=True)
+        records = {player_records.player_id: player_records for player_records
+                   in PlayerRecords.objects.select_for_update().filter(player_id__in=players)}
+        if any(player_records.last_game_date is not None and player_records.last_game_date > date_played
+               for player_records in records.values()):
+            # Backdated games change the streaks of their players' games after them.
+            rebuild_records(game.league_id, set(players))
+            return
+        add_game(records, game, {player_id: player.get_rating(date_played) for player_id, player in players.items()})
+        for player_records in records.values():
+            player_records.save()
+
+def record_rating(player_id : int, rating : int):
+    PlayerRecords.objects.bulk_create([PlayerRecords(player_id=player_id)], ignore_conflicts=True)
+    PlayerRecords.objects.filter(player_id=player_id, highest_rating__lt=rating).update(highest_rating=rating)
+
+def get_records(league_id : int = None, limit : int = 5) -> list[dict]:
+    """ Returns the title and the best limit holders of each of RECORDS among the players of the league
+        (the default league if not given), from a single query.
+    """
+    league_records = list(PlayerRecords.objects.filter(player__league_id=league_id or default_league_id())
+                                               .select_related('player', 'biggest_upset_game'))
+    out = []
+    for field, title in RECORDS:
+        holders = sorted([player_records for player_records in league_records if getattr(player_records, field) > 0],
+                         key=lambda player_records: (-getattr(player_records, field), player_records.player.player_name))
+        out.append({'field': field, 'title': title, 'holders': [{
+            'id': player_records.player_id,
+            'name': player_records.player.player_name,
+            'value': round(getattr(player_records, field), 1),
+            'date': player_records.biggest_upset_game.date_played if field == 'biggest_upset' and player_records.biggest_upset_game else None,
+        } for player_records in holders[:limit]]})
+    return out
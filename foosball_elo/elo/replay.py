@@ -0,0 +1,191 @@
+"""
+In-memory replay of the league's game history, for tools that evaluate the
+rating system under different parameters (see the tune_elo command), or
+compare it to other rating engines (see engines.py).
+
+The games are loaded once into a compact NumPy array, and every replay
+applies the semantics of the weekly rating updates to it: all games of a week
+are rated by a rating engine from the state at the start of the week, the
+inactivity penalty is applied, and no rating drops below 100. Weeks run
+from sunday to saturday, as ratings are updated on sundays.
+
+Apart from load_replay_data() without a snapshot, nothing here touches the
+database, so replays can run in worker processes that haven't set up Django
+(see init_worker), or from a snapshot of the history (see columnar.py).
+"""
+from .columnar import query_history, player_indices, to_ordinals
+from .engines import POSITIONS, RatingEngine, EloEngine
+from .penalties import InactivityPolicy
+
+import datetime
+
+import numpy as np
+
+
+MIN_RATING = 100
+
+GAME_DTYPE = np.dtype([
+    ('week', np.int32),
+    ('team_1_defense', np.int32),
+    ('team_1_attack', np.int32),
+    ('team_2_defense', np.int32),
+    ('team_2_attack', np.int32),
+    ('team_1_won', np.bool_),
+])
+
+
+def week_of(date : datetime.date) -> int:
+    # Ordinals divisible by 7 are sundays.
+    return date.toordinal() // 7
+
+def to_replay_games(history : dict[str, np.ndarray]) -> np.ndarray:
+    """ The games of history (see columnar.py) as a GAME_DTYPE array, whose players index history['players'].
+    """
+    games = history['games']
+    replay_games = np.zeros(len(games), dtype=GAME_DTYPE)
+    replay_games['week'] = to_ordinals(games['date_played']) // 7
+    for position in POSITIONS:
+        replay_games[position] = player_indices(history['players'], games[position])
+    replay_games['team_1_won'] = games['team_1_score'] > games['team_2_score']
+    return replay_games
+
+def load_replay_data(history : dict[str, np.ndarray] = None, league_id : int = None) -> dict[str, np.ndarray]:
+    """ Loads every game and the starting point of every player into arrays, from history (see
+        columnar.py), which is queried for the league (the default league if not given) if not given.
+        Players are indexed in the order of the leaderboard's tie breaks, i.e., by name.
+        Returns a dict of
+        - games: a GAME_DTYPE array ordered by week
+        - initial_ratings: the first rating of every player
+        - join_weeks: the week each player's first rating took effect
+        - player_ids: the id of every player
+    """
+    if history is None:
+        history = query_history(league_id=league_id)
+    players, ratings = history['players'], history['ratings']
+
+    initial_ratings = np.zeros(len(players), dtype=np.int64)
+    join_weeks = np.zeros(len(players), dtype=np.int32)
+    # The ratings are ordered by player and timestamp, so a player's first rating is where the player changes.
+    first_ratings = ratings[np.flatnonzero(np.diff(ratings['player_id'], prepend=-1))]
+    first_rated = player_indices(players, first_ratings['player_id'])
+    initial_ratings[first_rated] = first_ratings['rating']
+    join_weeks[first_rated] = to_ordinals(first_ratings['timestamp']) // 7
+    return {
+        'games': to_replay_games(history),
+        'initial_ratings': initial_ratings,
+        'join_weeks': join_weeks,
+        'player_ids': np.array(players['id'], dtype=np.int64),
+    }
+
+def apply_week(engine : RatingEngine,
+               state : np.ndarray,
+               games : np.ndarray,
+               members : np.ndarray,
+               policy : InactivityPolicy,
+               team_1_expected_outcome : np.ndarray = None) -> np.ndarray:
+    """ Returns the state of engine after the update at the end of a week with the given games.
+        members masks the players who had joined the league by then.
+    """
+    ratings = engine.ratings(state)
+    new_state = engine.rate(state, games, team_1_expected_outcome)
+    member_idx = np.flatnonzero(members)
+    # Highest rated first, ties in the order of the players.
+    ranked = member_idx[np.argsort(-ratings[member_idx], kind='stable')]
+    active = np.zeros(len(ratings), dtype=np.bool_)
+    for position in POSITIONS:
+        active[games[position]] = True
+    transfers = np.zeros(len(ratings), dtype=np.int64)
+    transfers[ranked] = policy.compute_transfers(ratings[ranked].tolist(), active[ranked].tolist())
+    new_state = engine.adjust(new_state, transfers, MIN_RATING)
+    new_state[~members] = state[~members]
+    return new_state
+
+def replay_engines(data : dict[str, np.ndarray], engines : list[RatingEngine], policy : InactivityPolicy):
+    """ Replays the games of data (see load_replay_data) a week at a time, with every engine in one pass.
+        Yields the games of each week, and for each engine, the expected outcomes of team 1 in them, 
+        and its states before and after the week's update.
+    """
+    games = data['games']
+    states = [engine.initial_state(data['initial_ratings']) for engine in engines]
+    week_starts = np.flatnonzero(np.diff(games['week'], prepend=games['week'][:1] - 1))
+    for start, end in zip(week_starts, np.append(week_starts[1:], len(games))):
+        week_games = games[start:end]
+        members = data['join_weeks'] <= week_games['week'][0]
+        results = []
+        for engine, state in zip(engines, states):
+            team_1_expected_outcome = engine.expected_outcomes(state, week_games)
+            results.append((team_1_expected_outcome, state,
+                            apply_week(engine, state, week_games, members, policy, team_1_expected_outcome)))
+        yield week_games, results
+        states = [new_state for _, _, new_state in results]
+
+def replay_weeks(data : dict[str, np.ndarray],
+                 scaling_factor : float,
+                 adaption_step : float,
+                 policy : InactivityPolicy):
+    """ Replays the games of data (see load_replay_data) a week at a time with the league's elo. Yields the 
+        games of each week, the expected outcomes of team 1 in them, and the ratings before and after the 
+        week's update.
+    """
+    engine = EloEngine(scaling_factor, adaption_step)
+    for week_games, [(team_1_expected_outcome, state, new_state)] in replay_engines(data, [engine], policy):
+        yield week_games, team_1_expected_outcome, engine.ratings(state), engine.ratings(new_state)
+
+def evaluate_engines(data : dict[str, np.ndarray],
+                     engines : list[RatingEngine],
+                     policy : InactivityPolicy,
+                     burn_in_weeks : int = 0) -> list[dict[str, float]]:
+    """ Scores how well the state of each engine at the start of each week predicts the outcome of that 
+        week's games, by log-loss and Brier score (lower is better). Games of the first burn_in_weeks weeks
+        are replayed but not scored.
+    """
+    games = data['games']
+    first_scored_week = games['week'][0] + burn_in_weeks if len(games) > 0 else 0
+    log_losses, brier_scores = np.zeros(len(engines)), np.zeros(len(engines))
+    games_scored = 0
+    for week_games, results in replay_engines(data, engines, policy):
+        if week_games['week'][0] < first_scored_week:
+            continue
+        outcome = week_games['team_1_won']
+        for idx, (team_1_expected_outcome, _, _) in enumerate(results):
+            probability = np.clip(team_1_expected_outcome, 1e-12, 1 - 1e-12)
+            log_losses[idx] -= np.sum(np.where(outcome, np.log(probability), np.log(1 - probability)))
+            brier_scores[idx] += np.sum((team_1_expected_outcome - outcome)**2)
+        games_scored += len(week_games)
+
+    if games_scored == 0:
+        return [{'log_loss': float('nan'), 'brier_score': float('nan'), 'games_scored': 0} for _ in engines]
+    return [{'log_loss': float(log_loss / games_scored), 
+             'brier_score': float(brier_score / games_scored), 
+             'games_scored': games_scored}
+            for log_loss, brier_score in zip(log_losses, brier_scores)]
+
+def evaluate_parameters(data : dict[str, np.ndarray],
+                        scaling_factor : float,
+                        adaption_step : float,
+                        policy : InactivityPolicy,
+                        burn_in_weeks : int = 0) -> dict[str, float]:
+    """ evaluate_engines() of the league's elo with the given parameters.
+    """
+    return evaluate_engines(data, [EloEngine(scaling_factor, adaption_step)], policy, burn_in_weeks)[0]
+
+
+#############
+## WORKERS ##
+#############
+
+# The replay data of a worker process, loaded once by init_worker() and
+# shared by every candidate the worker evaluates.
+_worker_data = None
+_worker_policy = None
+_worker_burn_in_weeks = 0
+
+def init_worker(data : dict[str, np.ndarray], policy : InactivityPolicy, burn_in_weeks : int):
+    global _worker_data, _worker_policy, _worker_burn_in_weeks
+    _worker_data, _worker_policy, _worker_burn_in_weeks = data, policy, burn_in_weeks
+
+def evaluate_in_worker(parameters : tuple[float, float]) -> dict[str, float]:
+    """ Evaluates (scaling_factor, adaption_step) on the data given to init_worker().
+    """
+    scaling_factor, adaption_step = parameters
+    return evaluate_parameters(_worker_data, scaling_factor, adaption_step, _worker_policy, _worker_burn_in_weeks)
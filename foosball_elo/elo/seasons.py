@@ -0,0 +1,95 @@
+"""
+Closing seasons, and serving their archives.
+
+Closing a season of a league freezes its final standings, the statistics of
+every player's games and the pair stats of the season into SeasonStanding
+and SeasonPairStats, and starts the next season the day after. From then on
+player pages only read the current season's games and ratings (see
+season_ratings in views.py), however long the league's history grows, while
+closed seasons are served from their archives. Games can't be submitted into
+closed seasons, so archives never change, and are cached for good (see
+history.py).
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import League, Player, Game, RatingUpdate, Season, SeasonStanding, SeasonPairStats
+from .caching import bump_league_version
+from .history import query_leaderboard_as_of
+from .pairs import PAIR_STATS_FIELDS, game_contributions, game_player_ids
+from .views import PLAYER_POSITIONS, get_rating_histories, season_games, summarize_player_games
+
+from collections import defaultdict
+import datetime
+
+
+class SeasonError(Exception):
+    pass
+
+
+def summarize_season_games(games : list[Game],
+                           player_ids : list[int],
+                           rating_histories : dict[int, list[tuple[datetime.date, int]]]) -> dict[int, dict[str, int]]:
+    """ Returns the statistics of each player's games, as get_player_statistics in views.py computes them.
+    """
+    games_by_position = {player_id: [set() for _ in PLAYER_POSITIONS] for player_id in player_ids}
+    for game in games:
+        for idx, position in enumerate(PLAYER_POSITIONS):
+            games_by_position[getattr(game, position + '_id')][idx].add(game)
+    # summarize_player_games only needs the id of the player.
+    return {player_id: summarize_player_games(Player(id=player_id), *player_games, rating_histories)
+            for player_id, player_games in games_by_position.items()}
+
+def sum_pair_stats(games : list[Game],
+                   rating_histories : dict[int, list[tuple[datetime.date, int]]]) -> dict[tuple[int, int, str], dict[str, int]]:
+    """ Adds up the contributions of the games to the pair stats (see pairs.py).
+    """
+    totals = defaultdict(lambda: dict.fromkeys(PAIR_STATS_FIELDS, 0))
+    for game in games:
+        for key, stats in game_contributions(game, rating_histories).items():
+            for field, value in stats.items():
+                totals[key][field] += value
+    return totals
+
+def close_season(league_id : int, name : str, end : datetime.date) -> Season:
+    """ Archives the season of the league ending on end (inclusive) as name, and starts the next season.
+        The season's final ratings are those of the last rating update, which must have used all its games
+        and be timestamped no later than end. Raises SeasonError if the season can't be closed.
+    """
+    with transaction.atomic():
+        # Rating updates and other closings of the league wait for this one.
+        league = League.objects.select_for_update().get(pk=league_id)
+        if end > timezone.now().date():
+            raise SeasonError("A season can't end in the future.")
+        if league.season_start is not None and end < league.season_start:
+            raise SeasonError("The current season of {} started on {}.".format(league.name, league.season_start))
+        if Season.objects.filter(league=league, name=name).exists():
+            raise SeasonError("{} already has a season called {}.".format(league.name, name))
+        if RatingUpdate.objects.filter(league=league, timestamp__gt=end).exists():
+            raise SeasonError("The ratings of {} have been updated since {}.".format(league.name, end))
+        games = list(season_games(Game.objects.filter(league=league, date_played__lte=end), league.season_start))
+        if any(not game.updates_performed for game in games):
+            raise SeasonError("The ratings of {} must be updated with all games of the season first.".format(league.name))
+
+        # The final standings are the leaderboard right after the season's last day.
+        leaderboard = query_leaderboard_as_of(end + datetime.timedelta(days=1), league.id)
+        player_ids = {row['id'] for row in leaderboard}.union(*[game_player_ids(game) for game in games])
+        rating_histories = get_rating_histories(player_ids, league.season_start)
+        statistics = summarize_season_games(games, [row['id'] for row in leaderboard], rating_histories)
+
+        start = league.season_start or min([game.date_played for game in games], default=end)
+        season = Season.objects.create(league=league, name=name, start=start, end=end)
+        SeasonStanding.objects.bulk_create([
+            SeasonStanding(season=season, player_id=row['id'], position=row['position'], rating=row['rating'],
+                           **statistics[row['id']])
+            for row in leaderboard
+        ])
+        SeasonPairStats.objects.bulk_create([
+            SeasonPairStats(season=season, player_id=player_id, other_player_id=other_player_id, relation=relation, **stats)
+            for (player_id, other_player_id, relation), stats in sum_pair_stats(games, rating_histories).items()
+        ], batch_size=2000)
+        league.season_start = end + datetime.timedelta(days=1)
+        league.save(update_fields=['season_start'])
+    # The player pages now show the next season.
+    bump_league_version(league.id)
+    return season
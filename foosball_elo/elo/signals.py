@@ -0,0 +1,129 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Player, Game, PlayerRating, LeagueEvent
+from .broadcast import notify_league_change
+from . import analytics, events, pairs, records
+from .caching import bump_league_version, bump_history_version
+
+
+def league_id_of(instance : Player | Game | PlayerRating) -> int:
+    if isinstance(instance, PlayerRating):
+        return instance.player.league_id
+    return instance.league_id
+
+
+@receiver([post_save, post_delete], sender=Game)
+@receiver([post_save, post_delete], sender=PlayerRating)
+@receiver([post_save, post_delete], sender=Player)
+def notify_leaderboard_change(sender, instance, **kwargs):
+    league_id = league_id_of(instance)
+    # Wait for the transaction to commit, so the broadcaster sees the change.
+    transaction.on_commit(lambda: notify_league_change(league_id))
+
+
+@receiver([post_save, post_delete], sender=Game)
+@receiver([post_save, post_delete], sender=PlayerRating)
+@receiver([post_save, post_delete], sender=Player)
+def invalidate_league_caches(sender, instance, **kwargs):
+    # Bumping right away keeps this request from reading its own stale caches, while
+    # bumping again on commit keeps concurrent requests from caching data that is
+    # about to change under the version bumped first.
+    league_id = league_id_of(instance)
+    bump_league_version(league_id)
+    transaction.on_commit(lambda: bump_league_version(league_id))
+
+
+
+@receiver([post_save, post_delete], sender=PlayerRating)
+@receiver([post_save, post_delete], sender=Player)
+def invalidate_leaderboard_history(sender, instance, created : bool = False, **kwargs):
+    # New players and ratings from today's update don't change the past. Anything
+    # else, like renaming a player or editing an old rating, might.
+    if created and (sender is Player or 
+                    PlayerRating._meta.get_field('timestamp').to_python(instance.timestamp) >= timezone.now().date()):
+        return
+    league_id = league_id_of(instance)
+    bump_history_version(league_id)
+    transaction.on_commit(lambda: bump_history_version(league_id))
+
+
+@receiver(pre_save, sender=Game)
+def remember_game_before_edit(sender, instance, **kwargs):
+    instance._pair_stats_previous = Game.objects.filter(pk=instance.pk).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Game)
+def update_pair_stats(sender, instance, **kwargs):
+    previous = getattr(instance, '_pair_stats_previous', None)
+    if previous is not None:
+        if all(getattr(previous, field) == getattr(instance, field) for field in pairs.GAME_FIELDS):
+            return
+        pairs.record_game(previous, -1)
+    pairs.record_game(instance)
+
+
+@receiver(post_delete, sender=Game)
+def remove_game_from_pair_stats(sender, instance, **kwargs):
+    pairs.record_game(instance, -1)
+
+
+@receiver(post_save, sender=Game)
+def update_records(sender, instance, created : bool = False, **kwargs):
+    if created:
+        records.record_game(instance)
+        return
+    previous = getattr(instance, '_pair_stats_previous', None)
+    if previous is None:
+        records.schedule_rebuild(instance.league_id, records.game_player_ids(instance))
+    elif any(getattr(previous, field) != getattr(instance, field) for field in pairs.GAME_FIELDS):
+        records.schedule_rebuild(previous.league_id, records.game_player_ids(previous))
+        records.schedule_rebuild(instance.league_id, records.game_player_ids(instance))
+
+
+@receiver(post_delete, sender=Game)
+def remove_game_from_records(sender, instance, **kwargs):
+    records.schedule_rebuild(instance.league_id, records.game_player_ids(instance))
+
+
+@receiver(post_save, sender=Game)
+def update_weekly_rollups(sender, instance, **kwargs):
+    previous = getattr(instance, '_pair_stats_previous', None)
+    if previous is not None:
+        if analytics.rollup_key(previous) == analytics.rollup_key(instance):
+            return
+        analytics.record_game(previous, -1)
+    analytics.record_game(instance)
+
+
+@receiver(post_delete, sender=Game)
+def remove_game_from_weekly_rollups(sender, instance, **kwargs):
+    analytics.record_game(instance, -1)
+
+
+@receiver(post_save, sender=PlayerRating)
+def update_highest_rating(sender, instance, **kwargs):
+    records.record_rating(instance.player_id, instance.rating)
+
+
+@receiver(post_save, sender=Game)
+def record_game_event(sender, instance, created : bool = False, **kwargs):
+    events.record_event(instance.league_id, LeagueEvent.GAME_SUBMITTED if created else LeagueEvent.GAME_EDITED, 
+                        instance.id, events.game_data(instance))
+
+
+@receiver(post_delete, sender=Game)
+def record_game_deletion(sender, instance, **kwargs):
+    events.record_event(instance.league_id, LeagueEvent.GAME_DELETED, instance.id)
+
+
+@receiver(post_save, sender=PlayerRating)
+def record_rating_event(sender, instance, **kwargs):
+    events.record_event(league_id_of(instance), LeagueEvent.RATING_SET, data=events.rating_data(instance))
+
+
+@receiver(post_delete, sender=PlayerRating)
+def record_rating_removal(sender, instance, **kwargs):
+    events.record_event(league_id_of(instance), LeagueEvent.RATING_REMOVED, data=events.removed_rating_data(instance))
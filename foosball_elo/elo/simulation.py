@@ -0,0 +1,250 @@
+"""
+Monte Carlo simulation of the rest of the season, for the probability of
+each player finishing it in the top 5.
+
+The games of every remaining week are sampled from the recent history: the
+number of games from the recent weekly counts, and the line-ups from the
+recent games, so players who play a lot, and with each other, keep doing so.
+Outcomes are drawn from the elo expected outcomes, and every week ends with
+an update with the same semantics as the real ones (see replay.py). The
+pending games, whose outcomes are known, are part of the first update.
+
+All simulations run at once as rows of NumPy arrays, split into shards that
+can run in separate processes.
+"""
+from django.core.cache import cache
+from django.db import connections
+
+from .caching import get_league_version
+from .columnar import query_history, player_indices
+from .engines import POSITIONS
+from .penalties import InactivityPolicy, get_inactivity_policy
+from .replay import MIN_RATING, to_replay_games, week_of
+
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import logging
+import threading
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Weeks of history the remaining games are sampled from.
+HISTORY_WEEKS = 26
+TOP_N = 5
+DEFAULT_SIMULATIONS = 10000
+# Seconds after which a simulation started by a request is assumed to have died, so another one may start.
+SIMULATION_LOCK_TIMEOUT = 300
+
+
+def get_season_end(date : datetime.date) -> datetime.date:
+    """ The last day of the season date is in. Seasons are calendar years.
+    """
+    return datetime.date(date.year, 12, 31)
+
+def count_remaining_updates(today : datetime.date, season_end : datetime.date) -> int:
+    """ The number of sundays, when ratings are updated, from today to season_end, both included.
+        Ordinals divisible by 7 are sundays.
+    """
+    first_sunday = -(-today.toordinal() // 7)
+    last_sunday = season_end.toordinal() // 7
+    return max(last_sunday - first_sunday + 1, 0)
+
+def load_simulation_inputs(today : datetime.date, 
+                           history : dict[str, np.ndarray] = None, 
+                           league_id : int = None) -> dict[str, np.ndarray]:
+    """ Loads the current ratings, the pending games and the recent history to sample from, from history
+        (see columnar.py), of which only the recent part of the league (the default league if not given)
+        is queried if not given.
+        Players are indexed by name, like in load_replay_data().
+    """
+    first_week = week_of(today) - HISTORY_WEEKS
+    if history is None:
+        history = query_history(games_since=datetime.date.fromordinal(max(first_week * 7, 1)), league_id=league_id)
+    players, ratings = history['players'], history['ratings']
+
+    # The ratings are ordered by player and timestamp, so a player's latest rating is where the player changes.
+    current_ratings = np.zeros(len(players), dtype=np.int64)
+    latest_ratings = ratings[np.flatnonzero(np.diff(ratings['player_id'], append=-1))]
+    current_ratings[player_indices(players, latest_ratings['player_id'])] = latest_ratings['rating']
+
+    games = to_replay_games(history)
+    recent_games = games[games['week'] >= first_week]
+    # Weeks without games count too, so quiet periods lower the expected number of games.
+    weekly_counts = np.bincount(recent_games['week'] - first_week, minlength=HISTORY_WEEKS)[:HISTORY_WEEKS]
+    return {
+        'ratings': current_ratings,
+        'player_ids': np.array(players['id'], dtype=np.int64),
+        'player_names': players['name'].tolist(),
+        'line_ups': np.stack([recent_games[position] for position in POSITIONS], axis=1),
+        'weekly_counts': weekly_counts,
+        'pending_games': games[~history['games']['updates_performed']],
+    }
+
+def simulate_seasons(inputs : dict[str, np.ndarray],
+                     weeks : int,
+                     simulations : int,
+                     rng : np.random.Generator,
+                     scaling_factor : float,
+                     adaption_step : float,
+                     policy : InactivityPolicy) -> np.ndarray:
+    """ Returns the ratings of every player at the end of each simulated season, one row per simulation.
+    """
+    player_count = len(inputs['ratings'])
+    ratings = np.tile(inputs['ratings'], (simulations, 1))
+    line_ups, weekly_counts, pending_games = inputs['line_ups'], inputs['weekly_counts'], inputs['pending_games']
+    pending_line_ups = np.stack([pending_games[position] for position in POSITIONS], axis=1)
+    row_offsets = (np.arange(simulations) * player_count)[:, None]
+
+    for week in range(weeks):
+        game_counts = rng.choice(weekly_counts, size=simulations) if len(line_ups) > 0 else np.zeros(simulations, dtype=int)
+        if week == 0:
+            game_counts = np.maximum(game_counts - len(pending_games), 0)
+        max_game_count = game_counts.max(initial=0)
+        games = line_ups[rng.integers(len(line_ups), size=(simulations, max_game_count))] if max_game_count > 0 \
+                else np.empty((simulations, 0, 4), dtype=np.int64)
+        played = np.arange(max_game_count) < game_counts[:, None]
+        game_ratings = np.take_along_axis(ratings, games.reshape(simulations, -1), axis=1).reshape(games.shape)
+        team_1_rating = .5 * (game_ratings[:, :, 0] + game_ratings[:, :, 1])
+        team_2_rating = .5 * (game_ratings[:, :, 2] + game_ratings[:, :, 3])
+        team_1_expected_outcome = 1 / (1 + 10**((team_2_rating - team_1_rating) / scaling_factor))
+        team_1_won = rng.random(played.shape) < team_1_expected_outcome
+
+        if week == 0 and len(pending_games) > 0:
+            # The pending games are rated from the current ratings, like the sampled ones.
+            pending_ratings = inputs['ratings'][pending_line_ups].astype(float)
+            pending_expected_outcome = 1 / (1 + 10**((.5 * (pending_ratings[:, 2] + pending_ratings[:, 3])
+                                                      - .5 * (pending_ratings[:, 0] + pending_ratings[:, 1])) / scaling_factor))
+            games = np.concatenate([games, np.broadcast_to(pending_line_ups, (simulations,) + pending_line_ups.shape)], axis=1)
+            played = np.concatenate([played, np.ones((simulations, len(pending_games)), dtype=np.bool_)], axis=1)
+            team_1_expected_outcome = np.concatenate(
+                [team_1_expected_outcome, np.broadcast_to(pending_expected_outcome, (simulations, len(pending_games)))], axis=1)
+            team_1_won = np.concatenate(
+                [team_1_won, np.broadcast_to(pending_games['team_1_won'], (simulations, len(pending_games)))], axis=1)
+
+        team_1_diff = adaption_step * (team_1_won - team_1_expected_outcome)
+        shares = np.where(played[:, :, None],
+                          np.stack([np.round(.5 * team_1_diff)] * 2 + [np.round(-.5 * team_1_diff)] * 2, axis=2), 0)
+        flat_players = (games + row_offsets[:, :, None]).ravel()
+        diffs = np.rint(np.bincount(flat_players, weights=shares.ravel(), minlength=simulations * player_count)) \
+                  .astype(np.int64).reshape(simulations, player_count)
+        active = np.bincount(flat_players[np.repeat(played.ravel(), 4)], minlength=simulations * player_count) \
+                   .reshape(simulations, player_count) > 0
+
+        # Highest rated first, ties in the order of the players.
+        ranking = np.argsort(-ratings, axis=1, kind='stable')
+        transfers = policy.compute_transfers_batch(np.take_along_axis(ratings, ranking, axis=1),
+                                                   np.take_along_axis(active, ranking, axis=1))
+        np.put_along_axis(diffs, ranking, np.take_along_axis(diffs, ranking, axis=1) + transfers, axis=1)
+        ratings = np.maximum(ratings + diffs, MIN_RATING)
+    return ratings
+
+def simulate_top_n_counts(inputs : dict[str, np.ndarray],
+                          weeks : int,
+                          simulations : int,
+                          seed : np.random.SeedSequence,
+                          scaling_factor : float,
+                          adaption_step : float,
+                          policy : InactivityPolicy,
+                          top_n : int = TOP_N) -> np.ndarray:
+    """ The number of simulated seasons each player finishes in the top top_n.
+    """
+    ratings = simulate_seasons(inputs, weeks, simulations, np.random.default_rng(seed),
+                               scaling_factor, adaption_step, policy)
+    top_n_players = np.argsort(-ratings, axis=1, kind='stable')[:, :top_n]
+    return np.bincount(top_n_players.ravel(), minlength=ratings.shape[1])
+
+def _simulate_shard(args : tuple) -> np.ndarray:
+    return simulate_top_n_counts(*args)
+
+def compute_top_n_probabilities(inputs : dict[str, np.ndarray],
+                                weeks : int,
+                                simulations : int,
+                                scaling_factor : float,
+                                adaption_step : float,
+                                policy : InactivityPolicy,
+                                workers : int = 1,
+                                seed : int = None,
+                                top_n : int = TOP_N) -> np.ndarray:
+    """ The probability of each player finishing the season in the top top_n, from simulations
+        sharded over workers processes.
+    """
+    shard_sizes = [len(shard) for shard in np.array_split(np.arange(simulations), workers) if len(shard) > 0]
+    seeds = np.random.SeedSequence(seed).spawn(len(shard_sizes))
+    shards = [(inputs, weeks, shard_size, shard_seed, scaling_factor, adaption_step, policy, top_n)
+              for shard_size, shard_seed in zip(shard_sizes, seeds)]
+    if len(shards) == 1:
+        counts = [_simulate_shard(shards[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            counts = list(executor.map(_simulate_shard, shards))
+    return np.sum(counts, axis=0) / simulations
+
+
+def top_n_probabilities_cache_key(today : datetime.date, league_id : int = None) -> str:
+    return 'elo:top_{}_probabilities:{}:{}:{}'.format(TOP_N, get_season_end(today).isoformat(), league_id, 
+                                                      get_league_version(league_id))
+
+def simulate_season(today : datetime.date,
+                    inputs : dict[str, np.ndarray],
+                    simulations : int = DEFAULT_SIMULATIONS,
+                    workers : int = 1) -> dict:
+    """ Simulates the rest of the season from inputs (see load_simulation_inputs).
+    """
+    # Imported here, so worker processes can import this module without setting up Django.
+    from .models import SCALING_FACTOR, ADAPTION_STEP
+
+    weeks = count_remaining_updates(today, get_season_end(today))
+    probabilities = compute_top_n_probabilities(inputs, weeks, simulations, SCALING_FACTOR, ADAPTION_STEP,
+                                                get_inactivity_policy(), workers)
+    return {
+        'season_end': get_season_end(today).isoformat(),
+        'remaining_updates': weeks,
+        'simulations': simulations,
+        'players': sorted([{'id': player_id, 'name': name, 'probability': probability}
+                           for player_id, name, probability 
+                           in zip(inputs['player_ids'].tolist(), inputs['player_names'], probabilities.tolist())],
+                          key=lambda row: -row['probability']),
+    }
+
+def run_season_simulation(today : datetime.date, 
+                          simulations : int = DEFAULT_SIMULATIONS, 
+                          workers : int = 1, 
+                          league_id : int = None) -> dict:
+    """ Simulates the rest of the season of the league (the default league if not given) and caches the
+        result for the current league version.
+    """
+    key = top_n_probabilities_cache_key(today, league_id)
+    result = simulate_season(today, load_simulation_inputs(today, league_id=league_id), simulations, workers)
+    cache.set(key, result, None)
+    return result
+
+def start_season_simulation(today : datetime.date, league_id : int = None) -> bool:
+    """ Runs run_season_simulation() in a background thread, unless any process is already running it for
+        the current version of the league. Returns whether it was started.
+    """
+    lock_key = top_n_probabilities_cache_key(today, league_id) + ':running'
+    if not cache.add(lock_key, True, SIMULATION_LOCK_TIMEOUT):
+        return False
+    threading.Thread(target=_run_season_simulation_in_background, args=(today, league_id, lock_key), daemon=True).start()
+    return True
+
+def _run_season_simulation_in_background(today : datetime.date, league_id : int, lock_key : str):
+    try:
+        run_season_simulation(today, league_id=league_id)
+    except Exception:
+        logger.exception('Simulating the season of league %s failed', league_id)
+    finally:
+        cache.delete(lock_key)
+        connections.close_all()
+
+def get_top_n_probabilities(today : datetime.date, compute : bool = True, league_id : int = None) -> dict:
+    """ The cached result of run_season_simulation() for the current version of the league. If it isn't
+        cached, it is computed in this process if compute is set, or else None is returned.
+    """
+    result = cache.get(top_n_probabilities_cache_key(today, league_id))
+    if result is None and compute:
+        result = run_season_simulation(today, league_id=league_id)
+    return result
@@ -0,0 +1,33 @@
+'use strict';
+{
+    const $ = django.jQuery;
+
+    // Like admin/js/autocomplete.js, but the players are looked up in the league picked on the
+    // form, see PlayerAdmin.get_search_results().
+    $.fn.djangoAdminSelect2 = function() {
+        $.each(this, function(i, element) {
+            $(element).select2({
+                ajax: {
+                    data: (params) => {
+                        return {
+                            term: params.term,
+                            page: params.page,
+                            app_label: element.dataset.appLabel,
+                            model_name: element.dataset.modelName,
+                            field_name: element.dataset.fieldName,
+                            league: document.getElementById('id_player_league').value
+                        };
+                    }
+                }
+            });
+        });
+        return this;
+    };
+
+    $(function() {
+        // Players picked from another league would no longer fit.
+        $('#id_player_league').on('change', function() {
+            $('.admin-autocomplete').val(null).trigger('change');
+        });
+    });
+}
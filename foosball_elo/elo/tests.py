@@ -1,22 +1,64 @@
-from django.test import TestCase
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.management import call_command, CommandError
+from django.http import HttpResponse
+from django.contrib.sessions.backends.db import SessionStore
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 
-from .models import Player, Game, PlayerRating
-from .views import InvalidTeamsError, InvalidScoreError, InvalidDateEror
+from .models import (League, Player, Game, PlayerRating, RatingUpdate, PairStats, RatingInterval, LeagueEvent, LeagueSnapshot, 
+                     PlayerRecords, Season, SeasonStanding, SeasonPairStats, WeeklyRollup, default_league_id, game_signature, SCALING_FACTOR, ADAPTION_STEP,
+                     MixedLeaguesError)
+from .views import (with_current_rating, get_rating_history, get_rating_histories, get_player_statistics, apply_rating_updates, 
+                    InvalidTeamsError, InvalidScoreError, InvalidDateEror, PENDING_GAMES_PAGE_SIZE)
+from .bootstrap import resample_games, compute_rating_intervals
+from .caching import get_league_version, get_history_version, afragment_is_cached
+from .columnar import load_history
+from .events import state_at, state_as_of
+from .history import leaderboard_as_of, movers_between
+from .matchmaking import find_fairest_matches, propose_matches
+from .pairs import PAIR_STATS_FIELDS, rebuild_pair_stats, top_partners, top_nemeses
+from .penalties import LowerActivePlayersPolicy, DecayTowardMeanPolicy, NoPenaltyPolicy, get_inactivity_policy
+from .engines import EloEngine, RoleEloEngine, Glicko2Engine
+from .seasons import SeasonError, close_season
+from .records import RECORDS, rebuild_records, rebuild_scheduled, get_records
+from .replay import GAME_DTYPE, load_replay_data, replay_weeks, replay_engines, evaluate_parameters, evaluate_engines
+from .simulation import count_remaining_updates, load_simulation_inputs, simulate_seasons, compute_top_n_probabilities
+from .broadcast import LeaderboardBroadcaster, compute_leaderboard_snapshot, diff_snapshots
+from .warming import warm_caches, cached_league_pages, cached_player_pages
+from .analytics import week_start, rebuild_rollups, query_dashboard
+from foosball_elo.db_routers import PrimaryReplicaRouter
+from foosball_elo.middleware import ReplicaRoutingMiddleware, PIN_TO_PRIMARY_COOKIE
 
+from asgiref.sync import sync_to_async
+from unittest import mock
+
+import asyncio
 import datetime
+import io
+import itertools
+import json
+import math
+import random
+import tempfile
+import os
+
+import numpy as np
 
 
 #############
 ## HELPERS ##
 #############
 
-def create_player(name : str, rating : int = 400):
+def create_player(name : str, rating : int = 400, league : League = None):
     user = User.objects.create_user(username=name, email="player@player.com", password=name[::-1])
-    player = Player.objects.create(player_name=name, user=user)
+    player = Player.objects.create(player_name=name, user=user, **({'league': league} if league else {}))
     date = timezone.now() - datetime.timedelta(days=7)
     PlayerRating.objects.create(player=player, timestamp=date.date(), rating=rating)
     return player
@@ -169,15 +211,19 @@ class SubmitFormGameTest(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, "Winning team")
         self.assertContains(response, "Losing team")
-        self.assertQuerySetEqual(response.context['all_players_list'], [])
+        self.assertContains(response, reverse('api:player_search'))
     
         
     def test_submit_form_two_players(self):
         playerB = create_player("playerB")
         playerA = create_player("playerA")
-        response = self.client.get(reverse('elo_app:submit_form_game'))
+        # Players are searched for rather than listed, so the form doesn't read them.
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('elo_app:submit_form_game'))
         self.assertEqual(response.status_code, 200)
-        self.assertQuerySetEqual(response.context['all_players_list'], [playerA, playerB])
+        self.assertNotContains(response, playerA.player_name)
+        response = self.client.get(reverse('api:player_search'), {'q': 'PLAY'})
+        self.assertEqual([row['name'] for row in response.json()['objects']], ['playerA', 'playerB'])
         
 
 class SubmitGameTest(TestCase):
@@ -340,6 +386,7 @@ class TestUpdateScores(TestCase):
             player_ratings = player.playerrating_set.all()
             self.assertEqual(len(player_ratings), 1)
             
+    @override_settings(ELO_COMPACT_RATINGS=False)
     def test_update_ratings_no_games_played(self):
         # If a player has played no games since the last update,
         # we should still insert a rating in the PlayerRatings
@@ -415,6 +462,7 @@ class TestUpdateScores(TestCase):
             self.assertEqual(player.get_rating(), expected_ratings[i])
             
         
+    @override_settings(ELO_COMPACT_RATINGS=False)
     def test_player_rating_cannot_drop_below_100(self):
         players, context = create_team()
         for i in range(4):
@@ -461,4 +509,1346 @@ class TestUpdateScores(TestCase):
         create_and_login_superuser(self.client)
         self.client.post(reverse('elo_app:update_ratings'))
         self.assertEqual(inactive_player.get_rating(), 800-25)
+
+    def test_player_with_zero_diff_is_active(self):
+        player = create_player(name='both_teams_player')
+        teammate, opponent = create_player(name='teammate'), create_player(name='opponent')
+        inactive_player = create_player(name='inactive_player', rating=500)
+        create_game(1, player, teammate, opponent, player)
+        create_and_login_superuser(self.client)
+        self.client.post(reverse('elo_app:update_ratings'))
+        self.assertEqual(player.get_rating(), 400+1)
+        self.assertEqual(inactive_player.get_rating(), 500-3)
+
+
+class InactivityPolicyTest(TestCase):
+    
+    def reference_transfers(self, active : list[bool], cap : int) -> list[int]:
+        """ The original quadratic implementation of LowerActivePlayersPolicy.
+        """
+        transfers = [0] * len(active)
+        for idx in range(len(active)):
+            if active[idx]:
+                continue
+            for other_idx in range(idx+1, len(active)):
+                if transfers[idx] <= -cap:
+                    break
+                if active[other_idx]:
+                    transfers[other_idx] += 1
+                    transfers[idx] -= 1
+        return transfers
+    
+    def test_lower_active_players_policy_matches_reference(self):
+        rng = random.Random(0)
+        for cap in [1, 3, 25]:
+            for _ in range(200):
+                active = [rng.random() < .5 for _ in range(rng.randrange(40))]
+                ratings = sorted([rng.randrange(100, 1000) for _ in active], reverse=True)
+                self.assertEqual(LowerActivePlayersPolicy(cap).compute_transfers(ratings, active),
+                                 self.reference_transfers(active, cap))
+                
+    def test_lower_active_players_policy_keeps_total_points(self):
+        active = [i % 3 == 0 for i in range(5000)]
+        transfers = LowerActivePlayersPolicy().compute_transfers(list(range(5000, 0, -1)), active)
+        self.assertEqual(sum(transfers), 0)
+        self.assertEqual(min(transfers), -25)
+        
+    def test_decay_toward_mean_policy(self):
+        transfers = DecayTowardMeanPolicy(rate=.5).compute_transfers([600, 400, 200], [False, True, False])
+        self.assertEqual(transfers, [-100, 0, 100])
+        
+    def test_no_penalty_policy(self):
+        self.assertEqual(NoPenaltyPolicy().compute_transfers([600, 400], [False, True]), [0, 0])
+        
+    @override_settings(ELO_INACTIVITY_POLICY={'POLICY': 'elo.penalties.NoPenaltyPolicy'})
+    def test_policy_is_configurable(self):
+        create_game(1)
+        inactive_player = create_player(name='inactive_player', rating=800)
+        create_and_login_superuser(self.client)
+        self.client.post(reverse('elo_app:update_ratings'))
+        self.assertEqual(inactive_player.get_rating(), 800)
+
+
+@override_settings(REPLICA_DATABASE='replica')
+class ReplicaRoutingTest(TestCase):
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+        
+    def route_request(self, request, model = Player, write : bool = False):
+        """ Returns the database that reads of model are routed to while serving request, and the response.
+        """
+        routed_to = []
+        def get_response(request):
+            routed_to.append(self.router.db_for_read(model))
+            if write:
+                create_player("player")
+            return HttpResponse()
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        return routed_to[0], response
+    
+    def test_reads_outside_views_go_to_primary(self):
+        self.assertEqual(self.router.db_for_read(Player), 'default')
+        self.assertEqual(self.router.db_for_write(Player), 'default')
+        
+    def test_read_views_go_to_replica(self):
+        for url in [reverse('elo_app:index'), reverse('elo_app:all'), reverse('elo_app:player_detail', args=(1,))]:
+            self.assertEqual(self.route_request(self.factory.get(url))[0], 'replica')
+        self.assertEqual(self.router.db_for_read(Player), 'default')
+        
+    def test_sessions_are_read_from_primary(self):
+        request = self.factory.get(reverse('elo_app:index'))
+        self.assertEqual(self.route_request(request, SessionStore.get_model_class())[0], 'default')
+        
+    def test_write_views_go_to_primary(self):
+        for url in [reverse('elo_app:submit_game'), reverse('elo_app:update_ratings')]:
+            self.assertEqual(self.route_request(self.factory.post(url))[0], 'default')
+        self.assertEqual(self.route_request(self.factory.get(reverse('elo_app:submit_form_game')))[0], 'default')
+        
+    def test_write_pins_session_to_primary(self):
+        request = self.factory.post(reverse('elo_app:submit_game'))
+        response = self.route_request(request, write=True)[1]
+        self.assertIn(PIN_TO_PRIMARY_COOKIE, response.cookies)
+        
+    def test_failed_write_does_not_pin_session(self):
+        request = self.factory.post(reverse('elo_app:submit_game'))
+        response = self.route_request(request)[1]
+        self.assertNotIn(PIN_TO_PRIMARY_COOKIE, response.cookies)
+        
+    def test_pinned_session_reads_from_primary(self):
+        request = self.factory.get(reverse('elo_app:index'))
+        request.COOKIES[PIN_TO_PRIMARY_COOKIE] = '1'
+        self.assertEqual(self.route_request(request)[0], 'default')
+
+
+class AsyncViewsTest(TestCase):
+    
+    def setUp(self):
+        players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(6)]
+        create_game(1, *players[:4])
+        create_game(2, *players[2:], date=timezone.now().date() - datetime.timedelta(days=2))
+        self.player = players[2]
+    
+    def test_index_matches_sync_view(self):
+        response = self.client.get(reverse('elo_app:index_async'))
+        sync_response = self.client.get(reverse('elo_app:index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['top_5_list'], sync_response.context['top_5_list'])
+        self.assertQuerySetEqual(response.context['recent_games'], sync_response.context['recent_games'])
+        self.assertContains(response, self.player.player_name)
+        
+    def test_all_matches_sync_view(self):
+        response = self.client.get(reverse('elo_app:all_async'))
+        sync_response = self.client.get(reverse('elo_app:all'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['player_list'], sync_response.context['player_list'])
+        
+    def test_detail_matches_sync_view(self):
+        response = self.client.get(reverse('elo_app:player_detail_async', args=(self.player.id,)))
+        sync_response = self.client.get(reverse('elo_app:player_detail', args=(self.player.id,)))
+        self.assertEqual(response.status_code, 200)
+        for key in ['high_score', 'rating_history']:
+            self.assertEqual(response.context[key], sync_response.context[key])
+        for key in ['game_count', 'games_won', 'games_lost', 'average_opponent_rating', 
+                    'highest_opponent_rating', 'single_games_count']:
+            self.assertEqual(response.context['player_stats'][key], sync_response.context['player_stats'][key])
+        self.assertEqual(response.context['player_stats']['game_count'], 2)
+        
+    def test_detail_no_player(self):
+        response = self.client.get(reverse('elo_app:player_detail_async', args=(100,)))
+        self.assertEqual(response.status_code, 404)
+
+
+class LeaderboardBroadcastTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(5)]
+    
+    def test_no_changes_no_delta(self):
+        self.assertEqual(diff_snapshots(compute_leaderboard_snapshot(), compute_leaderboard_snapshot()), {})
+        
+    def test_submitted_game_delta(self):
+        before = compute_leaderboard_snapshot()
+        game = create_game(1, *self.players[:4])
+        delta = diff_snapshots(before, compute_leaderboard_snapshot())
+        self.assertEqual([row['id'] for row in delta['pending_games']], [game.id])
+        self.assertEqual(delta['pending_diffs'], {self.players[0].id: 20, self.players[1].id: 20, 
+                                                  self.players[2].id: -20, self.players[3].id: -20})
+        self.assertNotIn('ranking', delta)
+        self.assertNotIn('recorded_games', delta)
+        
+    def test_rating_update_delta(self):
+        game = create_game(1, *self.players[:4])
+        before = compute_leaderboard_snapshot()
+        create_and_login_superuser(self.client)
+        self.client.post(reverse('elo_app:update_ratings'))
+        delta = diff_snapshots(before, compute_leaderboard_snapshot())
+        self.assertEqual(delta['recorded_games'], [game.id])
+        self.assertNotIn('pending_games', delta)
+        changed_players = [row['id'] for row in delta['ranking']]
+        self.assertIn(self.players[0].id, changed_players)
+        self.assertEqual(len(delta['ranking']), 5)
+        
+    async def test_broadcaster_pushes_one_delta_per_burst(self):
+        broadcaster = LeaderboardBroadcaster(debounce=0)
+        snapshot, queue = await broadcaster.subscribe()
+        other_queue = (await broadcaster.subscribe())[1]
+        self.assertEqual(len(snapshot['ranking']), 5)
+        
+        await sync_to_async(create_game)(1, *self.players[:4])
+        broadcaster.notify_change()
+        broadcaster.notify_change()
+        delta = await asyncio.wait_for(queue.get(), 5)
+        self.assertEqual(len(delta['pending_games']), 1)
+        self.assertEqual(await asyncio.wait_for(other_queue.get(), 5), delta)
+        await asyncio.sleep(.1)
+        self.assertTrue(queue.empty())
+        
+        broadcaster.unsubscribe(queue)
+        broadcaster.unsubscribe(other_queue)
+        self.assertIsNone(broadcaster.snapshot)
+        
+    async def test_broadcaster_sees_changes_of_other_processes(self):
+        # Not registered with get_broadcaster(), so no signal notifies it, like in a process other than the change's.
+        broadcaster = LeaderboardBroadcaster(debounce=0, poll_interval=.05)
+        queue = (await broadcaster.subscribe())[1]
+        await sync_to_async(create_game)(1, *self.players[:4])
+        delta = await asyncio.wait_for(queue.get(), 5)
+        self.assertEqual(len(delta['pending_games']), 1)
+        broadcaster.unsubscribe(queue)
+        await asyncio.sleep(.1)
+        self.assertIsNone(broadcaster.poll_task)
+        
+    async def test_failed_refresh_is_logged(self):
+        class FailingBroadcaster(LeaderboardBroadcaster):
+            async def refresh(self):
+                raise ValueError('refresh failed')
+        broadcaster = FailingBroadcaster(debounce=0)
+        await broadcaster.subscribe()
+        with self.assertLogs('elo.broadcast', 'ERROR') as logs:
+            broadcaster.notify_change()
+            await asyncio.sleep(.1)
+        self.assertIn('refresh failed', logs.output[0])
+        broadcaster.subscribers.clear()
+        self.assertIsNone(broadcaster.refresh_task)
+        
+    async def test_stream_starts_with_snapshot(self):
+        response = await self.async_client.get(reverse('elo_app:leaderboard_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        event = (await anext(events)).decode()
+        await events.aclose()
+        self.assertTrue(event.startswith('event: snapshot\n'))
+        data = json.loads(event.split('data: ')[1])
+        self.assertEqual([row['name'] for row in data['ranking']], [f'player{i}' for i in range(4, -1, -1)])
+
+
+class FragmentCachingTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(6)]
+        create_game(1, *self.players[:4])
+        
+    def test_league_version_changes_with_league(self):
+        version = get_league_version()
+        self.assertEqual(get_league_version(), version)
+        create_game(2, *self.players[2:])
+        self.assertNotEqual(get_league_version(), version)
+        
+    def test_cache_miss_costs_bounded_number_of_queries(self):
+        for i in range(5):
+            create_game(1, *self.players[2:])
+        # Players, pending games for the diffs, and pending games for the table.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('elo_app:index'))
+        self.assertEqual(response.status_code, 200)
+        
+    def test_cached_pages_need_no_queries(self):
+        for url in [reverse('elo_app:index'), reverse('elo_app:all')]:
+            self.client.get(url)
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertContains(response, self.players[4].player_name)
+            
+    def test_cached_player_stats_are_not_recomputed(self):
+        url = reverse('elo_app:player_detail', args=(self.players[0].id,))
+        first_response = self.client.get(url)
+        # Only the player, as the chart is cached too.
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.content, first_response.content)
+        self.assertContains(response, '<td>1</td>')
+            
+    def test_changes_are_shown(self):
+        self.client.get(reverse('elo_app:index'))
+        player = create_player('new_top_player', 1000)
+        self.assertContains(self.client.get(reverse('elo_app:index')), player.player_name)
+        self.assertContains(self.client.get(reverse('elo_app:index_async')), player.player_name)
+
+        
+    def test_async_views_compute_fragments_evicted_after_check(self):
+        async def evicted_after_check(fragment_name, *vary_on):
+            is_cached = await afragment_is_cached(fragment_name, *vary_on)
+            await cache.adelete(make_template_fragment_key(fragment_name, vary_on))
+            return is_cached
+        
+        # On the index page, the top player is only shown by the leaderboard and player0 by the pending games.
+        expected_contents = {reverse('elo_app:index_async'): [self.players[5].player_name, self.players[0].player_name],
+                             reverse('elo_app:all_async'): [self.players[5].player_name, self.players[0].player_name],
+                             reverse('elo_app:player_detail_async', args=(self.players[0].id,)): ['<td>1</td>']}
+        for url, contents in expected_contents.items():
+            self.client.get(url)
+            with mock.patch('elo.async_views.afragment_is_cached', evicted_after_check):
+                response = self.client.get(url)
+            for content in contents:
+                self.assertContains(response, content)
+
+class PendingGamesPaginationTest(TestCase):
+    
+    def setUp(self):
+        players = [create_player(name=f'player{i}') for i in range(4)]
+        # Several games per day, so pages have to be split within a day.
+        for i in range(PENDING_GAMES_PAGE_SIZE + 5):
+            create_game(1, *players, date=timezone.now().date() - datetime.timedelta(days=i//3))
+        self.pending_games = list(Game.objects.filter(updates_performed=False).order_by('-date_played', '-id'))
+        
+    def test_index_shows_first_page(self):
+        response = self.client.get(reverse('elo_app:index'))
+        self.assertEqual(list(response.context['recent_games']), self.pending_games[:PENDING_GAMES_PAGE_SIZE])
+        self.assertContains(response, 'Load more')
+        
+    def test_load_more(self):
+        response = self.client.get(reverse('elo_app:index'))
+        next_page_url = response.context['recent_games_next_page_url']
+        response = self.client.get(next_page_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['recent_games']), self.pending_games[PENDING_GAMES_PAGE_SIZE:])
+        self.assertNotIn('X-Next-Page', response)
+        
+    def test_load_more_has_next_page(self):
+        first_game = self.pending_games[0]
+        response = self.client.get(reverse('elo_app:pending_games'), 
+                                   {'before_date': first_game.date_played, 'before_id': first_game.id})
+        self.assertEqual(list(response.context['recent_games']), self.pending_games[1:PENDING_GAMES_PAGE_SIZE+1])
+        self.assertIn('X-Next-Page', response)
+        
+    def test_load_more_bad_request(self):
+        response = self.client.get(reverse('elo_app:pending_games'), {'before_date': 'yesterday', 'before_id': 1})
+        self.assertEqual(response.status_code, 400)
+        
+    def test_index_has_fixed_cost(self):
+        # Players, pending games for the diffs, and one page of pending games.
+        with self.assertNumQueries(3):
+            self.client.get(reverse('elo_app:index'))
+
+        
+        
+class HistoricalLeaderboardTest(TestCase):
+    
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        for days_ago, ratings in [(5, [500, 420, 390, 360]), (2, [380, 460, 510, 400])]:
+            for player, rating in zip(self.players, ratings):
+                PlayerRating.objects.create(player=player, timestamp=self.today - datetime.timedelta(days=days_ago), rating=rating)
+        self.late_player = create_player(name='late_player', rating=600)
+        self.late_player.playerrating_set.update(timestamp=self.today - datetime.timedelta(days=3))
+        
+    def test_matches_get_rating(self):
+        for days_ago in range(9):
+            date = self.today - datetime.timedelta(days=days_ago)
+            leaderboard = leaderboard_as_of(date)
+            ratings = {row['id']: row['rating'] for row in leaderboard}
+            for player in Player.objects.all():
+                if player.playerrating_set.filter(timestamp__lt=date).exists():
+                    self.assertEqual(ratings[player.id], player.get_rating(date))
+                else:
+                    self.assertNotIn(player.id, ratings)
+            self.assertEqual([row['position'] for row in leaderboard], list(range(1, len(leaderboard)+1)))
+            self.assertEqual(leaderboard, sorted(leaderboard, key=lambda row: -row['rating']))
+    
+    def test_single_query_and_cached(self):
+        date = self.today - datetime.timedelta(days=1)
+        with self.assertNumQueries(1):
+            leaderboard = leaderboard_as_of(date)
+        with self.assertNumQueries(0):
+            self.assertEqual(leaderboard_as_of(date), leaderboard)
+        self.assertEqual([row['name'] for row in leaderboard], ['late_player', 'player2', 'player1', 'player3', 'player0'])
+            
+    def test_rating_update_keeps_past_cached(self):
+        date = self.today - datetime.timedelta(days=1)
+        leaderboard_as_of(date)
+        create_game(1, *self.players)
+        create_and_login_superuser(self.client)
+        self.client.post(reverse('elo_app:update_ratings'))
+        with self.assertNumQueries(0):
+            leaderboard_as_of(date)
+            
+    def test_editing_past_rating_changes_leaderboard(self):
+        date = self.today - datetime.timedelta(days=1)
+        leaderboard_as_of(date)
+        self.players[0].playerrating_set.filter(rating=380).update(rating=700)
+        PlayerRating.objects.get(player=self.players[0], rating=700).save()
+        self.assertEqual(leaderboard_as_of(date)[0]['name'], 'player0')
+        
+    def test_movers(self):
+        movers = movers_between(self.today - datetime.timedelta(days=4), self.today)
+        # late_player had no rating yet 4 days ago.
+        self.assertEqual([mover['name'] for mover in movers], ['player2', 'player0', 'player1', 'player3'])
+        self.assertEqual((movers[0]['rating_change'], movers[0]['position_change']), (120, 1))
+        self.assertEqual((movers[1]['rating_change'], movers[1]['position_change']), (-120, -4))
+        
+    def test_view(self):
+        response = self.client.get(reverse('elo_app:leaderboard'), 
+                                   {'date': self.today.isoformat(), 
+                                    'compare_to': (self.today - datetime.timedelta(days=4)).isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['leaderboard']), 5)
+        self.assertEqual(len(response.context['movers']), 4)
+        self.assertContains(response, 'Movers since')
+        
+    def test_view_bad_request(self):
+        response = self.client.get(reverse('elo_app:leaderboard'), {'date': 'last week'})
+        self.assertEqual(response.status_code, 400)
+        
+        
+class PairStatsTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(5)]
+        
+    def stored_stats(self) -> dict:
+        return {(s.player_id, s.other_player_id, s.relation): tuple(getattr(s, field) for field in PAIR_STATS_FIELDS)
+                for s in PairStats.objects.all()}
+        
+    def test_submitted_game(self):
+        p = self.players
+        Game.objects.create(team_1_defense=p[0], team_1_attack=p[1], team_2_defense=p[2], team_2_attack=p[3],
+                            team_1_score=10, team_2_score=0, date_played=timezone.now().date(), 
+                            submitted_by=User.objects.all()[0])
+        self.assertEqual(PairStats.objects.filter(relation=PairStats.TEAMMATE).count(), 4)
+        self.assertEqual(PairStats.objects.filter(relation=PairStats.OPPONENT).count(), 8)
+        stats = PairStats.objects.get(player=p[0], other_player=p[2], relation=PairStats.OPPONENT)
+        self.assertEqual((stats.games, stats.wins, stats.losses, stats.eggs_dealt, stats.eggs_collected), (1, 1, 0, 1, 0))
+        self.assertEqual(stats.rating_exchanged, 20)
+        stats = PairStats.objects.get(player=p[3], other_player=p[2], relation=PairStats.TEAMMATE)
+        self.assertEqual((stats.wins, stats.losses, stats.eggs_collected, stats.rating_exchanged), (0, 1, 1, -20))
+        
+    def test_single_player_team(self):
+        create_game(2, self.players[0], self.players[0], self.players[1], self.players[2])
+        self.assertFalse(PairStats.objects.filter(player=self.players[0], relation=PairStats.TEAMMATE).exists())
+        self.assertEqual(PairStats.objects.get(player=self.players[0], other_player=self.players[1]).losses, 1)
+        
+    def test_edit_and_delete(self):
+        game = create_game(1, *self.players[:4])
+        create_game(2, *self.players[:4])
+        game.team_2_attack = self.players[4]
+        game.save()
+        self.assertEqual(PairStats.objects.get(player=self.players[0], other_player=self.players[3]).games, 1)
+        self.assertEqual(PairStats.objects.get(player=self.players[0], other_player=self.players[4]).wins, 1)
+        self.assertEqual(self.stored_stats(), (rebuild_pair_stats(), self.stored_stats())[1])
+        game.delete()
+        self.assertFalse(PairStats.objects.filter(other_player=self.players[4]).exists())
+        self.assertEqual(PairStats.objects.get(player=self.players[0], other_player=self.players[1]).games, 1)
+        
+    def test_incremental_matches_rebuild(self):
+        for i in range(10):
+            create_game(1 + i%2, *[self.players[(i+j) % 5] for j in range(4)], 
+                        date=timezone.now().date() - datetime.timedelta(days=i))
+        incremental_stats = self.stored_stats()
+        self.assertEqual(rebuild_pair_stats(), len(incremental_stats))
+        self.assertEqual(self.stored_stats(), incremental_stats)
+        
+    def test_top_partners_and_nemeses(self):
+        p = self.players
+        create_game(1, p[0], p[1], p[2], p[3])
+        create_game(1, p[0], p[1], p[3], p[4])
+        create_game(1, p[0], p[2], p[1], p[4])
+        create_game(2, p[0], p[3], p[4], p[2])
+        with self.assertNumQueries(1):
+            self.assertEqual([s.other_player for s in top_partners(p[0].id, 2)], [p[1], p[2]])
+        self.assertEqual([s.other_player for s in top_nemeses(p[0].id, 2)], [p[4], p[2]])
+        
+        
+class MatchmakingTest(TestCase):
+    
+    def reference_costs(self, ratings : list[int], role_weight : float = 0., defense_shares : list[float] = None) -> list[float]:
+        """ The costs of all matches, by brute force over every assignment of 4 players to the 4 positions.
+        """
+        defense_shares = defense_shares or [.5] * len(ratings)
+        costs = {}
+        for positions in itertools.permutations(range(len(ratings)), 4):
+            team_1_defense, team_1_attack, team_2_defense, team_2_attack = positions
+            team_1_rating = .5 * (ratings[team_1_defense] + ratings[team_1_attack])
+            team_2_rating = .5 * (ratings[team_2_defense] + ratings[team_2_attack])
+            expected_outcome = 1 / (1 + 10**((team_2_rating - team_1_rating) / 400))
+            role_cost = .25 * (2 - defense_shares[team_1_defense] - defense_shares[team_2_defense] 
+                               + defense_shares[team_1_attack] + defense_shares[team_2_attack])
+            teams = frozenset([frozenset([team_1_defense, team_1_attack]), frozenset([team_2_defense, team_2_attack])])
+            cost = abs(expected_outcome - .5) + role_weight * role_cost
+            costs[teams] = min(cost, costs.get(teams, cost))
+        return sorted(costs.values())
+    
+    def test_matches_brute_force(self):
+        rng = random.Random(0)
+        for role_weight in [0., 1.]:
+            for pool_size in range(4, 9):
+                ratings = [rng.randrange(100, 1000) for _ in range(pool_size)]
+                defense_shares = [rng.random() for _ in range(pool_size)]
+                matches, complete = find_fairest_matches(np.array(ratings, dtype=float), np.array(defense_shares), 
+                                                         k=5, role_weight=role_weight)
+                self.assertTrue(complete)
+                self.assertEqual(len(matches), min(5, 3 * math.comb(pool_size, 4)))
+                for (match, cost, _, _), expected_cost in zip(matches, self.reference_costs(ratings, role_weight, defense_shares)):
+                    self.assertAlmostEqual(cost, expected_cost)
+                
+    def test_time_budget(self):
+        ratings = np.arange(100, 1100, 10, dtype=float)
+        matches, complete = find_fairest_matches(ratings, np.full(len(ratings), .5), k=3, time_budget=0)
+        self.assertFalse(complete)
+        self.assertEqual(len(matches), 3)
+        
+    def test_respects_roles(self):
+        players = [create_player(name=f'player{i}') for i in range(4)]
+        # Players 0 and 2 always play defense, 1 and 3 always attack.
+        create_game(1, *players)
+        create_game(2, *players)
+        proposal = propose_matches([p.id for p in reversed(players)], k=1, respect_roles=True)['matches'][0]
+        self.assertEqual({proposal['team_1_defense']['id'], proposal['team_2_defense']['id']}, {players[0].id, players[2].id})
+        self.assertEqual(proposal['cost'], 0)
+        
+    def test_api(self):
+        players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(6)]
+        response = self.client.get(reverse('api:matchmaking'), {'players': ','.join(str(p.id) for p in players), 'k': 2})
+        self.assertEqual(response.status_code, 200)
+        matches = response.json()['matches']
+        self.assertEqual(len(matches), 2)
+        self.assertEqual(matches[0]['team_1_expected_outcome'], .5)
+        self.assertTrue(response.json()['complete'])
+        
+    def test_api_bad_request(self):
+        players = [create_player(name=f'player{i}') for i in range(4)]
+        for player_ids in [[p.id for p in players[:3]], [players[0].id] * 4, 'a,b,c,d']:
+            response = self.client.get(reverse('api:matchmaking'), {'players': player_ids if isinstance(player_ids, str) 
+                                                                    else ','.join(map(str, player_ids))})
+            self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('api:matchmaking'), {'players': ','.join(str(1000+i) for i in range(4))})
+        self.assertEqual(response.status_code, 404)
+        
+        
+class ReplayTest(TestCase):
+    
+    def setUp(self):
+        call_command('generate_league', players=8, weeks=6, games_per_week=10, stdout=io.StringIO())
+        
+    def test_replay_matches_rating_updates(self):
+        data = load_replay_data()
+        self.assertEqual(len(data['games']), 60)
+        for _, _, _, ratings in replay_weeks(data, SCALING_FACTOR, ADAPTION_STEP, get_inactivity_policy()):
+            pass
+        current_ratings = {p.id: p.current_rating for p in with_current_rating(Player.objects.all())}
+        self.assertEqual(dict(zip(data['player_ids'].tolist(), ratings.tolist())), current_ratings)
+        
+    def test_evaluate_parameters(self):
+        data = load_replay_data()
+        score = evaluate_parameters(data, SCALING_FACTOR, ADAPTION_STEP, get_inactivity_policy(), burn_in_weeks=2)
+        self.assertEqual(score['games_scored'], 40)
+        self.assertLess(score['brier_score'], score['log_loss'])
+        self.assertGreater(score['brier_score'], 0)
+        
+    def test_tune_elo(self):
+        out = io.StringIO()
+        call_command('tune_elo', search='random', samples=4, workers=2, burn_in_weeks=1, stdout=out)
+        self.assertIn('(current)', out.getvalue())
+        self.assertIn('Best by log_loss over 50 games', out.getvalue())
+        with self.assertRaisesMessage(CommandError, "The number of workers must be positive."):
+            call_command('tune_elo', workers=0, stdout=out)
+        
+        
+class RatingEngineTest(TestCase):
+    
+    def setUp(self):
+        call_command('generate_league', players=8, weeks=6, games_per_week=10, stdout=io.StringIO())
+        self.engines = [EloEngine(SCALING_FACTOR, ADAPTION_STEP), RoleEloEngine(SCALING_FACTOR, ADAPTION_STEP), Glicko2Engine()]
+        
+    def test_engines_in_one_pass(self):
+        data = load_replay_data()
+        with self.assertNumQueries(0):
+            for _, results in replay_engines(data, self.engines, get_inactivity_policy()):
+                pass
+            scores = evaluate_engines(data, self.engines, get_inactivity_policy(), burn_in_weeks=2)
+        current_ratings = {p.id: p.current_rating for p in with_current_rating(Player.objects.all())}
+        elo_ratings = self.engines[0].ratings(results[0][2])
+        self.assertEqual(dict(zip(data['player_ids'].tolist(), elo_ratings.tolist())), current_ratings)
+        self.assertEqual(scores[0], evaluate_parameters(data, SCALING_FACTOR, ADAPTION_STEP, get_inactivity_policy(), burn_in_weeks=2))
+        for engine, score in zip(self.engines, scores):
+            self.assertEqual(score['games_scored'], 40)
+            self.assertTrue(math.isfinite(score['log_loss']))
+            
+    def test_role_elo(self):
+        engine = self.engines[1]
+        state = engine.initial_state(np.array([500, 500, 500, 500]))
+        games = np.array([(0, 0, 1, 2, 3, True)], dtype=GAME_DTYPE)
+        state = engine.rate(state, games)
+        self.assertEqual(state['defense'].tolist(), [516, 500, 484, 500])
+        self.assertEqual(state['attack'].tolist(), [500, 516, 500, 484])
+        self.assertEqual(engine.ratings(state).tolist(), [508, 508, 492, 492])
+        
+    def test_glicko2_example(self):
+        # The example of Glickman's paper, where player 0 plays 3 games alone against players 1 to 3.
+        engine = self.engines[2]
+        state = engine.initial_state(np.array([1500, 1400, 1550, 1700]))
+        state['deviation'] = [200, 30, 100, 300]
+        games = np.array([(0, 0, 0, 1, 1, True), (0, 0, 0, 2, 2, False), (0, 0, 0, 3, 3, False)], dtype=GAME_DTYPE)
+        state = engine.rate(state, games)
+        self.assertAlmostEqual(state['rating'][0], 1464.06, places=1)
+        self.assertAlmostEqual(state['deviation'][0], 151.52, places=1)
+        self.assertAlmostEqual(state['volatility'][0], .05999, places=4)
+        
+    def test_compare_engines(self):
+        out = io.StringIO()
+        call_command('compare_engines', burn_in_weeks=1, stdout=out)
+        for name in ['elo', 'role_elo', 'glicko2']:
+            self.assertIn(name, out.getvalue())
+        
+        
+class ColumnarHistoryTest(TestCase):
+    
+    def setUp(self):
+        call_command('generate_league', players=8, weeks=6, games_per_week=10, stdout=io.StringIO())
+        create_game(1, *Player.objects.all()[:4])
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.paths = [os.path.join(self.directory.name, 'history.npz'), os.path.join(self.directory.name, 'history')]
+        for path in self.paths:
+            call_command('export_history', path, stdout=io.StringIO())
+        
+    def test_snapshot_matches_database(self):
+        data = load_replay_data()
+        inputs = load_simulation_inputs(timezone.now().date())
+        for path in self.paths:
+            with self.assertNumQueries(0):
+                history = load_history(path)
+                snapshot_data = load_replay_data(history)
+                snapshot_inputs = load_simulation_inputs(timezone.now().date(), history)
+            self.assertIsInstance(history['games'], np.memmap)
+            self.assertEqual(len(history['games']), 61)
+            for name in data:
+                self.assertTrue(np.array_equal(snapshot_data[name], data[name]), name)
+            for name in inputs:
+                self.assertTrue(np.array_equal(snapshot_inputs[name], inputs[name]), name)
+                
+    def test_commands_run_from_snapshot(self):
+        out = io.StringIO()
+        call_command('compare_engines', burn_in_weeks=1, snapshot=self.paths[0], stdout=out)
+        self.assertIn('Replayed 61 games', out.getvalue())
+        call_command('simulate_season', simulations=100, workers=1, snapshot=self.paths[1], stdout=out)
+        self.assertIn('Simulated 100 seasons', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('tune_elo', snapshot=os.path.join(self.directory.name, 'missing'), stdout=out)
+        
+        
+class SeasonSimulationTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(8)]
+        self.today = timezone.now().date()
+        
+    def test_count_remaining_updates(self):
+        self.assertEqual(count_remaining_updates(datetime.date(2023, 12, 24), datetime.date(2023, 12, 31)), 2)
+        self.assertEqual(count_remaining_updates(datetime.date(2023, 12, 25), datetime.date(2023, 12, 31)), 1)
+        self.assertEqual(count_remaining_updates(datetime.date(2023, 12, 25), datetime.date(2023, 12, 30)), 0)
+        
+    def test_first_update_matches_rating_update(self):
+        create_game(1, *self.players[:4])
+        create_game(2, *self.players[4:])
+        inputs = load_simulation_inputs(self.today)
+        # Without any history to sample from, the first update only has the pending games.
+        inputs['weekly_counts'] = np.zeros(1, dtype=int)
+        ratings = simulate_seasons(inputs, 1, 3, np.random.default_rng(0), SCALING_FACTOR, ADAPTION_STEP, get_inactivity_policy())
+        create_and_login_superuser(self.client)
+        self.client.post(reverse('elo_app:update_ratings'))
+        current_ratings = {p.id: p.current_rating for p in with_current_rating(Player.objects.all())}
+        for row in ratings:
+            self.assertEqual(dict(zip(inputs['player_ids'].tolist(), row.tolist())), current_ratings)
+            
+    def test_probabilities(self):
+        for i in range(20):
+            create_game(1 + i%2, *[self.players[(i+j) % 8] for j in range(4)], date=self.today - datetime.timedelta(days=i))
+        inputs = load_simulation_inputs(self.today)
+        inputs['ratings'][-1] = 3000
+        for workers in [1, 2]:
+            probabilities = compute_top_n_probabilities(inputs, 10, 1000, SCALING_FACTOR, ADAPTION_STEP, 
+                                                        get_inactivity_policy(), workers=workers, seed=0)
+            self.assertAlmostEqual(probabilities.sum(), 5)
+            self.assertEqual(probabilities[-1], 1)
+            self.assertTrue(((probabilities > 0) & (probabilities < 1)).any())
+            
+    def test_api_is_cached(self):
+        # Run in the background on a miss, once for all requests.
+        with mock.patch('elo.simulation.threading.Thread') as thread:
+            for _ in range(2):
+                self.assertEqual(self.client.get(reverse('api:top_5_probabilities')).status_code, 202)
+        thread.assert_called_once()
+        thread.call_args.kwargs['target'](*thread.call_args.kwargs['args'])
+        response = self.client.get(reverse('api:top_5_probabilities'))
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(sum(row['probability'] for row in response.json()['players']), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('api:top_5_probabilities')).json(), response.json())
+        response = self.client.get(reverse('elo_app:player_detail', args=(self.players[-1].id,)))
+        self.assertContains(response, 'Chance of finishing the season in the top 5')
+
+        
+        
+class RatingIntervalTest(TestCase):
+    
+    def setUp(self):
+        call_command('generate_league', players=8, weeks=6, games_per_week=10, stdout=io.StringIO())
+        
+    def test_resample_games_keeps_weeks(self):
+        games = load_replay_data()['games']
+        resampled = resample_games(games, np.random.default_rng(0))
+        self.assertEqual(resampled['week'].tolist(), games['week'].tolist())
+        self.assertFalse(np.array_equal(resampled, games))
+        
+    def test_intervals_contain_rating(self):
+        data = load_replay_data()
+        intervals = compute_rating_intervals(data, SCALING_FACTOR, ADAPTION_STEP, get_inactivity_policy(), 
+                                             replicates=50, workers=2, seed=0)
+        self.assertTrue((intervals['lower'] <= intervals['rating']).all())
+        self.assertTrue((intervals['rating'] <= intervals['upper']).all())
+        self.assertTrue((intervals['lower'] < intervals['upper']).any())
+        self.assertEqual(intervals['games'].sum(), 
+                         sum(len({game.team_1_defense_id, game.team_1_attack_id, game.team_2_defense_id, game.team_2_attack_id}) 
+                             for game in Game.objects.all()))
+        
+    def test_command_stores_intervals(self):
+        version = get_league_version()
+        call_command('compute_rating_intervals', replicates=20, workers=1, seed=0, stdout=io.StringIO())
+        self.assertEqual(RatingInterval.objects.count(), 8)
+        self.assertNotEqual(get_league_version(), version)
+        interval = RatingInterval.objects.first()
+        self.assertLessEqual(interval.lower, interval.upper)
+        self.assertEqual(interval.replicates, 20)
+        response = self.client.get(reverse('elo_app:all'))
+        self.assertContains(response, '{} - {}'.format(interval.lower, interval.upper))
+
+        
+        
+class EventLogTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        
+    def assert_state_matches_league(self, state, league_id : int = None):
+        league_id = league_id or default_league_id()
+        self.assertEqual(state['ratings'], {p.id: p.current_rating for p in with_current_rating(Player.objects.filter(league_id=league_id))})
+        self.assertEqual(set(state['pending_games']), 
+                         set(Game.objects.filter(league_id=league_id, updates_performed=False).values_list('id', flat=True)))
+        
+    def test_state_follows_league(self):
+        game = create_game(1, *self.players)
+        submitted = LeagueEvent.objects.last()
+        self.assertEqual(submitted.kind, LeagueEvent.GAME_SUBMITTED)
+        self.assert_state_matches_league(state_at())
+        
+        game.team_1_score, game.team_2_score = 3, 10
+        game.save()
+        self.assertEqual(state_at()['pending_games'][game.id]['team_1_score'], 3)
+        self.assertEqual(state_at(submitted.id)['pending_games'][game.id]['team_1_score'], 10)
+        
+        create_and_login_superuser(self.client)
+        self.client.post(reverse('elo_app:update_ratings'))
+        self.assert_state_matches_league(state_at())
+        self.assertEqual(state_at()['pending_games'], {})
+        self.assertEqual(state_at(submitted.id)['ratings'], {p.id: 300+i*50 for i, p in enumerate(self.players)})
+        
+        other_game = create_game(2, *self.players)
+        other_game.delete()
+        self.assertEqual(LeagueEvent.objects.last().kind, LeagueEvent.GAME_DELETED)
+        self.assert_state_matches_league(state_at())
+        self.assertEqual(state_as_of(submitted.recorded_at - datetime.timedelta(days=1)), 
+                         {'ratings': {}, 'pending_games': {}})
+        
+    def test_removed_ratings_leave_state(self):
+        create_game(1, *self.players)
+        apply_rating_updates(timezone.now().date())
+        PlayerRating.objects.filter(player=self.players[0]).order_by('-timestamp', '-id').first().delete()
+        self.assertEqual(LeagueEvent.objects.last().kind, LeagueEvent.RATING_REMOVED)
+        self.assertEqual(state_at()['ratings'][self.players[0].id], 300)
+        # Players without games are deleted with their ratings.
+        player = create_player(name='no_games')
+        self.assertIn(player.id, state_at()['ratings'])
+        player.delete()
+        self.assertNotIn(player.id, state_at()['ratings'])
+        self.assertEqual(state_at(), {'ratings': {p.id: p.current_rating for p in with_current_rating(Player.objects.all())},
+                                      'pending_games': {}})
+        
+    def test_snapshots_bound_replay(self):
+        with mock.patch('elo.events.SNAPSHOT_INTERVAL', 5):
+            for i in range(12):
+                create_game(1 + i%2, *self.players)
+        self.assertGreaterEqual(LeagueSnapshot.objects.count(), 3)
+        with self.assertNumQueries(2):
+            state = state_at()
+        self.assert_state_matches_league(state)
+        event_id = LeagueSnapshot.objects.first().event_id + 1
+        self.assertEqual(len(state_at(event_id)['pending_games']), 
+                         LeagueEvent.objects.filter(id__lte=event_id, kind=LeagueEvent.GAME_SUBMITTED).count())
+        
+    def test_leagues_have_separate_logs(self):
+        league = League.objects.create(name='Other', slug='other')
+        others = [create_player(name=f'other{i}', rating=500, league=league) for i in range(4)]
+        with mock.patch('elo.events.SNAPSHOT_INTERVAL', 5):
+            games = [create_game(1, *self.players) for _ in range(4)]
+            other_games = [create_game(1, *others) for _ in range(4)]
+        self.assertEqual(set(LeagueSnapshot.objects.values_list('event__league_id', flat=True)), {league.id, self.players[0].league_id})
+        for snapshot in LeagueSnapshot.objects.all():
+            self.assertLessEqual(set(snapshot.state['pending_games']), 
+                                 {str(game.id) for game in (other_games if snapshot.event.league_id == league.id else games)})
+        self.assert_state_matches_league(state_at())
+        with self.assertNumQueries(2):
+            state = state_at(league_id=league.id)
+        self.assert_state_matches_league(state, league.id)
+        self.assertEqual(set(state['pending_games']), {game.id for game in other_games})
+        # The other league's events don't change the state of the default league.
+        self.assertEqual(state_at(LeagueEvent.objects.last().id), state_at())
+        
+    def test_generated_league_is_logged(self):
+        call_command('generate_league', players=8, weeks=3, games_per_week=5, stdout=io.StringIO())
+        create_game(1, *Player.objects.all()[:4])
+        self.assert_state_matches_league(state_at())
+
+
+class RatingCompactionTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        create_and_login_superuser(self.client)
+        
+    def read_ratings(self, dates : list[datetime.date]) -> list:
+        return [([(r.timestamp, r.rating) for r in get_rating_history(player)],
+                 [player.get_rating(date) for date in [None] + dates]) for player in self.players]
+        
+    def test_unchanged_ratings_are_not_stored(self):
+        self.client.post(reverse('elo_app:update_ratings'))
+        self.assertEqual(PlayerRating.objects.count(), 4)
+        self.assertEqual(RatingUpdate.objects.count(), 1)
+        # The chart still shows the update.
+        self.assertEqual([r.rating for r in get_rating_history(self.players[0])], [300, 300])
+        
+    def test_compaction_keeps_ratings_read(self):
+        with override_settings(ELO_COMPACT_RATINGS=False):
+            today = timezone.now().date()
+            apply_rating_updates(today - datetime.timedelta(days=3))
+            create_game(1, *self.players, date=today - datetime.timedelta(days=2))
+            apply_rating_updates(today)
+        self.assertEqual(PlayerRating.objects.count(), 12)
+        dates = [today - datetime.timedelta(days=days) for days in range(10)]
+        read = self.read_ratings(dates)
+        league_version, event_count = get_league_version(), LeagueEvent.objects.count()
+        with self.assertNumQueries(7):
+            call_command('compact_ratings', stdout=io.StringIO())
+        self.assertEqual(PlayerRating.objects.count(), 8)
+        self.assertEqual(self.read_ratings(dates), read)
+        self.assertNotEqual(get_league_version(), league_version)
+        # The ratings in effect are the same, so there is nothing to log.
+        self.assertEqual(LeagueEvent.objects.count(), event_count)
+        
+    def test_get_rating_reads_one_rating(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.players[1].get_rating(), 350)
+        self.assertEqual(self.players[1].get_rating(datetime.date(2000, 1, 1)), 350)
+        player = Player.objects.create(player_name='no_ratings', user=User.objects.create_user(username='no_ratings'))
+        self.assertEqual(player.get_rating(), 0)
+
+
+class LeagueTest(TestCase):
+    
+    def setUp(self):
+        self.other_league = League.objects.create(name='Other office', slug='other')
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(5)]
+        self.other_players = [create_player(name=f'other{i}', rating=300+i*50, league=self.other_league) for i in range(5)]
+        
+    def test_rating_updates_are_independent(self):
+        create_game(1, *self.players[:4])
+        create_game(1, *self.other_players[:4])
+        apply_rating_updates(timezone.now().date(), self.other_league.id)
+        
+        self.assertEqual([p.get_rating() for p in self.players], [300, 350, 400, 450, 500])
+        self.assertEqual(Game.objects.filter(updates_performed=False).get().team_1_defense, self.players[0])
+        # The inactive player pays one point per active player of their own league ranked below them.
+        self.assertEqual(self.other_players[4].get_rating(), 500-4)
+        self.assertEqual(RatingUpdate.objects.get().league, self.other_league)
+        
+        call_command('update_ratings', league=['main'], workers=1, stdout=io.StringIO())
+        self.assertEqual(self.players[4].get_rating(), 500-4)
+        self.assertFalse(Game.objects.filter(updates_performed=False).exists())
+        with self.assertRaises(CommandError):
+            call_command('update_ratings', league=['missing'], stdout=io.StringIO())
+            
+    def test_update_ratings_reports_failed_leagues(self):
+        create_game(1, *self.players[:4])
+        create_game(1, *self.other_players[:4])
+        def apply_rating_updates_failing(timestamp, league_id):
+            if league_id == self.other_league.id:
+                raise ValueError('update failed')
+            apply_rating_updates(timestamp, league_id)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with mock.patch('elo.management.commands.update_ratings.apply_rating_updates', apply_rating_updates_failing):
+            with self.assertRaisesMessage(CommandError, 'Other office'):
+                call_command('update_ratings', workers=4, stdout=stdout, stderr=stderr)
+        # SQLite only takes one write at a time.
+        self.assertIn('one by one', stderr.getvalue())
+        self.assertIn('update failed', stderr.getvalue())
+        self.assertIn('Updated the ratings of Main', stdout.getvalue())
+        self.assertEqual(Game.objects.filter(updates_performed=False).get().league, self.other_league)
+            
+    def test_versions_are_independent(self):
+        versions = get_league_version(), get_history_version()
+        other_version = get_league_version(self.other_league.id)
+        create_game(1, *self.other_players[:4])
+        self.other_players[0].player_name = 'renamed'
+        self.other_players[0].save()
+        self.assertEqual((get_league_version(), get_history_version()), versions)
+        self.assertNotEqual(get_league_version(self.other_league.id), other_version)
+        
+    def test_pages_show_their_league(self):
+        create_game(1, *self.other_players[:4])
+        for url in [reverse('elo_app:index'), reverse('elo_app:all'), reverse('elo_app:index_async'), 
+                    reverse('elo_app:all_async'), reverse('elo_app:leaderboard')]:
+            response = self.client.get(url)
+            self.assertContains(response, 'player4')
+            self.assertNotContains(response, 'other4')
+            response = self.client.get(url, {'league': 'other'})
+            self.assertContains(response, 'other4')
+            self.assertNotContains(response, 'player4')
+            self.assertEqual(self.client.get(url, {'league': 'missing'}).status_code, 404)
+        # Signed in players see their own league.
+        login_user(self.client, self.other_players[0].user)
+        self.assertContains(self.client.get(reverse('elo_app:index')), 'other4')
+        
+    def test_games_stay_within_a_league(self):
+        login_user(self.client, self.players[0].user)
+        response = self.client.post(reverse('elo_app:submit_game'), {
+            'winning_team_defense': self.players[0].id,
+            'winning_team_attack': self.players[1].id,
+            'losing_team_defense': self.other_players[0].id,
+            'losing_team_attack': self.other_players[1].id,
+            'losing_team_score': 5,
+            'date': timezone.now().date(),
+        })
+        self.assertContains(response, 'All players of a game must be in the same league.')
+        self.assertFalse(Game.objects.exists())
+        game = create_game(1, *self.other_players[:4])
+        self.assertEqual(game.league, self.other_league)
+        with self.assertRaises(MixedLeaguesError):
+            create_game(1, *self.players[:2], *self.other_players[:2])
+        game.team_2_attack_id = self.players[0].id
+        with self.assertRaises(ValidationError):
+            game.clean()
+        
+    def test_admin_keeps_games_within_a_league(self):
+        game = create_game(1, *self.players[:4])
+        create_and_login_superuser(self.client)
+        response = self.client.get(reverse('admin:autocomplete'), {'term': '', 'app_label': 'elo', 'model_name': 'game',
+                                                                    'field_name': 'team_1_defense', 'league': self.other_league.id})
+        self.assertEqual({result['text'] for result in response.json()['results']}, {f'other{i}' for i in range(5)})
+        
+        data = {'team_1_defense': self.players[0].id, 'team_1_attack': self.players[1].id,
+                'team_2_defense': self.other_players[0].id, 'team_2_attack': self.other_players[1].id,
+                'team_1_score': 10, 'team_2_score': 5, 'date_played': game.date_played}
+        for league in [self.players[0].league, self.other_league]:
+            response = self.client.post(reverse('admin:elo_game_change', args=(game.id,)), dict(data, player_league=league.id))
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.context['adminform'].form.errors)
+        self.assertEqual(Game.objects.get().team_2_defense, self.players[2])
+        data.update(team_2_defense=self.players[3].id, team_2_attack=self.players[2].id, player_league=self.players[0].league.id)
+        response = self.client.post(reverse('admin:elo_game_change', args=(game.id,)), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Game.objects.get().team_2_defense, self.players[3])
+
+
+class SeasonTest(TestCase):
+    
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.end = self.today - datetime.timedelta(days=2)
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(5)]
+        create_game(1, *self.players[:4], date=self.end - datetime.timedelta(days=1))
+        create_game(2, *self.players[1:], date=self.end)
+        apply_rating_updates(self.end)
+        
+    def test_closing_archives_season(self):
+        leaderboard = leaderboard_as_of(self.today)
+        season = close_season(default_league_id(), '2025', self.end)
+        self.assertEqual((season.start, season.end), (self.end - datetime.timedelta(days=1), self.end))
+        self.assertEqual(League.objects.get(pk=default_league_id()).season_start, self.end + datetime.timedelta(days=1))
+        
+        standings = list(season.standings.order_by('position'))
+        self.assertEqual([(s.player_id, s.position, s.rating) for s in standings], 
+                         [(row['id'], row['position'], row['rating']) for row in leaderboard])
+        for standing in standings:
+            statistics = get_player_statistics(standing.player)
+            self.assertEqual(standing.game_count, statistics['game_count'])
+            self.assertEqual(standing.games_won, statistics['games_won'])
+            self.assertAlmostEqual(standing.average_opponent_rating, statistics['average_opponent_rating'])
+        # Every game was played in the season, so its pair stats are the all-time ones.
+        self.assertEqual(sorted((p.player_id, p.other_player_id, p.relation, [getattr(p, field) for field in PAIR_STATS_FIELDS])
+                                for p in SeasonPairStats.objects.filter(season=season)),
+                         sorted((p.player_id, p.other_player_id, p.relation, [getattr(p, field) for field in PAIR_STATS_FIELDS])
+                                for p in PairStats.objects.all()))
+        
+    def test_closing_requires_final_ratings(self):
+        create_game(1, *self.players[:4], date=self.end)
+        with self.assertRaises(SeasonError):
+            close_season(default_league_id(), '2025', self.end)
+        apply_rating_updates(self.today)
+        with self.assertRaises(CommandError):
+            call_command('close_season', '2025', end=self.end, stdout=io.StringIO())
+        call_command('close_season', '2025', stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command('close_season', '2025', stdout=io.StringIO())
+        self.assertEqual(Season.objects.count(), 1)
+        
+    def test_pages_read_current_season(self):
+        close_season(default_league_id(), '2025', self.end)
+        rating = self.players[1].get_rating()
+        create_game(1, *self.players[1:], date=self.today)
+        # The season starts from each player's latest rating.
+        self.assertEqual({player_id: history[0][1] for player_id, history 
+                          in get_rating_histories({p.id for p in self.players}, self.end + datetime.timedelta(days=1)).items()},
+                         {p.id: p.get_rating() for p in self.players})
+        
+        # The async page first, as it skips whatever the sync page caches.
+        async_response = self.client.get(reverse('elo_app:player_detail_async', args=(self.players[1].id,)))
+        response = self.client.get(reverse('elo_app:player_detail', args=(self.players[1].id,)))
+        self.assertEqual([(r.timestamp, r.rating) for r in response.context['rating_history']], [(self.end, rating)])
+        self.assertEqual(response.context['player_stats']['game_count'], 1)
+        self.assertEqual([standing.season.name for standing in response.context['player_seasons']], ['2025'])
+        self.assertContains(response, reverse('elo_app:season_detail', args=(Season.objects.get().id,)))
+        for key in ['rating_history', 'player_stats', 'player_seasons']:
+            self.assertEqual(async_response.context[key], response.context[key])
+            
+    def test_games_cannot_join_closed_season(self):
+        close_season(default_league_id(), '2025', self.end)
+        login_user(self.client, self.players[0].user)
+        response = self.client.post(reverse('elo_app:submit_game'), {
+            'winning_team_defense': self.players[0].id,
+            'winning_team_attack': self.players[1].id,
+            'losing_team_defense': self.players[2].id,
+            'losing_team_attack': self.players[3].id,
+            'losing_team_score': 5,
+            'date': self.end,
+        })
+        self.assertContains(response, 'Game cannot be in a closed season.')
+        self.assertEqual(Game.objects.count(), 2)
+        
+    def test_archives_are_cached_for_good(self):
+        season = close_season(default_league_id(), '2025', self.end)
+        url = reverse('elo_app:season_detail', args=(season.id,))
+        response = self.client.get(url)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertContains(response, self.players[4].player_name)
+        # Only the season itself is looked up.
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        self.assertContains(self.client.get(reverse('elo_app:seasons')), url)
+        self.assertEqual(self.client.get(reverse('elo_app:season_detail', args=(season.id+1,))).status_code, 404)
+
+
+class RecordsTest(TestCase):
+    
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(5)]
+        
+    def get_records(self) -> dict[str, list[tuple[str, float]]]:
+        return {record['field']: [(holder['name'], holder['value']) for holder in record['holders']] for record in get_records()}
+        
+    def test_records(self):
+        yesterday = self.today - datetime.timedelta(days=1)
+        p = self.players
+        # player0 and player1 win three in a row, the first two 10-0, then lose.
+        game = Game.objects.create(team_1_defense=p[0], team_1_attack=p[1], team_2_defense=p[3], team_2_attack=p[4],
+                                   team_1_score=10, team_2_score=0, date_played=yesterday, submitted_by=p[0].user)
+        create_game(1, p[0], p[1], p[2], p[3], date=yesterday)
+        Game.objects.create(team_1_defense=p[0], team_1_attack=p[1], team_2_defense=p[2], team_2_attack=p[4],
+                            team_1_score=10, team_2_score=5, date_played=self.today, submitted_by=p[0].user)
+        create_game(2, p[0], p[1], p[2], p[3], date=self.today)
+        
+        records = self.get_records()
+        self.assertEqual(records['longest_win_streak'][:2], [('player0', 3), ('player1', 3)])
+        self.assertEqual(records['longest_egg_streak'][:2], [('player0', 2), ('player1', 2)])
+        self.assertEqual(records['most_games_in_a_day'][0], ('player0', 2))
+        # 475 beaten by 325.
+        self.assertEqual(records['biggest_upset'][:2], [('player0', 150), ('player1', 150)])
+        self.assertEqual(PlayerRecords.objects.get(player=p[0]).biggest_upset_game, game)
+        self.assertEqual(records['highest_rating'][0], ('player4', 500))
+        
+        PlayerRating.objects.create(player=p[0], timestamp=self.today, rating=900)
+        self.assertEqual(self.get_records()['highest_rating'][0], ('player0', 900))
+        
+    def test_incremental_records_match_rebuild(self):
+        rng = random.Random(0)
+        for _ in range(30):
+            # Some games are backdated behind games already submitted.
+            create_game(rng.randint(1, 2), *rng.sample(self.players, 4), date=self.today - datetime.timedelta(days=rng.randint(0, 5)))
+        game = Game.objects.order_by('id')[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            game.team_1_score, game.team_2_score = game.team_2_score, game.team_1_score
+            game.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Game.objects.order_by('id')[5].delete()
+        
+        fields = [field.name for field in PlayerRecords._meta.fields if field.name not in ['id', 'player']]
+        incremental = {r.player_id: [getattr(r, field) for field in fields] for r in PlayerRecords.objects.all()}
+        self.assertEqual(rebuild_records(), 29)
+        self.assertEqual({r.player_id: [getattr(r, field) for field in fields] for r in PlayerRecords.objects.all()}, incremental)
+        
+    def test_deletes_rebuild_once(self):
+        for i in range(10):
+            create_game(1 + i % 2, *self.players[:4], date=self.today - datetime.timedelta(days=i % 3))
+        create_game(1, *self.players[1:])
+        with self.captureOnCommitCallbacks() as callbacks:
+            Game.objects.filter(team_1_defense=self.players[0]).delete()
+        rebuilds = [callback for callback in callbacks if callback is rebuild_scheduled]
+        self.assertEqual(len(rebuilds), 10)
+        rebuilds[0]()
+        with self.assertNumQueries(0):
+            for callback in rebuilds[1:]:
+                callback()
+                
+        fields = [field.name for field in PlayerRecords._meta.fields if field.name not in ['id', 'player']]
+        records = {r.player_id: [getattr(r, field) for field in fields] for r in PlayerRecords.objects.all()}
+        self.assertIsNone(PlayerRecords.objects.get(player=self.players[0]).last_game_id)
+        rebuild_records()
+        self.assertEqual({r.player_id: [getattr(r, field) for field in fields] for r in PlayerRecords.objects.all()}, records)
+        
+    def test_page_reads_records_once(self):
+        create_game(1, *self.players[:4])
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('elo_app:records'))
+        for _, title in RECORDS:
+            self.assertContains(response, title)
+        self.assertContains(response, 'player0')
+
+
+class DuplicateGameTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}') for i in range(4)]
+        self.date = timezone.now().date()
+        
+    def submit(self, **data):
+        data = {
+            'winning_team_defense': self.players[0].id,
+            'winning_team_attack': self.players[1].id,
+            'losing_team_defense': self.players[2].id,
+            'losing_team_attack': self.players[3].id,
+            'losing_team_score': 5,
+            'date': self.date,
+            **data,
+        }
+        return self.client.post(reverse('elo_app:submit_game'), data)
+        
+    def test_signature_ignores_positions(self):
+        p = self.players
+        game = create_game(1, *p)
+        self.assertEqual(game.signature, game_signature(Game(team_1_defense=p[3], team_1_attack=p[2], team_2_defense=p[1], 
+                                                             team_2_attack=p[0], team_1_score=0, team_2_score=10,
+                                                             date_played=self.date.isoformat())))
+        self.assertNotEqual(game.signature, create_game(2, *p).signature)
+        self.assertNotEqual(game.signature, create_game(1, *p, date=self.date - datetime.timedelta(days=1)).signature)
+        
+    def test_duplicates_are_rejected_unless_confirmed(self):
+        login_user(self.client, self.players[0].user)
+        self.submit()
+        login_user(self.client, self.players[3].user)
+        response = self.submit(winning_team_defense=self.players[1].id, winning_team_attack=self.players[0].id)
+        self.assertContains(response, 'This game looks like one already submitted by player0.')
+        self.assertContains(response, 'name="allow_duplicate"')
+        self.assertEqual(Game.objects.count(), 1)
+        self.assertEqual(self.submit(losing_team_score=6).status_code, 302)
+        self.assertEqual(self.submit(allow_duplicate=1).status_code, 302)
+        self.assertEqual(Game.objects.count(), 3)
+        
+    def test_find_duplicate_games(self):
+        games = [create_game(1, *self.players) for _ in range(3)]
+        create_game(2, *self.players)
+        out = io.StringIO()
+        call_command('find_duplicate_games', stdout=out)
+        self.assertIn("{}: game {} submitted by player0, game {} submitted by player0, game {} submitted by player0".format(
+            games[0].signature, *[game.id for game in games]), out.getvalue())
+        self.assertIn("Found 2 likely duplicates in 1 clusters.", out.getvalue())
+
+
+class WarmCachesTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        create_game(1, *self.players)
+        self.other_league = League.objects.create(name='Other office', slug='other')
+        self.other_player = create_player(name='other', league=self.other_league)
+        
+    def test_warmed_pages_need_no_computation(self):
+        results = {result['league'].slug: result for result in warm_caches()}
+        self.assertEqual((results['main']['league_pages'], results['main']['league_page_count']), (4, 4))
+        self.assertEqual((results['main']['player_pages'], results['main']['player_count']), (4, 4))
+        self.assertEqual((results['other']['player_pages'], results['other']['player_count']), (1, 1))
+        for url in [reverse('elo_app:index'), reverse('elo_app:all'), reverse('elo_app:index') + '?league=other']:
+            with self.assertNumQueries(0 if 'league' not in url else 1):
+                self.client.get(url)
+        with self.assertNumQueries(0):
+            leaderboard_as_of(timezone.now().date())
+        # Only the player.
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('elo_app:player_detail', args=(self.players[0].id,)))
+        self.assertContains(response, '<td>1</td>')
+        self.assertContains(response, "label: 'Rating history'")
+        
+    def test_changes_make_pages_cold(self):
+        warm_caches()
+        league = League.objects.get(slug='main')
+        player_ids = [player.id for player in self.players]
+        self.assertEqual(cached_player_pages(league, player_ids), 4)
+        create_game(2, *self.players)
+        self.assertEqual(cached_player_pages(league, player_ids), 0)
+        self.assertEqual(cached_league_pages(league), 1)
+        self.assertEqual(cached_player_pages(self.other_league, [self.other_player.id]), 1)
+        
+    def test_command_reports_coverage(self):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('warm_caches', league=['other'], workers=2, stdout=out, stderr=err)
+        self.assertIn("Warmed 4/4 league pages and 1/1 player pages of Other office", out.getvalue())
+        self.assertIn("Warmed 5/5 pages", out.getvalue())
+        # The test cache is local to the process, so the pages are warmed in it.
+        self.assertIn("local to each process", err.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('warm_caches', league=['nowhere'], stdout=out)
+
+
+class AdminTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        self.ratings = [player.get_rating() for player in self.players]
+        self.today = timezone.now().date()
+        create_and_login_superuser(self.client)
+        
+    def count_changelist_queries(self, url : str) -> int:
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+        
+    def test_changelists_need_constant_queries(self):
+        for url in [reverse('admin:elo_game_changelist'), reverse('admin:elo_playerrating_changelist')]:
+            create_game(1, *self.players)
+            apply_rating_updates(self.today - datetime.timedelta(days=1))
+            query_count = self.count_changelist_queries(url)
+            for i in range(10):
+                create_game(1 + i % 2, *self.players)
+            apply_rating_updates(self.today)
+            self.assertEqual(self.count_changelist_queries(url), query_count)
+        response = self.client.get(reverse('admin:elo_game_changelist'), {'q': 'player3'})
+        self.assertEqual(response.context['cl'].result_count, 22)
+            
+    def act(self, action : str, games : list[Game]):
+        return self.client.post(reverse('admin:elo_game_changelist'), 
+                                {'action': action, '_selected_action': [game.id for game in games]}, follow=True)
+        
+    def test_recompute_ratings(self):
+        games = [create_game(1, *self.players), create_game(2, *self.players[2:], *self.players[:2])]
+        apply_rating_updates(self.today)
+        rated = [player.get_rating() for player in self.players]
+        self.assertNotEqual(rated, self.ratings)
+        response = self.act('recompute_ratings', games)
+        self.assertContains(response, 'The next rating update rates them again.')
+        self.assertEqual([player.get_rating() for player in self.players], self.ratings)
+        self.assertFalse(Game.objects.filter(updates_performed=True).exists())
+        apply_rating_updates(self.today)
+        self.assertEqual([player.get_rating() for player in self.players], rated)
+        
+    def test_void_ratings(self):
+        game = create_game(1, *self.players)
+        apply_rating_updates(self.today)
+        pending_game = create_game(2, *self.players)
+        self.assertContains(self.act('void_ratings', [game, pending_game]), 'for 4 players')
+        self.assertEqual([player.get_rating() for player in self.players], self.ratings)
+        self.assertEqual(Game.objects.filter(updates_performed=True).count(), 2)
+        
+    def test_closed_seasons_are_not_reverted(self):
+        game = create_game(1, *self.players, date=self.today - datetime.timedelta(days=3))
+        apply_rating_updates(self.today - datetime.timedelta(days=2))
+        League.objects.update(season_start=self.today - datetime.timedelta(days=1))
+        self.assertContains(self.act('recompute_ratings', [game]), 'Game cannot be in a closed season.')
+        self.assertTrue(Game.objects.get().updates_performed)
+
+
+class AnalyticsTest(TestCase):
+    
+    def setUp(self):
+        self.players = [create_player(name=f'player{i}', rating=300+i*50) for i in range(4)]
+        self.today = timezone.now().date()
+        self.week = week_start(self.today)
+        
+    def rollups(self) -> list[tuple]:
+        return list(WeeklyRollup.objects.values_list('week', 'game_count', 'egg_count', 'rated_game_count', 'margins', 
+                                                     'attack_defense_game_count', 'attack_team_wins', 'rating_histogram'))
+        
+    def test_weeks_start_with_rating_updates(self):
+        self.assertEqual(self.week.weekday(), 6)
+        self.assertEqual(week_start(self.week + datetime.timedelta(days=6)), self.week)
+        # A sunday update starts the week of the games played with its ratings, not the week of the games it rates.
+        create_game(1, *self.players, date=self.week - datetime.timedelta(days=1))
+        apply_rating_updates(self.week)
+        self.assertEqual([(rollup.week, rollup.rated_game_count, rollup.rating_histogram is not None)
+                          for rollup in WeeklyRollup.objects.order_by('week')],
+                         [(self.week - datetime.timedelta(weeks=1), 1, False), (self.week, 0, True)])
+        
+    def test_submitted_games_are_counted(self):
+        p = self.players
+        game = create_game(1, *p)
+        Game.objects.create(team_1_defense=p[0], team_1_attack=p[1], team_2_defense=p[2], team_2_attack=p[3],
+                            team_1_score=10, team_2_score=5, date_played=self.today, submitted_by=p[0].user)
+        self.assertEqual(WeeklyRollup.objects.values_list('week', 'game_count', 'egg_count').get(), (self.week, 2, 1))
+        game.date_played = self.today - datetime.timedelta(weeks=2)
+        game.save()
+        self.assertEqual(list(WeeklyRollup.objects.values_list('week', 'game_count', 'egg_count')),
+                         [(self.week - datetime.timedelta(weeks=2), 1, 1), (self.week, 1, 0)])
+        game.delete()
+        self.assertEqual(list(WeeklyRollup.objects.values_list('game_count', 'egg_count')), [(0, 0), (1, 0)])
+        
+    def test_rated_games_are_counted(self):
+        p = self.players
+        # 325 beats 425 10-0, and the stronger defender's team beats the stronger attacker's team.
+        create_game(1, p[1], p[0], p[2], p[3])
+        Game.objects.create(team_1_defense=p[0], team_1_attack=p[1], team_2_defense=p[2], team_2_attack=p[3],
+                            team_1_score=7, team_2_score=10, date_played=self.today, submitted_by=p[0].user)
+        apply_rating_updates(self.today)
+        rollup = WeeklyRollup.objects.get()
+        self.assertEqual(rollup.rated_game_count, 2)
+        self.assertEqual(rollup.margins, {'10': [1, 0], '3': [1, 1]})
+        self.assertEqual((rollup.attack_defense_game_count, rollup.attack_team_wins), (1, 0))
+        self.assertEqual(sum(rollup.rating_histogram.values()), 4)
+        
+        # Rebuilding from all games and ratings gives the same rollups.
+        rollups = self.rollups()
+        self.assertEqual(rebuild_rollups(), 1)
+        self.assertEqual(self.rollups(), rollups)
         
+    def test_dashboard(self):
+        create_game(1, *self.players, date=self.today - datetime.timedelta(weeks=2))
+        apply_rating_updates(self.today)
+        create_game(2, *self.players)
+        with self.assertNumQueries(1):
+            dashboard = query_dashboard(default_league_id())
+        self.assertEqual(dashboard['weeks'], [(self.week - datetime.timedelta(weeks=weeks)).isoformat() for weeks in [2, 1, 0]])
+        self.assertEqual(dashboard['games'], [1, 0, 1])
+        self.assertEqual(dashboard['egg_rates'], [1, None, 1])
+        self.assertEqual(dashboard['margins'], [{'margin': 10, 'games': 1, 'favourite_win_rate': 0}])
+        self.assertEqual(dashboard['rating_histogram']['week'], self.week.isoformat())
+        self.assertEqual(sum(bucket['players'] for bucket in dashboard['rating_histogram']['buckets']), 4)
+        self.assertContains(self.client.get(reverse('elo_app:analytics')), reverse('api:analytics'))
@@ -1,12 +1,23 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 app_name='elo_app'
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
     path('all/', views.AllView.as_view(), name='all'),
     path('<int:pk>/', views.PlayerDetailView.as_view(), name='player_detail'),
+    path('game/pending/', views.pending_games, name='pending_games'),
     path('game/submit_form/', views.SubmitGameView.as_view(), name='submit_form_game'),
     path('game/submit/', views.submit_game, name='submit_game'),
-    path('updateratings', views.update_ratings, name='update_ratings')
+    path('updateratings', views.update_ratings, name='update_ratings'),
+    path('async/', async_views.index, name='index_async'),
+    path('async/all/', async_views.all_players, name='all_async'),
+    path('async/<int:pk>/', async_views.player_detail, name='player_detail_async'),
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
+    path('records/', views.records, name='records'),
+    path('analytics/', views.analytics, name='analytics'),
+    path('seasons/', views.seasons, name='seasons'),
+    path('seasons/<int:pk>/', views.season_detail, name='season_detail'),
+    path('live/', views.LiveView.as_view(), name='live'),
+    path('live/stream/', async_views.leaderboard_stream, name='leaderboard_stream'),
 ]
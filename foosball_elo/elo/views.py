@@ -1,24 +1,54 @@
-from django.db.models import Max
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import OuterRef, Subquery, Q
+from django.db.models.functions import Coalesce, Upper
+from django.db import transaction
 from django.db.models.query import QuerySet
 from django.db.utils import IntegrityError
 from django.shortcuts import render
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, HttpResponseNotAllowed
+from django.http import Http404, HttpResponse, HttpRequest, HttpResponseRedirect, HttpResponseNotAllowed, HttpResponseBadRequest
 from django.views import View, generic
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django.contrib.auth.decorators import user_passes_test
+from django.views.decorators.cache import cache_control
+from django.utils.functional import SimpleLazyObject
 
-from .models import Player, Game, PlayerRating
+from .models import (League, Player, Game, PlayerRating, RatingUpdate, LeagueEvent, Season, SeasonStanding, rating_at, 
+                     expand_rating_history, game_signature, default_league_id, get_league_id, SCALING_FACTOR, ADAPTION_STEP,
+                     PLAYER_POSITIONS, MixedLeaguesError)
+from .caching import get_league_version, bump_league_version
+from .engines import POSITIONS, EloEngine
+from .events import record_event, game_data
+from .analytics import record_rated_games, record_ratings
+from .penalties import get_inactivity_policy
+from .records import get_records
+from .history import SEASON_ARCHIVE_MAX_AGE, leaderboard_as_of, movers_between, get_season_archive
+from .replay import GAME_DTYPE
+from .simulation import get_top_n_probabilities
+from foosball_elo.middleware import replica_reads
 
+from collections import defaultdict
 import decimal
+import itertools
 from typing import Any
 import datetime
+from urllib.parse import urlencode
+
+import numpy as np
 
 
 #############
 ## HELPERS ##
 #############
 
+PENDING_GAME_RELATIONS = PLAYER_POSITIONS + ['submitted_by']
+PENDING_GAMES_PAGE_SIZE = 20
+PLAYER_SEARCH_LIMIT = 10
+# How many of a player's latest games their recent partners are taken from.
+RECENT_PARTNERS_GAME_COUNT = 20
+RECENT_PARTNERS_CACHE_KEY = 'elo:recent_partners:{}:{}'
+
 def is_valid_score(score1 : int, score2 : int) -> bool:
     return (score1 == 10 and score2 < 10) or (score2 == 10 and score1 < 10)
 
@@ -38,9 +68,63 @@ def are_valid_teams(team_1_defense : Player,
     return True
      
     
+def with_current_rating(players : QuerySet[Player]) -> QuerySet[Player]:
+    """ Annotates each player with current_rating, i.e., the value of player.get_rating(),
+        in the same query as the players themselves.
+    """
+    latest_rating = PlayerRating.objects.filter(player=OuterRef('pk')).order_by('-timestamp', '-id')
+    return players.annotate(current_rating=Coalesce(Subquery(latest_rating.values('rating')[:1]), 0))
+
+def sort_by_rating(players : list[Player]) -> list[Player]:
+    """ Sorts players annotated by with_current_rating, highest rated first.
+    """
+    return sorted(players, key=lambda a: -a.current_rating)
+
+def season_ratings(player_ids : set[int], since : datetime.date = None) -> QuerySet[PlayerRating]:
+    """ Returns the ratings of the players, or if since is given, only those of the season starting on since,
+        i.e., the ratings timestamped since then and the latest rating of each player before, which they
+        started the season with. Older ratings aren't read at all.
+    """
+    ratings = PlayerRating.objects.filter(player_id__in=player_ids)
+    if since is None:
+        return ratings
+    carried_over = Player.objects.filter(pk__in=player_ids) \
+                                 .values(rating_id=Subquery(PlayerRating.objects.filter(player=OuterRef('pk'), timestamp__lt=since)
+                                                                                .order_by('-timestamp', '-id')
+                                                                                .values('id')[:1]))
+    return ratings.filter(Q(timestamp__gte=since) | Q(pk__in=carried_over))
+
+def rating_history_values(player_ids : set[int], since : datetime.date = None) -> QuerySet:
+    return season_ratings(player_ids, since).order_by('player_id', 'timestamp', 'id') \
+                                            .values_list('player_id', 'timestamp', 'rating')
+
+def group_rating_histories(player_ids : set[int], 
+                           rows : list[tuple[int, datetime.date, int]]) -> dict[int, list[tuple[datetime.date, int]]]:
+    rating_histories = {player_id: [] for player_id in player_ids}
+    for player_id, timestamp, rating in rows:
+        rating_histories[player_id].append((timestamp, rating))
+    return rating_histories
+
+def get_rating_histories(player_ids : set[int], since : datetime.date = None) -> dict[int, list[tuple[datetime.date, int]]]:
+    """ Returns the (timestamp, rating) history of each of the given players, loaded in one query.
+        If since is given, the histories are those of the season starting on since (see season_ratings).
+    """
+    return group_rating_histories(player_ids, rating_history_values(player_ids, since))
+    
+def get_opponent_ids(games : set[Game], player : Player) -> set[int]:
+    opponent_ids = set()
+    for game in games:
+        if player.id in [game.team_1_defense_id, game.team_1_attack_id]:
+            opponent_ids.update([game.team_2_defense_id, game.team_2_attack_id])
+        else:
+            opponent_ids.update([game.team_1_defense_id, game.team_1_attack_id])
+    return opponent_ids
+    
 def compute_player_statistics(games : set[Game],
-                              player: Player) -> tuple[int]:
+                              player: Player,
+                              rating_histories : dict[int, list[tuple[datetime.date, int]]]) -> tuple[int]:
     """ Returns (highest_opponent_rating, average_opponent_rating, games_won, games_lost, eggs_dealt_count, eggs_collected_count)
+        rating_histories must contain the rating history of every opponent in games (see get_rating_histories).
     """
     highest_opponent_rating = 0
     average_opponent_rating = 0
@@ -50,13 +134,13 @@ def compute_player_statistics(games : set[Game],
     eggs_collected_count = 0
     
     for game in games:
-        player_is_team_1 = player in [game.team_1_defense, game.team_1_attack]
+        player_is_team_1 = player.id in [game.team_1_defense_id, game.team_1_attack_id]
         
-        opponent_defense_rating = \
-            (game.team_2_defense if player_is_team_1 else game.team_1_defense).get_rating(game.date_played)
+        opponent_defense_rating = rating_at(
+            rating_histories[game.team_2_defense_id if player_is_team_1 else game.team_1_defense_id], game.date_played)
             
-        opponent_attack_rating = \
-            (game.team_2_attack if player_is_team_1 else game.team_1_attack).get_rating(game.date_played)
+        opponent_attack_rating = rating_at(
+            rating_histories[game.team_2_attack_id if player_is_team_1 else game.team_1_attack_id], game.date_played)
             
         opponent_rating = .5 * (opponent_defense_rating + opponent_attack_rating)
         average_opponent_rating += opponent_rating
@@ -74,12 +158,15 @@ def compute_player_statistics(games : set[Game],
     
     return highest_opponent_rating, average_opponent_rating, games_won, games_lost, eggs_dealt_count, eggs_collected_count
 
-def get_player_statistics(player: Player) -> dict[str, int]:
+def summarize_player_games(player : Player,
+                           games_as_team_1_defense : set[Game],
+                           games_as_team_1_attack : set[Game],
+                           games_as_team_2_defense : set[Game],
+                           games_as_team_2_attack : set[Game],
+                           rating_histories : dict[int, list[tuple[datetime.date, int]]]) -> dict[str, int]:
     # Use sets to avoid one-player-teams (i.e., attack=defense) to
     # be counted twice. Get ready for some good old discrete measure theory
     # a.k.a. 'the pleasures of counting'.
-    games_as_team_1_defense = set(Game.objects.filter(team_1_defense=player))
-    games_as_team_1_attack = set(Game.objects.filter(team_1_attack=player))
     games_as_team_1 = games_as_team_1_defense.union(games_as_team_1_attack)
 
     defense_games_count = len(games_as_team_1_defense)
@@ -88,8 +175,6 @@ def get_player_statistics(player: Player) -> dict[str, int]:
     defense_games_count -= single_games_count
     attack_games_count -= single_games_count
     
-    games_as_team_2_defense = set(Game.objects.filter(team_2_defense=player))
-    games_as_team_2_attack = set(Game.objects.filter(team_2_attack=player))
     games_as_team_2 = games_as_team_2_defense.union(games_as_team_2_attack)
     
     defense_games_count += len(games_as_team_2_defense)
@@ -101,7 +186,8 @@ def get_player_statistics(player: Player) -> dict[str, int]:
     
     highest_opponent_rating, average_opponent_rating, games_won, games_lost, eggs_dealt_count, eggs_collected_count \
     = compute_player_statistics(games_as_team_1.union(games_as_team_2),
-                                player)
+                                player,
+                                rating_histories)
         
     out = {}
     out['game_count'] = defense_games_count + attack_games_count + single_games_count
@@ -116,52 +202,173 @@ def get_player_statistics(player: Player) -> dict[str, int]:
     out['eggs_collected_count'] = eggs_collected_count
     
     return out
-    
 
-def get_all_rating_diffs(save_games: bool = False, penalize_inactivity: bool = False):
-    all_players = sorted(Player.objects.all(), key=lambda a: -a.get_rating())
-    diff_dict = dict(
-        zip(list(Player.objects.all()), 
-            [(None if penalize_inactivity else 0) for x in range(Player.objects.count())]
-        )
-    )
+def season_games(games : QuerySet[Game], since : datetime.date = None) -> QuerySet[Game]:
+    return games.filter(date_played__gte=since) if since is not None else games
+
+def get_player_statistics(player: Player, since : datetime.date = None) -> dict[str, int]:
+    """ The statistics of player's games, of the season starting on since if given.
+    """
+    games_by_position = [set(season_games(Game.objects.filter(**{position: player}), since)) for position in PLAYER_POSITIONS]
+    rating_histories = get_rating_histories(get_opponent_ids(set().union(*games_by_position), player), since)
+    return summarize_player_games(player, *games_by_position, rating_histories)
     
-    unrecorded_games = Game.objects.filter(updates_performed=False)
+
+def compute_all_rating_diffs(players : list[Player], 
+                             unrecorded_games : list[Game], 
+                             penalize_inactivity: bool = False) -> dict[Player, int]:
+    """ Computes the pending rating diff of every player from the games not yet used for rating updates,
+        with the league's elo engine. players must be all players, annotated by with_current_rating.
+    """
+    player_index = {player.id: idx for idx, player in enumerate(players)}
+    game_rows = []
     for game in unrecorded_games:
-        team_1_diff, team_2_diff = game.compute_rating_diffs()
-        
-        for idx, player in enumerate([game.team_1_defense, 
-                                      game.team_1_attack, 
-                                      game.team_2_defense, 
-                                      game.team_2_attack]):
-            curr_diff = round(team_1_diff*.5) if idx < 2 else round(team_2_diff*.5)
-            if diff_dict[player]:
-                diff_dict[player] += curr_diff
-            else:
-                diff_dict[player] = curr_diff
-            
-        if save_games:
-            game.updates_performed = True
-            game.save()
+        if game.winner() == 0:
+            raise ValueError("Winner of game {} could not be determined.".format(game.id))
+        game_rows.append((0, player_index[game.team_1_defense_id], player_index[game.team_1_attack_id],
+                          player_index[game.team_2_defense_id], player_index[game.team_2_attack_id], game.winner() == 1))
+    games = np.array(game_rows, dtype=GAME_DTYPE)
+    
+    engine = EloEngine(SCALING_FACTOR, ADAPTION_STEP)
+    diffs = engine.rating_diffs(engine.initial_state([player.current_rating for player in players]), games)
+    diff_dict = dict(zip(players, diffs.tolist()))
+    active_players = {players[idx] for position in POSITIONS for idx in games[position].tolist()}
     
     if not penalize_inactivity:
         return diff_dict
     
-    for idx, player in enumerate(all_players):
-        # If player has been inactive since last update, i.e., diff_dict[player] == None,
-        # player loses 1 point for each active player ranking below them (but no more than 25 though),
-        # and each such player gains 1 point, to keep the total number of points in the league unchanged.
-        if not diff_dict[player]:
-            penalty_diff = 0
-            for other_idx in range(idx+1, len(all_players)):
-                if penalty_diff <= -25:
-                    break
-                if diff_dict[all_players[other_idx]]:
-                    diff_dict[all_players[other_idx]] += 1
-                    penalty_diff -= 1
-            diff_dict[player] = penalty_diff
+    # A player is inactive if they haven't played since the last update, even if
+    # their games happen to add up to a diff of 0.
+    all_players = sort_by_rating(players)
+    transfers = get_inactivity_policy().compute_transfers([player.current_rating for player in all_players],
+                                                          [player in active_players for player in all_players])
+    for player, transfer in zip(all_players, transfers):
+        diff_dict[player] += transfer
             
     return diff_dict
+
+def get_all_rating_diffs(save_games: bool = False, penalize_inactivity: bool = False, league_id : int = None):
+    """ The pending rating diffs of the players of the league, the default league if not given.
+    """
+    league_id = league_id or default_league_id()
+    players = list(with_current_rating(Player.objects.filter(league_id=league_id)))
+    unrecorded_games = list(Game.objects.filter(league_id=league_id, updates_performed=False))
+    diff_dict = compute_all_rating_diffs(players, unrecorded_games, penalize_inactivity)
+    
+    if save_games:
+        game_ids = [game.id for game in unrecorded_games]
+        Game.objects.filter(pk__in=game_ids).update(updates_performed=True)
+        # update() bypasses the signals, so the games being used is recorded here.
+        record_event(league_id, LeagueEvent.RATINGS_APPLIED, data={'games': game_ids})
+        ratings = {player.id: player.current_rating for player in players}
+        record_rated_games(league_id, [(game, ratings) for game in unrecorded_games])
+            
+    return diff_dict
+
+def apply_rating_updates(timestamp : datetime.date, league_id : int = None):
+    """ Uses all unrecorded games of the league (the default league if not given) to give every player of
+        the league a new rating timestamped with timestamp.
+        Unless ELO_COMPACT_RATINGS is off, ratings that don't change aren't stored.
+    """
+    league_id = league_id or default_league_id()
+    compact = getattr(settings, 'ELO_COMPACT_RATINGS', True)
+    with transaction.atomic():
+        # Concurrent updates of the same league wait for each other, while other leagues' go ahead.
+        League.objects.select_for_update().get(pk=league_id)
+        diff_dict = get_all_rating_diffs(save_games=True, penalize_inactivity=True, league_id=league_id)
+        RatingUpdate.objects.get_or_create(league_id=league_id, timestamp=timestamp)
+        
+        new_ratings = []
+        for player, total_diff in diff_dict.items():
+            new_elo_rating = max(player.current_rating + total_diff, 100)
+            new_ratings.append(new_elo_rating)
+            if compact and new_elo_rating == player.current_rating:
+                continue
+            PlayerRating.objects.create(player=player, timestamp=timestamp, rating=new_elo_rating)
+        record_ratings(league_id, timestamp, new_ratings)
+
+def ratings_when_played(game : Game, rating_histories : dict[int, list[tuple[datetime.date, int]]]) -> dict[int, int]:
+    return {getattr(game, position + '_id'): rating_at(rating_histories[getattr(game, position + '_id')], game.date_played)
+            for position in PLAYER_POSITIONS}
+
+def compute_game_rating_diffs(games : list[Game], rating_histories : dict[int, list[tuple[datetime.date, int]]]) -> dict[int, int]:
+    """ Computes what games, which must have been used for rating updates, added to the rating of each of
+        their players. A game was rated from the ratings in effect on the day it was played, which are the
+        ratings the first rating update after it used, unless it was submitted after that update.
+    """
+    engine = EloEngine(SCALING_FACTOR, ADAPTION_STEP)
+    diffs = defaultdict(int)
+    for date_played, day_games in itertools.groupby(sorted(games, key=lambda game: game.date_played),
+                                                    key=lambda game: game.date_played):
+        day_games = list(day_games)
+        day_player_ids = sorted({getattr(game, position + '_id') for game in day_games for position in PLAYER_POSITIONS})
+        player_index = {player_id: idx for idx, player_id in enumerate(day_player_ids)}
+        game_rows = np.array([(0, *[player_index[getattr(game, position + '_id')] for position in PLAYER_POSITIONS],
+                               game.winner() == 1) for game in day_games], dtype=GAME_DTYPE)
+        ratings = [rating_at(rating_histories[player_id], date_played) for player_id in day_player_ids]
+        for player_id, diff in zip(day_player_ids, engine.rating_diffs(engine.initial_state(ratings), game_rows).tolist()):
+            diffs[player_id] += diff
+    return diffs
+
+def revert_games(games : QuerySet[Game], timestamp : datetime.date, pending : bool) -> int:
+    """ Takes back what the rated ones among games added to their players' ratings, with new ratings
+        timestamped with timestamp, in a single transaction. Then marks all games as pending, so the next
+        rating update uses them again, or else as used, so none ever does.
+        Returns the number of players whose rating changed.
+    """
+    with transaction.atomic():
+        # Like apply_rating_updates(), which this would otherwise race with.
+        leagues = list(League.objects.select_for_update()
+                                     .filter(pk__in=games.values('league_id').distinct())
+                                     .order_by('pk'))
+        games = list(games)
+        for league in leagues:
+            if league.season_start is not None and any(game.league_id == league.id and game.date_played < league.season_start
+                                                       for game in games):
+                raise ClosedSeasonError
+        rated_games = [game for game in games if game.updates_performed]
+        rating_histories = get_rating_histories({getattr(game, position + '_id') for game in rated_games for position in PLAYER_POSITIONS})
+        diffs = compute_game_rating_diffs(rated_games, rating_histories)
+        # Nor do they count as rated on the analytics dashboard anymore.
+        for league in leagues:
+            record_rated_games(league.id, [(game, ratings_when_played(game, rating_histories))
+                                           for game in rated_games if game.league_id == league.id], -1)
+        players = with_current_rating(Player.objects.filter(pk__in=[player_id for player_id, diff in diffs.items() if diff != 0]))
+        for player in players:
+            PlayerRating.objects.create(player=player, timestamp=timestamp, rating=max(player.current_rating - diffs[player.id], 100))
+        
+        changed_games = [game for game in games if game.updates_performed == pending]
+        Game.objects.filter(pk__in=[game.id for game in changed_games]).update(updates_performed=not pending)
+        # update() bypasses the signals, so the games changing is recorded here.
+        for game in changed_games:
+            game.updates_performed = not pending
+            record_event(game.league_id, LeagueEvent.GAME_EDITED, game.id, game_data(game))
+    for league in leagues:
+        bump_league_version(league.id)
+    return len(players)
+
+def get_rating_history(player : Player, since : datetime.date = None) -> list[PlayerRating]:
+    """ Returns player's rating after joining and after every rating update since, in 2 queries.
+        If since is given, the history starts with the rating player started the season starting on since with.
+    """
+    ratings = list(season_ratings([player.id], since).order_by('timestamp', 'id'))
+    if len(ratings) == 0:
+        return []
+    carry_over_rating(ratings, since)
+    update_dates = RatingUpdate.objects.filter(league_id=player.league_id, timestamp__gt=ratings[0].timestamp) \
+                                       .values_list('timestamp', flat=True)
+    return expand_rating_history(ratings, list(update_dates))
+
+def carry_over_rating(ratings : list[PlayerRating], since : datetime.date = None):
+    """ Shows the rating a player's season history starts with as of the last day of the previous season.
+    """
+    if since is not None and ratings[0].timestamp < since:
+        ratings[0].timestamp = since - datetime.timedelta(days=1)
+
+def player_seasons_queryset(player : Player) -> QuerySet[SeasonStanding]:
+    """ Player's standings in the closed seasons of their league, most recent first.
+    """
+    return SeasonStanding.objects.filter(player=player).select_related('season').order_by('-season__end')
            
     
 class InvalidScoreError(Exception):
@@ -181,64 +388,295 @@ class InvalidTeamsError(Exception):
 class InvalidDateEror(Exception):
     def __str__(self):
         return "Game cannot be in the future."
+    
+class ClosedSeasonError(Exception):
+    def __str__(self):
+        return "Game cannot be in a closed season."
+    
+class DuplicateGameError(Exception):
+    def __init__(self, game : Game):
+        self.game = game
+        
+    def __str__(self):
+        return "This game looks like one already submitted by {}.".format(self.game.submitted_by.username)
 
 
 ###########
 ## VIEWS ##
 ###########
-class IndexView(generic.ListView):
+def get_request_league_id(request : HttpRequest) -> int:
+    """ The id of the league a page shows: the league whose slug is given by the league parameter, else
+        the league of the signed in user's player, else the default league. 
+        Raises Http404 if there is no league with the slug.
+    """
+    if request.GET.get('league'):
+        try:
+            return get_league_id(request.GET['league'])
+        except League.DoesNotExist:
+            raise Http404("No league found matching the query")
+    if request.user.is_authenticated:
+        league_id = Player.objects.filter(user=request.user).values_list('league_id', flat=True).first()
+        if league_id is not None:
+            return league_id
+    return default_league_id()
+
+def render_submit_game_form(request : HttpRequest, error_message : str, duplicate_of : Game = None) -> HttpResponse:
+    return render(request, 'elo/submit_game_form.html', {
+        'league_query': league_query(request),
+        'league_slug': request.GET.get('league'),
+        'error_message': error_message,
+        # Lets the game be submitted anyway, e.g. if the same teams really played twice with the same score.
+        'duplicate_of': duplicate_of,
+        'submitted': request.POST if duplicate_of else None,
+    })
+
+def league_query(request : HttpRequest) -> str:
+    """ The query string that keeps links to other pages on the league given by the league parameter, if any.
+    """
+    return '?' + urlencode({'league': request.GET['league']}) if request.GET.get('league') else ''
+
+def pending_games_queryset(before : tuple[datetime.date, int] = None, league_id : int = None) -> QuerySet[Game]:
+    """ Returns the pending games of the league to show on one page, plus one to tell whether there is a
+        next page. Pages are keyed on (league, date_played, id), most recent first, so a page is a single
+        index range scan no matter how far back it is. before is the key of the last game of the previous page.
+    """
+    games = Game.objects.filter(league_id=league_id or default_league_id(), updates_performed=False)
+    if before != None:
+        before_date, before_id = before
+        # Written with date_played <= before_date on its own, so the database can seek to it in the index.
+        games = games.filter(Q(date_played__lte=before_date), 
+                             Q(date_played__lt=before_date) | Q(id__lt=before_id))
+    return games.select_related(*PENDING_GAME_RELATIONS) \
+                .order_by('-date_played', '-id')[:PENDING_GAMES_PAGE_SIZE + 1]
+
+def paginate_pending_games(games : list[Game], league_slug : str = None) -> dict[str, Any]:
+    """ Splits the result of pending_games_queryset() into the games of the page and the url of the next page,
+        which keeps to the league with league_slug, if given.
+    """
+    if len(games) <= PENDING_GAMES_PAGE_SIZE:
+        return {'games': games, 'next_page_url': None}
+    last_game = games[PENDING_GAMES_PAGE_SIZE - 1]
+    params = {'before_date': last_game.date_played.isoformat(), 'before_id': last_game.id}
+    if league_slug:
+        params['league'] = league_slug
+    query = urlencode(params)
+    return {'games': games[:PENDING_GAMES_PAGE_SIZE], 
+            'next_page_url': reverse('elo_app:pending_games') + '?' + query}
+
+def search_players(prefix : str, league_id : int, first_ids : list[int] = None, limit : int = PLAYER_SEARCH_LIMIT) -> list[Player]:
+    """ Returns up to limit players of the league whose names start with prefix, ignoring case.
+        The players with first_ids, if given, come first, in that order, and the others by name.
+    """
+    first_ids = first_ids or []
+    prefix = prefix.upper()
+    players = Player.objects.filter(league_id=league_id).annotate(upper_name=Upper('player_name'))
+    if prefix:
+        # The lower bound lets the search scan the index on the league and upper-cased name from the prefix on.
+        players = players.filter(upper_name__gte=prefix, upper_name__startswith=prefix)
+    first_players = {player.id: player for player in players.filter(pk__in=first_ids)} if first_ids else {}
+    first = [first_players[player_id] for player_id in first_ids if player_id in first_players][:limit]
+    return first + list(players.exclude(pk__in=first_players).order_by('upper_name')[:limit - len(first)])
+
+def get_recent_partner_ids(player : Player) -> list[int]:
+    """ The ids of the players player has played with or against in their latest games, most recent first.
+        Cached per user and league version.
+    """
+    key = RECENT_PARTNERS_CACHE_KEY.format(player.user_id, get_league_version(player.league_id))
+    partner_ids = cache.get(key)
+    if partner_ids is None:
+        games = Game.objects.filter(Q(team_1_defense=player) | Q(team_1_attack=player) | 
+                                    Q(team_2_defense=player) | Q(team_2_attack=player)) \
+                            .order_by('-date_played', '-id') \
+                            .values_list(*[position + '_id' for position in PLAYER_POSITIONS])[:RECENT_PARTNERS_GAME_COUNT]
+        partner_ids = list(dict.fromkeys(player_id for game in games for player_id in game if player_id != player.id))
+        cache.set(key, partner_ids, None)
+    return partner_ids
+
+def get_date_param(params, name : str, default : datetime.date = None) -> datetime.date:
+    """ Returns the date given in ISO format by the query parameter name, or default if it is missing.
+        Raises ValueError if the date is invalid.
+    """
+    if not params.get(name):
+        return default
+    return datetime.date.fromisoformat(params[name])
+
+def get_top_5_probability(player : Player) -> float:
+    """ The player's probability of finishing the season in the top 5, if the season simulation
+        is cached for the current state of the league, or else None.
+    """
+    simulation = get_top_n_probabilities(timezone.now().date(), compute=False, league_id=player.league_id)
+    if simulation == None:
+        return None
+    return next((row['probability'] for row in simulation['players'] if row['id'] == player.id), None)
+
+def get_player_list(league_id : int = None) -> list[tuple[Player, int]]:
+    """ Returns (player, pending rating diff) pairs of all players of the league, highest rated first.
+        Players come with their stored rating interval, if any.
+    """
+    league_id = league_id or default_league_id()
+    players = list(with_current_rating(Player.objects.filter(league_id=league_id).select_related('rating_interval')))
+    rating_diffs = compute_all_rating_diffs(players, Game.objects.filter(league_id=league_id, updates_performed=False))
+    return [(p, rating_diffs[p]) for p in sort_by_rating(players)]
+
+# The player lists below are only computed if the template fragments showing 
+# them aren't already cached for the current league version.
+
+class IndexView(generic.TemplateView):
     template_name = 'elo/index.html'
-    context_object_name = 'top_5_list'
+    replica_reads = True
     
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
         context = super().get_context_data(**kwargs)
-        context['recent_games'] = Game.objects.filter(updates_performed=False).order_by('-date_played')
+        league_id = get_request_league_id(self.request)
+        context['league_id'] = league_id
+        context['league_query'] = league_query(self.request)
+        context['league_version'] = get_league_version(league_id)
+        context['top_5_list'] = SimpleLazyObject(lambda: get_player_list(league_id)[:5])
+        recent_games_page = SimpleLazyObject(lambda: paginate_pending_games(list(pending_games_queryset(league_id=league_id)),
+                                                                            self.request.GET.get('league')))
+        context['recent_games'] = SimpleLazyObject(lambda: recent_games_page['games'])
+        context['recent_games_next_page_url'] = SimpleLazyObject(lambda: recent_games_page['next_page_url'])
         return context
     
-    def get_queryset(self) -> QuerySet[Player]:
-        players = sorted(Player.objects.all(), key=lambda a: -a.get_rating())[:5]
-        rating_diffs = get_all_rating_diffs()
-        return list(zip(players, [rating_diffs[p] for p in players]))
-    
     
-class AllView(generic.ListView):
+class AllView(generic.TemplateView):
     template_name = 'elo/player_list.html'
-    context_object_name = 'player_list'
+    replica_reads = True
+    
+    def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        league_id = get_request_league_id(self.request)
+        context['league_id'] = league_id
+        context['league_query'] = league_query(self.request)
+        context['league_version'] = get_league_version(league_id)
+        context['player_list'] = SimpleLazyObject(lambda: get_player_list(league_id))
+        return context
     
     
+class LiveView(generic.TemplateView):
+    template_name = 'elo/live.html'
+    
+    def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context['league_query'] = league_query(self.request)
+        return context
     
-    def get_queryset(self) -> QuerySet[Player]:
-        players = sorted(Player.objects.all(), key=lambda a: -a.get_rating())
-        rating_diffs = get_all_rating_diffs()
-        return list(zip(players, [rating_diffs[p] for p in players]))
     
-class SubmitGameView(generic.ListView):
+class SubmitGameView(generic.TemplateView):
+    # Players are searched for as they are typed in (see api.views.player_search), rather than listed.
     template_name = 'elo/submit_game_form.html'
-    context_object_name = 'all_players_list'
     
-    def get_queryset(self):
-        return Player.objects.all()
+    def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
+        context = super().get_context_data(**kwargs)
+        context['league_query'] = league_query(self.request)
+        context['league_slug'] = self.request.GET.get('league')
+        return context
     
     
 class PlayerDetailView(generic.DetailView):
-    model = Player
+    # Only the current season's games and ratings are read, as earlier seasons are archived.
+    queryset = Player.objects.select_related('league')
+    replica_reads = True
     
     def get_context_data(self, **kwargs: Any) -> dict[str, Any]:
         ctx = super().get_context_data(**kwargs)
-        ctx['high_score'] = self.object.playerrating_set.aggregate(Max('rating'))['rating__max']
-        player_stats = get_player_statistics(self.object)
-        for key in player_stats:
-            ctx[key] = round(player_stats[key], 2)
+        season_start = self.object.league.season_start
+        ctx['season_start'] = season_start
+        ctx['league_version'] = get_league_version(self.object.league_id)
+        ctx['top_5_probability'] = get_top_5_probability(self.object)
+        # Only computed if the chart and the statistics aren't already cached for the current league version.
+        rating_history = SimpleLazyObject(lambda: get_rating_history(self.object, season_start))
+        ctx['rating_history'] = rating_history
+        ctx['high_score'] = SimpleLazyObject(lambda: max([r.rating for r in rating_history], default=None))
+        ctx['player_stats'] = SimpleLazyObject(lambda: {key: round(value, 2) for key, value 
+                                                        in get_player_statistics(self.object, season_start).items()})
+        ctx['player_seasons'] = SimpleLazyObject(lambda: list(player_seasons_queryset(self.object)))
         return ctx
 
 
+@replica_reads
+def pending_games(request: HttpRequest):
+    """ Renders the rows of the next page of pending games, for the "Load more" button of the index page.
+        The url of the page after that is passed in the X-Next-Page header.
+    """
+    try:
+        before = (datetime.date.fromisoformat(request.GET['before_date']), int(request.GET['before_id']))
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Please provide before_date and before_id.")
+    
+    page = paginate_pending_games(list(pending_games_queryset(before, get_request_league_id(request))), 
+                                  request.GET.get('league'))
+    response = render(request, 'elo/pending_games_rows.html', {'recent_games': page['games']})
+    if page['next_page_url']:
+        response['X-Next-Page'] = page['next_page_url']
+    return response
+
+@replica_reads
+def leaderboard(request: HttpRequest):
+    """ Renders the leaderboard as of the date given by the date parameter (today by default),
+        and how players moved since the date given by the optional compare_to parameter.
+    """
+    try:
+        date = get_date_param(request.GET, 'date', timezone.now().date())
+        compare_to = get_date_param(request.GET, 'compare_to')
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be given as YYYY-MM-DD.")
+    
+    league_id = get_request_league_id(request)
+    return render(request, 'elo/leaderboard.html', {
+        'date': date,
+        'compare_to': compare_to,
+        'league_slug': request.GET.get('league'),
+        'league_query': league_query(request),
+        'leaderboard': leaderboard_as_of(date, league_id),
+        'movers': movers_between(compare_to, date, league_id) if compare_to != None else [],
+    })
+
+@replica_reads
+def records(request: HttpRequest):
+    """ Renders the records of the league, which are kept up to date as games are submitted (see records.py).
+    """
+    return render(request, 'elo/records.html', {
+        'league_query': league_query(request),
+        'records': get_records(get_request_league_id(request)),
+    })
+
+def analytics(request: HttpRequest):
+    """ Renders the analytics dashboard of the league, which charts what api.views.analytics returns.
+    """
+    return render(request, 'elo/analytics.html', {
+        'league_query': league_query(request),
+    })
+
+@replica_reads
+def seasons(request: HttpRequest):
+    """ Renders the list of the closed seasons of the league.
+    """
+    league_id = get_request_league_id(request)
+    return render(request, 'elo/season_list.html', {
+        'league_query': league_query(request),
+        'season_start': League.objects.values_list('season_start', flat=True).get(pk=league_id),
+        'seasons': Season.objects.filter(league_id=league_id),
+    })
+
+@replica_reads
+@cache_control(public=True, max_age=SEASON_ARCHIVE_MAX_AGE, immutable=True)
+def season_detail(request: HttpRequest, pk : int):
+    """ Renders the final standings of a closed season, which never change.
+    """
+    try:
+        season = get_season_archive(pk)
+    except Season.DoesNotExist:
+        raise Http404("No season found matching the query")
+    return render(request, 'elo/season_detail.html', {
+        'season': season,
+        'league_query': '?' + urlencode({'league': season['league']}),
+    })
+
 @user_passes_test(lambda u:u.is_authenticated, login_url=reverse_lazy('registration:login'))
 def submit_game(request: HttpRequest):
     if not request.method == 'POST':
-        return render(request, 'elo/submit_game_form.html', {
-            'all_players_list': Player.objects.order_by('player_name'),
-            'error_message': 'Something went wrong. Please try again'
-        })
+        return render_submit_game_form(request, 'Something went wrong. Please try again')
     data = request.POST
     try:
         team_1_defense = Player.objects.get(pk=data['winning_team_defense'])
@@ -257,49 +695,44 @@ def submit_game(request: HttpRequest):
         if not are_valid_teams(team_1_defense, team_1_attack, team_2_defense, team_2_attack, invalid_team_member):
             raise InvalidTeamsError(invalid_team_member[0])
         
+        if len({team_1_defense.league_id, team_1_attack.league_id, team_2_defense.league_id, team_2_attack.league_id}) > 1:
+            raise MixedLeaguesError
+        
         if datetime.datetime.strptime(date, "%Y-%m-%d").date() > timezone.now().date():
             raise InvalidDateEror
-    except KeyError:
-        return render(request, 'elo/submit_game_form.html', {
-            'all_players_list': Player.objects.order_by('player_name'),
-            'error_message': 'Please fill out all fields'
-        })
-    except InvalidScoreError as error:
-        return render(request, 'elo/submit_game_form.html', {
-            'all_players_list': Player.objects.order_by('player_name'),
-            'error_message': str(error)
-        })
-    except InvalidTeamsError as error:
-        return render(request, 'elo/submit_game_form.html', {
-            'all_players_list': Player.objects.order_by('player_name'),
-            'error_message': str(error)
-        })
-    except InvalidDateEror as error:
-        return render(request, 'elo/submit_game_form.html', {
-            'all_players_list': Player.objects.order_by('player_name'),
-            'error_message': str(error)
-        })
+        
+        season_start = League.objects.values_list('season_start', flat=True).get(pk=team_1_defense.league_id)
+        if season_start is not None and datetime.datetime.strptime(date, "%Y-%m-%d").date() < season_start:
+            raise ClosedSeasonError
+        
+        game = Game(team_1_defense=team_1_defense,
+                    team_1_attack=team_1_attack,
+                    team_2_defense=team_2_defense,
+                    team_2_attack=team_2_attack,
+                    team_1_score=team_1_score,
+                    team_2_score=team_2_score,
+                    date_played=date,
+                    league_id=team_1_defense.league_id,
+                    submitted_by=user)
+        duplicate = Game.objects.filter(signature=game_signature(game)).select_related('submitted_by').first()
+        if duplicate is not None and not data.get('allow_duplicate'):
+            raise DuplicateGameError(duplicate)
+    except (KeyError, ValueError, Player.DoesNotExist):
+        return render_submit_game_form(request, 'Please fill out all fields')
+    except (InvalidScoreError, InvalidTeamsError, InvalidDateEror, MixedLeaguesError, ClosedSeasonError) as error:
+        return render_submit_game_form(request, str(error))
+    except DuplicateGameError as error:
+        return render_submit_game_form(request, str(error), error.game)
             
-    game = Game.objects.create(team_1_defense=team_1_defense,
-                               team_1_attack=team_1_attack,
-                               team_2_defense=team_2_defense,
-                               team_2_attack=team_2_attack,
-                               team_1_score=team_1_score,
-                               team_2_score=team_2_score,
-                               date_played=date,
-                               submitted_by=user)
+    game.save()
     
-    return HttpResponseRedirect(reverse('elo_app:index'))
+    return HttpResponseRedirect(reverse('elo_app:index') + league_query(request))
 
 @user_passes_test(lambda u:u.is_staff, login_url=reverse_lazy('registration:login'))
 def update_ratings(request: HttpRequest):
     if not request.method == 'POST':
-        return HttpResponseRedirect(reverse('elo_app:index'))
+        return HttpResponseRedirect(reverse('elo_app:index') + league_query(request))
     
-    diff_dict = get_all_rating_diffs(save_games=True, penalize_inactivity=True)
-        
-    for player, total_diff in diff_dict.items():
-        new_elo_rating = max(player.get_rating() + total_diff, 100)
-        PlayerRating.objects.create(player=player, timestamp=timezone.now().date(), rating=new_elo_rating)
+    apply_rating_updates(timezone.now().date(), get_request_league_id(request))
         
-    return HttpResponseRedirect(reverse('elo_app:index'))
+    return HttpResponseRedirect(reverse('elo_app:index') + league_query(request))
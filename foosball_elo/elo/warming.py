@@ -0,0 +1,100 @@
+"""
+Warming of the caches of every league's pages.
+
+After a deploy or a cache flush, the first visitors of the leaderboard and of
+every player page would otherwise pay for computing what those pages cache
+(see caching.py). Warming renders the pages instead, so the fragments it
+caches are exactly the ones the views look up. Player pages are the bulk of
+the work, and are spread over worker processes. Their work is only seen by
+the server if the cache is shared between processes, as the configured file
+or redis caches are, rather than a local memory cache.
+"""
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.utils import make_template_fragment_key
+from django.db import connections
+from django.http import HttpRequest
+from django.utils import timezone
+
+from .models import League, Player
+from .caching import get_league_version, get_history_version
+from .history import LEADERBOARD_CACHE_KEY, leaderboard_as_of
+from .views import IndexView, AllView, PlayerDetailView
+
+from concurrent.futures import ProcessPoolExecutor
+import time
+
+
+# The fragments of the index and all players pages, see their templates.
+LEAGUE_FRAGMENTS = ['leaderboard', 'pending_games', 'ranking']
+PLAYER_FRAGMENTS = ['player_stats', 'rating_chart']
+
+
+def cache_is_shared() -> bool:
+    return not isinstance(caches['default'], LocMemCache)
+
+def page_request(league_slug : str = None) -> HttpRequest:
+    request = HttpRequest()
+    request.method = 'GET'
+    if league_slug is not None:
+        request.GET['league'] = league_slug
+    return request
+
+def warm_league_pages(league : League):
+    """ Renders the index and all players pages of the league, and caches its leaderboard as of today.
+    """
+    for view in [IndexView, AllView]:
+        view.as_view()(page_request(league.slug)).render()
+    leaderboard_as_of(timezone.now().date(), league.id)
+
+def warm_player_pages(player_ids : list[int]) -> int:
+    for player_id in player_ids:
+        PlayerDetailView.as_view()(page_request(), pk=player_id).render()
+    return len(player_ids)
+
+def cached_league_pages(league : League) -> int:
+    """ Returns how many of the league's cached fragments and leaderboard are cached for its current version.
+    """
+    league_version = get_league_version(league.id)
+    keys = [make_template_fragment_key(fragment, [league.id, league_version]) for fragment in LEAGUE_FRAGMENTS]
+    keys.append(LEADERBOARD_CACHE_KEY.format(league.id, timezone.now().date().isoformat(), get_history_version(league.id)))
+    return len(cache.get_many(keys))
+
+def cached_player_pages(league : League, player_ids : list[int]) -> int:
+    """ Returns how many of the players' pages are fully cached for the league's current version.
+    """
+    league_version = get_league_version(league.id)
+    keys = {player_id: [make_template_fragment_key(fragment, [player_id, league_version]) for fragment in PLAYER_FRAGMENTS]
+            for player_id in player_ids}
+    cached = cache.get_many([key for player_keys in keys.values() for key in player_keys])
+    return sum(all(key in cached for key in player_keys) for player_keys in keys.values())
+
+def warm_caches(leagues : list[League] = None, workers : int = 1) -> list[dict]:
+    """ Warms the caches of the pages of the leagues (all leagues if not given), with the player pages
+        spread over workers processes. Returns the coverage of each league, and the time it took.
+    """
+    leagues = list(League.objects.all()) if leagues is None else leagues
+    player_ids = {league.id: list(Player.objects.filter(league=league).order_by('id').values_list('id', flat=True))
+                  for league in leagues}
+    results = []
+    for league in leagues:
+        start = time.perf_counter()
+        warm_league_pages(league)
+        shards = [shard for shard in [player_ids[league.id][i::workers] for i in range(workers)] if len(shard) > 0]
+        if len(shards) <= 1:
+            for shard in shards:
+                warm_player_pages(shard)
+        else:
+            # Forked workers must open their own connections rather than share the parent's.
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+                list(executor.map(warm_player_pages, shards))
+        results.append({
+            'league': league,
+            'league_pages': cached_league_pages(league),
+            'league_page_count': len(LEAGUE_FRAGMENTS) + 1,
+            'player_pages': cached_player_pages(league, player_ids[league.id]),
+            'player_count': len(player_ids[league.id]),
+            'elapsed': time.perf_counter() - start,
+        })
+    return results
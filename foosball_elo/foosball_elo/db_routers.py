@@ -0,0 +1,45 @@
+"""
+Database routing for the optional read-only replica.
+
+Reads are sent to the replica only while a view that opted in with
+``replica_reads = True`` is being served (see ReplicaRoutingMiddleware).
+Everything else, including every write, goes to the primary ('default').
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+_read_db_alias = ContextVar('read_db_alias', default=DEFAULT_DB_ALIAS)
+
+# Apps whose tables must always be read from the primary, since stale
+# reads of e.g. a freshly created session would log people out.
+PRIMARY_ONLY_APP_LABELS = {'sessions'}
+
+
+def get_replica_alias() -> str:
+    """ Returns the alias of the replica database, or the primary's alias if no replica is configured.
+    """
+    return getattr(settings, 'REPLICA_DATABASE', None) or DEFAULT_DB_ALIAS
+
+
+class PrimaryReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APP_LABELS:
+            return DEFAULT_DB_ALIAS
+        return _read_db_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects from either
+        # database may always be related.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the snapshot copy (see the
+        # refresh_replica command), never from migrations.
+        return db == DEFAULT_DB_ALIAS
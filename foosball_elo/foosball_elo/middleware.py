@@ -0,0 +1,86 @@
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import resolve, Resolver404
+
+from .db_routers import _read_db_alias, get_replica_alias, PRIMARY_ONLY_APP_LABELS
+
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Set once the user has written something. From then on, and until the
+# browser session ends, the user reads from the primary, so they never see
+# the replica lag behind their own submissions.
+PIN_TO_PRIMARY_COOKIE = 'pin_to_primary_db'
+
+
+_wrote_to_primary = ContextVar('wrote_to_primary', default=False)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _record_write(sender, **kwargs):
+    # Only successful writes count, so a submission that fails on e.g. an
+    # IntegrityError doesn't pin the session.
+    if sender._meta.app_label not in PRIMARY_ONLY_APP_LABELS:
+        _wrote_to_primary.set(True)
+
+
+def replica_reads(view_func):
+    """ Marks a function based view as safe to serve from the replica.
+        Class based views set the class attribute ``replica_reads = True`` instead.
+    """
+    view_func.replica_reads = True
+    return view_func
+
+
+class ReplicaRoutingMiddleware:
+    """ Serves safe requests to views marked with ``replica_reads = True`` from the replica,
+        and pins the browser session to the primary after its first successful write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.route_reads(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_db_alias.set(DEFAULT_DB_ALIAS)
+        return self.pin_after_write(request, response)
+
+    async def __acall__(self, request):
+        self.route_reads(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_db_alias.set(DEFAULT_DB_ALIAS)
+        return self.pin_after_write(request, response)
+
+    def route_reads(self, request):
+        _wrote_to_primary.set(False)
+        if request.method not in SAFE_METHODS or PIN_TO_PRIMARY_COOKIE in request.COOKIES:
+            return
+        try:
+            view_func = resolve(request.path_info).func
+        except Resolver404:
+            return
+        view = getattr(view_func, 'view_class', view_func)
+        if getattr(view, 'replica_reads', False):
+            _read_db_alias.set(get_replica_alias())
+
+    def pin_after_write(self, request, response):
+        if _wrote_to_primary.get() and PIN_TO_PRIMARY_COOKIE not in request.COOKIES:
+            # No max_age, so the cookie lasts for the rest of the browser session.
+            response.set_cookie(PIN_TO_PRIMARY_COOKIE, '1', httponly=True, samesite='Lax')
+        return response
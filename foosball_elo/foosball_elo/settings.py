@@ -51,6 +51,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "foosball_elo.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -86,6 +87,47 @@ DATABASES = {
     }
 }
 
+# Optional read-only replica, used for the read-heavy views (leaderboard,
+# player details and the api). Locally it is a second SQLite file, which is
+# refreshed from the primary with `python manage.py refresh_replica`.
+if os.environ.get("FOOSBALL_ELO_USE_REPLICA"):
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db_replica.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    }
+
+REPLICA_DATABASE = "replica" if "replica" in DATABASES else None
+
+DATABASE_ROUTERS = ["foosball_elo.db_routers.PrimaryReplicaRouter"]
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Cached pages are keyed on versions stored in the cache itself (see
+# elo/caching.py), so every server process must share it: a local memory
+# cache would keep serving pages other processes have moved on from. Redis if
+# configured, or else files, which the processes of a single host share.
+if os.environ.get("FOOSBALL_ELO_REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["FOOSBALL_ELO_REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": BASE_DIR / "cache",
+            "OPTIONS": {"MAX_ENTRIES": 100000},
+        }
+    }
+
+# Tests get a fresh local memory cache instead, as their databases reuse ids.
+TEST_RUNNER = "foosball_elo.test_runner.LocalCacheTestRunner"
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -128,3 +170,19 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Inactivity penalty applied on rating updates, see elo/penalties.py
+
+ELO_INACTIVITY_POLICY = {
+    "POLICY": "elo.penalties.LowerActivePlayersPolicy",
+    "OPTIONS": {"cap": 25},
+}
+
+# Whether rating updates leave out the ratings they don't change, see elo/compaction.py
+
+ELO_COMPACT_RATINGS = True
+
+# Id of the league of new players, and of pages that don't ask for a league, see elo/models.py
+
+ELO_DEFAULT_LEAGUE = 1
@@ -25,5 +25,6 @@ urlpatterns = [
     path("admin/", admin.site.urls, name="admin"),
     path("elo/", include('elo.urls'), name="elo"),
     path("", include('registration.urls'), name="registration"),
+    path("api/", include('api.urls'), name="api_views"),
     path("api/", include(game_resource.urls))
 ]
@@ -8,7 +8,7 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
 
-from elo.models import Player, PlayerRating
+from elo.models import League, Player, PlayerRating, get_league_id
 from datetime import timedelta
 
 #############
@@ -35,6 +35,11 @@ def verify_code(verification_code: str) -> bool:
 class SubmitPlayerView(generic.TemplateView):
     template_name = 'registration/submit_player_form.html'
     
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['leagues'] = League.objects.all()
+        return context
+    
     
 def submit_player(request: HttpRequest):
     if not request.method == 'POST':
@@ -57,10 +62,13 @@ def submit_player(request: HttpRequest):
             # quick and dirty way to prevent bots from spamming the db
             raise ValidationError("You didn't provide the correct verification code")
         
+        # The default league, unless the form lets the player choose.
+        league_id = get_league_id(request.POST.get('league'))
+        
         user = User.objects.create_user(username=request.POST['player_name'],
                                         email=request.POST['email'],
                                         password=request.POST['password'])
-        player = Player.objects.create(player_name=request.POST["player_name"], user=user)
+        player = Player.objects.create(player_name=request.POST["player_name"], user=user, league_id=league_id)
         
         # Ratings will be updates on sundays, so first rating has its timestamp set
         # to last sunday from today's date.
@@ -71,19 +79,24 @@ def submit_player(request: HttpRequest):
     except IntegrityError:
         return render(request, 
                       'registration/submit_player_form.html', 
-                      {'error_message': 'Username already in use.'})
+                      {'error_message': 'Username already in use.', 'leagues': League.objects.all()})
     except ValueError:
         return render(request, 
                       'registration/submit_player_form.html', 
-                      {'error_message': 'Please provide a non-empty username using only upper case, lower case, numbers and underscore.'})
+                      {'error_message': 'Please provide a non-empty username using only upper case, lower case, numbers and underscore.',
+                       'leagues': League.objects.all()})
     except KeyError:
         return render(request,
                       'registration/submit_player_form.html',
-                      {'error_message': 'Please fill out all fields.'})
+                      {'error_message': 'Please fill out all fields.', 'leagues': League.objects.all()})
     except ValidationError as e:
         return render(request,
                       'registration/submit_player_form.html',
-                      {'error_message': e.message})
+                      {'error_message': e.message, 'leagues': League.objects.all()})
+    except League.DoesNotExist:
+        return render(request,
+                      'registration/submit_player_form.html',
+                      {'error_message': 'Please choose one of the leagues.', 'leagues': League.objects.all()})
     
     return HttpResponseRedirect(reverse('elo_app:player_detail', args=(player.id,)),
                                 {'ratings': player.playerrating_set.all()})